@@ -1,12 +1,12 @@
 from amas.agent import Agent, NotWorkingError
 from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
-from comprex.audio import Speaker, make_white_noise
 from comprex.config import Experimental
-from comprex.scheduler import TrialIterator, geom_rng, unif_rng
 from comprex.util import timestamp
-from pino.ino import HIGH, LOW, Arduino
-from numpy import int64, cumsum
-from mulmodal.util import fixed_time_with_postpone, present_stimulus
+from pino.ino import Arduino
+from mulmodal.multiple import MultipleSchedule, alternating_components
+from mulmodal.params import ComponentParams, task_params
+from mulmodal.stimulus import Light, Sound, StimulusRegistry
+from mulmodal.util import cached_white_noise, get_speaker
 from numpy.random import choice
 
 
@@ -15,73 +15,42 @@ CONTROLLER = "Controller"
 
 
 async def control(agent: Agent, ino: Arduino, expvars: Experimental):
-    mean_component_length = expvars.get("mean-component-length", 25)
-    range_component = expvars.get("range-component-length", 10)
-    interval_between_component = expvars.get("interval-between-component", 60.)
-    mean_iri = expvars.get("inter-reward-interval", 10.)
-    range_iri = expvars.get("range-IRI", 5.)
-    number_of_rewards = expvars.get("number-of-rewards", 200)
-    number_of_component = number_of_rewards // mean_component_length
-
-    light_pins = expvars.get("light-pin", [4, 5, 7, 8])
-    light_pins = list(map(int, choice(light_pins, len(light_pins), replace=False)))
-    reward_pins = expvars.get("reward-pin", [2, 3])
-    speaker = Speaker(expvars.get("speaker", 6))
-    noise = make_white_noise(30.)
-    response_pins = list(map(str, expvars.get("response-pin", [-9, -10])))
-    reward_duration = expvars.get("reward-duration", 0.01)
-    postpone = expvars.get("postpone", 2.)
-
-    component_lengths = unif_rng(mean_component_length,
-                                 range_component,
-                                 number_of_component).astype(int64) + 1
-    components: list[int] = sum([[0] * n if (i % 2 == 0) else [1] * n \
-                                    for i, n in zip(range(number_of_component),
-                                                    component_lengths)], [])
-    iris = unif_rng(mean_iri, range_iri, number_of_rewards)
-    trial_iterator = TrialIterator(list(range(number_of_rewards)),
-                                   list(zip(iris, components)))
+    params: ComponentParams = task_params("2nd_step_of_training", expvars)
+    speaker = get_speaker(params.speaker)
+    # a different light for each light component, in a shuffled order
+    pins = choice(params.light_pin, len(params.light_pin), replace=False)
+    lights = [Light(ino, int(pin)) for pin in pins]
+    noise = Sound(speaker, cached_white_noise(30.), NOISE_IDX)
+    components = alternating_components(2, params.mean_component_length,
+                                        params.range_component_length,
+                                        params.number_of_rewards)
+    registry = StimulusRegistry(agent)
+    # component 0: light and the first response / 1: noise and the second
+    engine = MultipleSchedule(agent, ino, registry, params.component_schedules,
+                              [lights, [noise]],
+                              list(map(str, params.response_pin)), params.reward_pin,
+                              params.inter_reward_interval, params.range_iri,
+                              params.reward_duration, params.postpone,
+                              params.interval_between_component)
 
     try:
         while agent.working():
             agent.send_to(RECORDER, timestamp(START))
-            previous_component = -1
-            light_pin = light_pins.pop()
-            for trial, (iri, component) in trial_iterator:
-                print(f"Trial {trial}: Reward will occur {iri} secs after.")
-                if previous_component != component:
-                    if component == 0:
-                        agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                        speaker.stop()
-                        agent.send_to(RECORDER, timestamp(light_pin))
-                        ino.digital_write(light_pin, HIGH)
-                    else:
-                        agent.send_to(RECORDER, timestamp(-light_pin))
-                        ino.digital_write(light_pin, LOW)
-                        agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                        speaker.play(noise, False, True)
-                        light_pin = light_pins.pop()
-                if component == 0:
-                    target_response = response_pins[0]
-                    reward_pin = reward_pins[0]
-                else:
-                    target_response = response_pins[1]
-                    reward_pin = reward_pins[1]
-                await fixed_time_with_postpone(agent, iri, target_response, postpone)
-                await present_stimulus(agent, ino, reward_pin, reward_duration)
-                previous_component = component
+            await engine.run(components)
             agent.send_to(OBSERVER, NEND)
             agent.send_to(RECORDER, timestamp(NEND))
             agent.finish()
     except NotWorkingError:
         agent.send_to(OBSERVER, ABEND)
-        agent.send_to(RECORDER, timestamp(NEND))
+        agent.send_to(RECORDER, timestamp(ABEND))
         agent.finish()
+    finally:
+        registry.all_off()
     return None
 
 
 async def read(agent: Agent, ino: Arduino, expvars: Experimental):
-    response_pin = expvars.get("response-pin", [-9, -10])
+    response_pin = task_params("2nd_step_of_training", expvars).response_pin
 
     response_pins_str = list(map(str, response_pin))
 
@@ -0,0 +1,247 @@
+from bisect import bisect_right
+from json import dumps, loads
+from mmap import ACCESS_READ, mmap
+from os import remove, replace
+from os.path import basename, exists, splitext
+from shutil import copyfile
+from struct import Struct
+from typing import Any, Iterable, NamedTuple, Union
+from zlib import compress, decompress
+from numpy import asarray, concatenate, cumsum, diff, dtype, float64, frombuffer, \
+    int64, min_scalar_type, ndarray, result_type, rint, searchsorted
+from mulmodal.curves import trial_numbers
+from mulmodal.recorder import iter_events
+
+
+# Layout: MAGIC, compressed blocks, the index (compressed JSON) and a footer
+# with the offset and size of the index. A block holds whole trials of one
+# session: the time deltas in ticks of `resolution` seconds followed by the
+# event codes as indices into the archive's code table, each packed in the
+# smallest integer type that fits and compressed together. Trials are those
+# of the learning curves (`curves.TrialTracker`), so they end with a reward.
+MAGIC = b"MMA2"
+FOOTER = Struct("<QQ4s")
+
+
+class Block(NamedTuple):
+    offset: int
+    size: int
+    events: int
+    first_trial: int  # trial of the first event; -1 before the first trial
+    last_trial: int
+    t0: int           # first time in ticks
+    time_type: str
+    code_type: str
+
+
+class SessionIndex(NamedTuple):
+    name: str
+    blocks: list[Block]
+    events: int
+    trials: int
+
+
+def _pack(values: ndarray) -> tuple[bytes, str]:
+    if len(values) == 0:
+        return b"", "u1"
+    t = result_type(min_scalar_type(values.min()), min_scalar_type(values.max()))
+    return values.astype(t).tobytes(), t.str
+
+
+class ArchiveWriter(object):
+    # Writes to `path`.tmp, a copy of the archive when appending, which
+    # replaces `path` on close. Until then, and when the writer is left with
+    # an exception, the archive at `path` is untouched.
+    def __init__(self, path: str, resolution: float = 1e-6,
+                 trials_per_block: int = 16, level: int = 6,
+                 reward_pins: Iterable[Any] = (6, 7)):
+        self.path = path
+        self.temp = f"{path}.tmp"
+        self.trials_per_block = trials_per_block
+        self.level = level
+        self.reward_pins = list(map(str, reward_pins))
+        self.resolution = resolution
+        self.codes: list[str] = []
+        self.sessions: list[SessionIndex] = []
+        if exists(path):
+            # appending: new blocks go over the copy's index, which close rewrites
+            index, end = _read_index(path)
+            self.resolution = index["resolution"]
+            self.codes = index["codes"]
+            self.reward_pins = index["reward-pins"]
+            self.sessions = [_session_index(s) for s in index["sessions"]]
+            copyfile(path, self.temp)
+            self.f = open(self.temp, "r+b")
+            self.f.seek(end)
+            self.f.truncate()
+        else:
+            self.f = open(self.temp, "wb")
+            self.f.write(MAGIC)
+        self._code_ids = {c: i for i, c in enumerate(self.codes)}
+
+    def _code(self, code: str) -> int:
+        i = self._code_ids.get(code)
+        if i is None:
+            i = self._code_ids[code] = len(self.codes)
+            self.codes.append(code)
+        return i
+
+    def _block(self, ticks: ndarray, codes: ndarray, first_trial: int,
+               last_trial: int) -> Block:
+        times, time_type = _pack(diff(ticks))
+        packed, code_type = _pack(codes)
+        payload = compress(times + packed, self.level)
+        offset = self.f.tell()
+        self.f.write(payload)
+        return Block(offset, len(payload), len(ticks), first_trial, last_trial,
+                     int(ticks[0]), time_type, code_type)
+
+    def add_session(self, name: str, events: Iterable[tuple[float, Any]]) -> SessionIndex:
+        times, codes = [], []
+        for t, code in events:
+            times.append(t)
+            codes.append(str(code))
+        ticks = rint(asarray(times, dtype=float64) / self.resolution).astype(int64)
+        ids = asarray([self._code(c) for c in codes], dtype=int64)
+        trials = trial_numbers(codes, self.reward_pins)
+        blocks = []
+        start = 0
+        while start < len(ticks):
+            # blocks end where a trial starts, so no trial spans two blocks
+            end = int(searchsorted(trials, trials[start] + self.trials_per_block))
+            blocks.append(self._block(ticks[start:end], ids[start:end],
+                                      int(trials[start]), int(trials[end - 1])))
+            start = end
+        ntrials = int(trials[-1]) + 1 if len(trials) else 0
+        session = SessionIndex(name, blocks, len(ticks), ntrials)
+        self.sessions.append(session)
+        return session
+
+    def close(self) -> None:
+        index = {"resolution": self.resolution, "codes": self.codes,
+                 "reward-pins": self.reward_pins,
+                 "sessions": [[s.name, [list(b) for b in s.blocks], s.events, s.trials]
+                              for s in self.sessions]}
+        payload = compress(dumps(index).encode())
+        offset = self.f.tell()
+        self.f.write(payload)
+        self.f.write(FOOTER.pack(offset, len(payload), MAGIC))
+        self.f.close()
+        replace(self.temp, self.path)
+
+    def discard(self) -> None:
+        self.f.close()
+        remove(self.temp)
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, *args: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def _session_index(raw: list) -> SessionIndex:
+    name, blocks, events, trials = raw
+    return SessionIndex(name, [Block(*b) for b in blocks], events, trials)
+
+
+def _read_index(path: str) -> tuple[dict, int]:
+    with open(path, "rb") as f:
+        f.seek(-FOOTER.size, 2)
+        offset, size, magic = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a session archive")
+        f.seek(offset)
+        return loads(decompress(f.read(size))), offset
+
+
+class Archive(object):
+    # Read access through a memory map; only the blocks that are asked for
+    # are decompressed.
+    def __init__(self, path: str):
+        index, _ = _read_index(path)
+        self.resolution: float = index["resolution"]
+        self.codes: list[str] = index["codes"]
+        self.reward_pins: list[str] = index["reward-pins"]
+        self.sessions = [_session_index(s) for s in index["sessions"]]
+        self._names = {s.name: i for i, s in enumerate(self.sessions)}
+        self._file = open(path, "rb")
+        self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def session(self, session: Union[int, str]) -> SessionIndex:
+        return self.sessions[self._names[session] if isinstance(session, str) else session]
+
+    def block(self, block: Block) -> tuple[ndarray, ndarray]:
+        # (times in seconds, code indices)
+        raw = decompress(self._map[block.offset:block.offset + block.size])
+        time_type = dtype(block.time_type)
+        nbytes = (block.events - 1) * time_type.itemsize
+        deltas = frombuffer(raw, time_type, block.events - 1).astype(int64)
+        ids = frombuffer(raw, dtype(block.code_type), block.events, nbytes).astype(int64)
+        ticks = concatenate([[block.t0], block.t0 + cumsum(deltas)])
+        return ticks * self.resolution, ids
+
+    def events(self, session: Union[int, str]) -> tuple[ndarray, ndarray]:
+        parts = [self.block(b) for b in self.session(session).blocks]
+        if not parts:
+            return asarray([], dtype=float64), asarray([], dtype=int64)
+        return concatenate([p[0] for p in parts]), concatenate([p[1] for p in parts])
+
+    def trial(self, session: Union[int, str], n: int) -> list[tuple[float, str]]:
+        # events of trial `n`, from its marker up to the next trial's; -1 is
+        # everything before the first trial
+        blocks = self.session(session).blocks
+        i = bisect_right([b.first_trial for b in blocks], n) - 1
+        if i < 0 or n > blocks[i].last_trial:
+            return []
+        block = blocks[i]
+        times, ids = self.block(block)
+        # a block starts with a trial, but the first one may start before it
+        codes = [self.codes[c] for c in ids]
+        trials = trial_numbers(codes, self.reward_pins)
+        trials += block.first_trial - trials[0]
+        return [(float(t), self.codes[c]) for t, c in zip(times[trials == n], ids[trials == n])]
+
+
+def convert(paths: Iterable[str], archive: str, **kwargs: Any) -> list[SessionIndex]:
+    # Recorder files (with their rotated parts) into one archive, one
+    # session per file, named after the file.
+    with ArchiveWriter(archive, **kwargs) as writer:
+        return [writer.add_session(splitext(basename(path))[0], iter_events(path))
+                for path in paths]
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from os.path import getsize
+
+    from mulmodal.recorder import session_parts
+
+    parser = ArgumentParser(description="Pack recorder files into a session archive.")
+    parser.add_argument("archive", help="archive to create or append to")
+    parser.add_argument("files", nargs="+", help="recorder files (first part of rotated sessions)")
+    parser.add_argument("--resolution", "-r", type=float, default=1e-6)
+    parser.add_argument("--trials-per-block", "-b", type=int, default=16)
+    parser.add_argument("--reward-pin", type=int, nargs="+", default=[6, 7],
+                        help="reward pins, whose onsets end trials")
+    args = parser.parse_args()
+
+    text = sum(getsize(p) for f in args.files for p in session_parts(f) or [f])
+    sessions = convert(args.files, args.archive, resolution=args.resolution,
+                       trials_per_block=args.trials_per_block,
+                       reward_pins=args.reward_pin)
+    print(f"{len(sessions)} sessions, {sum(s.events for s in sessions)} events: "
+          f"{text} bytes of text in {getsize(args.archive)} bytes of archive")
@@ -0,0 +1,107 @@
+import sys
+from collections import deque
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+from numpy.random import default_rng
+from mulmodal.events import Codes
+from mulmodal.recorder import RotatingWriter
+from mulmodal.util import clock
+
+
+RESPONSES = ["-9", "-10"]
+
+
+class _RowWriter(RotatingWriter):
+    # the recorder as it was: a string per row as it comes in
+    def append(self, row: tuple) -> None:
+        self.buffer.append(f"{', '.join(map(str, row))}\n")
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def format(self) -> str:
+        return "".join(self.buffer)
+
+
+def lines(n: int, seed: int = 0) -> list[bytes]:
+    # a session's mix: responses, stimulus onsets and offsets, rewards
+    codes = [b"-9", b"-10", b"4", b"-4", b"14", b"-14", b"6", b"-6", b"200", b"201"]
+    weights = [.35, .35, .05, .05, .05, .05, .03, .03, .02, .02]
+    picks = default_rng(seed).choice(len(codes), n, p=weights)
+    return [codes[i] + b"\r\n" for i in picks]
+
+
+def decode(line: bytes) -> str:
+    return line.rstrip().decode("utf-8")
+
+
+def pipeline(parse: Callable[[bytes], str], writer: RotatingWriter,
+             controller: deque, input_: list[bytes]) -> None:
+    # reader -> controller and recorder, without the agents' mailboxes
+    for line in input_:
+        code = parse(line)
+        if code in RESPONSES:
+            controller.append(code)
+        writer.append((clock(), code))
+
+
+def retained(writer_class: type, parse: Callable[[bytes], str], input_: list[bytes]) -> float:
+    # blocks each event holds on to until its chunk is written
+    with TemporaryDirectory() as d:
+        writer = writer_class(join(d, "x.csv"), len(input_) + 1)
+        controller: deque = deque()
+        before = sys.getallocatedblocks()
+        pipeline(parse, writer, controller, input_)
+        blocks = sys.getallocatedblocks() - before
+        writer.close()
+    return blocks / len(input_)
+
+
+def throughput(writer_class: type, parse: Callable[[bytes], str], input_: list[bytes],
+               chunk_size: int, repeat: int) -> float:
+    # events per second through parse, dispatch, buffering and writing
+    best = float("inf")
+    with TemporaryDirectory() as d:
+        for i in range(repeat):
+            writer = writer_class(join(d, f"{i}.csv"), chunk_size)
+            controller: deque = deque()
+            s = perf_counter()
+            pipeline(parse, writer, controller, input_)
+            writer.flush()
+            best = min(best, perf_counter() - s)
+            writer.close()
+    return len(input_) / best
+
+
+def written(writer_class: type, parse: Callable[[bytes], str], input_: list[bytes]) -> str:
+    with TemporaryDirectory() as d:
+        writer = writer_class(join(d, "x.csv"))
+        for t, line in enumerate(input_):
+            writer.append((t * 0.001, parse(line)))
+        writer.close()
+        with open(join(d, "x.csv"), "r") as f:
+            return f.read()
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Objects held per event and events per second "
+                                        "from reader to recorder, before and after "
+                                        "interned codes and chunk formatting.")
+    parser.add_argument("--events", "-n", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    input_ = lines(args.events)
+    assert written(_RowWriter, decode, input_[:1000]) == \
+        written(RotatingWriter, Codes(RESPONSES).parse, input_[:1000])
+    for label, writer_class, parse in (
+            ("before", _RowWriter, decode),
+            ("after", RotatingWriter, Codes(RESPONSES).parse)):
+        blocks = retained(writer_class, parse, input_)
+        rate = throughput(writer_class, parse, input_, args.chunk_size, args.repeat)
+        print(f"{label:<8} {blocks:5.2f} blocks held per event  "
+              f"{rate / 1e3:8.1f} k events/s  {1e9 / rate:6.0f} ns/event")
@@ -0,0 +1,64 @@
+from asyncio import gather, run, sleep
+from time import perf_counter
+from typing import Optional
+from mulmodal.loopprof import LoopProfiler
+
+
+class _Agent(object):
+    def __init__(self, until: float):
+        self.until = until
+
+    def working(self) -> bool:
+        return perf_counter() < self.until
+
+
+def _spin(duration: float) -> None:
+    end = perf_counter() + duration
+    while perf_counter() < end:
+        pass
+
+
+async def control(agent: _Agent) -> int:
+    # many short steps, like the window functions polling the mailbox
+    n = 0
+    while agent.working():
+        _spin(0.0002)
+        await sleep(0)
+        n += 1
+    return n
+
+
+async def record(agent: _Agent) -> None:
+    # a blocking write every now and then
+    while agent.working():
+        await sleep(0.2)
+        _spin(0.02)
+
+
+async def session(duration: float, profiler: Optional[LoopProfiler]) -> int:
+    agent = _Agent(perf_counter() + duration)
+    tasks = [control(agent), record(agent)]
+    if profiler is not None:
+        profiler.start()
+        tasks.append(profiler.run_probe(agent))
+    n = (await gather(*tasks))[0]
+    if profiler is not None:
+        profiler.stop()
+    return n
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Overhead and attribution of the event loop profiler.")
+    parser.add_argument("--duration", "-d", type=float, default=5.)
+    parser.add_argument("--output", "-o", default="loop.folded")
+    args = parser.parse_args()
+
+    base = run(session(args.duration, None))
+    profiler = LoopProfiler()
+    profiled = run(session(args.duration, profiler))
+    print(f"Loop steps without profiler: {base}, with: {profiled} "
+          f"({(base - profiled) / base * 100:.2f} % fewer)")
+    profiler.print_report()
+    profiler.write_folded(args.output)
@@ -0,0 +1,46 @@
+from asyncio import run, sleep
+from time import perf_counter, process_time
+from numpy import abs as absolute, array, percentile
+from mulmodal.util import precise_sleep, use_precision
+
+
+class _Agent(object):
+    async def sleep(self, duration: float) -> None:
+        await sleep(duration)
+
+
+async def _phases(duration: float, n: int, precise: bool) -> tuple[list[float], float]:
+    # (how much longer than asked each phase took, CPU seconds per phase)
+    agent = _Agent()
+    errors = []
+    cpu = process_time()
+    for _ in range(n):
+        s = perf_counter()
+        if precise:
+            await precise_sleep(agent, duration)
+        else:
+            await agent.sleep(duration)
+        errors.append(perf_counter() - s - duration)
+    return errors, (process_time() - cpu) / n
+
+
+def summarize(label: str, duration: float, errors: list[float], cpu: float) -> None:
+    x = array(errors) * 1e3
+    p50, p99 = percentile(absolute(x), [50, 99])
+    print(f"{duration * 1e3:5.0f} ms {label:<8} |error| p50 {p50:7.3f} ms  p99 {p99:7.3f}  "
+          f"max {x.max():7.3f}  min {x.min():7.3f}  CPU {cpu / duration * 100:5.1f} %")
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Accuracy and CPU cost of sleep-then-spin against a plain sleep.")
+    parser.add_argument("--phases", "-n", type=int, default=100)
+    parser.add_argument("--margin", "-m", type=float, default=0.002)
+    args = parser.parse_args()
+
+    use_precision(1., args.margin)
+    for duration in (0.005, 0.015, 0.05, 0.25):
+        for label, precise in (("sleep", False), ("precise", True)):
+            errors, cpu = run(_phases(duration, args.phases, precise))
+            summarize(label, duration, errors, cpu)
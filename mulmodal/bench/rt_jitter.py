@@ -0,0 +1,95 @@
+from asyncio import run, sleep
+from multiprocessing import get_context
+from resource import RUSAGE_SELF, getrusage
+from time import perf_counter
+from typing import Any, Optional
+from numpy import array, percentile, random
+from mulmodal.rttune import Tuning, tune
+
+
+def _hog(stop: Any, memory: int) -> None:
+    # background load: spins and keeps touching fresh memory, like a camera
+    # capture or an analysis job sharing the host
+    while not stop.is_set():
+        junk = bytearray(memory)
+        for i in range(0, memory, 4096):
+            junk[i] = 1
+        x = random.standard_normal(20000)
+        x.sort()
+        del junk
+
+
+async def _periodic(n: int, period: float) -> list[float]:
+    # how late each wake-up of a periodic loop is, like a stimulus phase
+    lateness = []
+    deadline = perf_counter()
+    for _ in range(n):
+        deadline += period
+        await sleep(max(deadline - perf_counter(), 0.))
+        lateness.append(perf_counter() - deadline)
+        # allocates a little per cycle, as the controller does
+        _ = [0.] * 256
+    return lateness
+
+
+def _measure(settings: Optional[dict], n: int, period: float, out: Any) -> None:
+    tuning: Optional[Tuning] = tune("bench", **settings) if settings is not None else None
+    before = getrusage(RUSAGE_SELF)
+    lateness = run(_periodic(n, period))
+    after = getrusage(RUSAGE_SELF)
+    out.send((lateness, after.ru_minflt - before.ru_minflt,
+              after.ru_majflt - before.ru_majflt,
+              after.ru_nivcsw - before.ru_nivcsw, tuning))
+
+
+def measure(settings: Optional[dict], n: int, period: float, hogs: int,
+            memory: int) -> tuple[list[float], int, int, int, Optional[Tuning]]:
+    # each run in a fresh process, so that tuning does not leak into the next
+    ctx = get_context("fork")
+    stop = ctx.Event()
+    loads = [ctx.Process(target=_hog, args=(stop, memory), daemon=True) for _ in range(hogs)]
+    for p in loads:
+        p.start()
+    receiver, sender = ctx.Pipe(False)
+    p = ctx.Process(target=_measure, args=(settings, n, period, sender))
+    p.start()
+    result = receiver.recv()
+    p.join()
+    stop.set()
+    for load in loads:
+        load.join()
+    return result
+
+
+def summarize(label: str, result: tuple[list[float], int, int, int, Optional[Tuning]]) -> None:
+    lateness, minflt, majflt, nivcsw, tuning = result
+    x = array(lateness) * 1e3
+    p50, p99, p999 = percentile(x, [50, 99, 99.9])
+    print(f"{label:<16} p50 {p50:7.3f} ms  p99 {p99:7.3f}  p99.9 {p999:7.3f}  "
+          f"max {x.max():7.3f}  faults {minflt}/{majflt}  preempted {nivcsw}")
+    for note in tuning.notes if tuning is not None else []:
+        print(f"    not applied: {note}")
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from os import cpu_count
+
+    parser = ArgumentParser(description="Wake-up jitter of a periodic loop under background "
+                                        "load, with and without real-time tuning.")
+    parser.add_argument("--cycles", "-n", type=int, default=5000)
+    parser.add_argument("--period", "-p", type=float, default=0.002)
+    parser.add_argument("--hogs", type=int, default=cpu_count() or 1)
+    parser.add_argument("--memory", type=int, default=8 * 2 ** 20,
+                        help="bytes each load process allocates per cycle")
+    parser.add_argument("--cpu", type=int, default=None,
+                        help="CPU to pin the tuned run to, default the last one")
+    parser.add_argument("--priority", type=int, default=50)
+    args = parser.parse_args()
+
+    cpu = args.cpu if args.cpu is not None else (cpu_count() or 1) - 1
+    tuned = {"cpus": [cpu], "policy": "fifo", "priority": args.priority, "lock": True}
+    for hogs in (0, args.hogs):
+        for label, settings in (("default", None), ("tuned", tuned)):
+            name = f"{label}{' + load' if hogs else ''}"
+            summarize(name, measure(settings, args.cycles, args.period, hogs, args.memory))
@@ -0,0 +1,136 @@
+from asyncio import create_task, get_running_loop, run, sleep
+from gc import collect
+from os import close, openpty, read, write
+from select import select
+from threading import Thread
+from time import perf_counter
+from typing import Optional
+from numpy import array, percentile, random
+from mulmodal.fdserial import SerialTransport
+from mulmodal.serialproc import SerialProcess
+
+
+# Stand-in for the board: lines written to the master side of a pty are read
+# from the slave side. Each line carries the time it was sent.
+class PtyBoard(object):
+    def __init__(self, fd: int, timeout: float = 1.):
+        self.fd = fd
+        self.timeout = timeout
+        self.buffer = b""
+
+    def read_until_eol(self) -> Optional[bytes]:
+        while b"\n" not in self.buffer:
+            ready, _, _ = select([self.fd], [], [], self.timeout)
+            if not ready:
+                return None
+            self.buffer += read(self.fd, 4096)
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+    def cancel_read(self) -> None:
+        return None
+
+    def fileno(self) -> int:
+        return self.fd
+
+
+def _send(fd: int, n: int, interval: float) -> None:
+    for _ in range(n):
+        write(fd, f"{perf_counter():.6f}\n".encode())
+        deadline = perf_counter() + random.exponential(interval)
+        while perf_counter() < deadline:
+            pass
+
+
+async def _load(until: float) -> None:
+    # blocks the loop for a few milliseconds at a time, like a recorder
+    # flush or a GC pass, and churns allocations in between
+    while perf_counter() < until:
+        junk = [[i] * 8 for i in range(20000)]
+        if random.uniform() < 0.1:
+            collect()
+        del junk
+        await sleep(0.005)
+
+
+async def _in_process(board: PtyBoard, n: int, load: bool, sender: Thread) -> list[float]:
+    sender.start()
+    loop = get_running_loop()
+    latencies = []
+    loader = create_task(_load(perf_counter() + 3600.)) if load else None
+    while len(latencies) < n:
+        line = await loop.run_in_executor(None, board.read_until_eol)
+        t = perf_counter()
+        if line:
+            latencies.append(t - float(line))
+    if loader is not None:
+        loader.cancel()
+    return latencies
+
+
+async def _out_of_process(board: PtyBoard, n: int, load: bool, sender: Thread) -> list[float]:
+    # the events start once the reader is up, as a session's do
+    serial = SerialProcess(board).start()
+    sender.start()
+    latencies = []
+    loader = create_task(_load(perf_counter() + 3600.)) if load else None
+    while len(latencies) < n:
+        for t, line in await serial.get():
+            latencies.append(t - float(line))
+    if loader is not None:
+        loader.cancel()
+    serial.stop()
+    return latencies
+
+
+async def _fd_readiness(board: PtyBoard, n: int, load: bool, sender: Thread) -> list[float]:
+    transport = SerialTransport(board.fileno()).start()
+    sender.start()
+    latencies = []
+    loader = create_task(_load(perf_counter() + 3600.)) if load else None
+    while len(latencies) < n:
+        t, line = await transport.readline()
+        latencies.append(t - float(line))
+    if loader is not None:
+        loader.cancel()
+    # a pending readline returns as soon as the transport is closed
+    pending = create_task(transport.readline())
+    await sleep(0.01)
+    s = perf_counter()
+    transport.close()
+    await pending
+    print(f"fd shutdown took {(perf_counter() - s) * 1e3:.3f} ms")
+    return latencies
+
+
+def measure(mode: str, n: int, interval: float, load: bool) -> list[float]:
+    master, slave = openpty()
+    board = PtyBoard(slave)
+    sender = Thread(target=_send, args=(master, n, interval), daemon=True)
+    reader = {"thread": _in_process, "process": _out_of_process, "fd": _fd_readiness}[mode]
+    latencies = run(reader(board, n, load, sender))
+    sender.join()
+    close(master)
+    close(slave)
+    return latencies
+
+
+def summarize(label: str, latencies: list[float]) -> None:
+    x = array(latencies) * 1e3
+    p50, p99 = percentile(x, [50, 99])
+    print(f"{label:<24} mean {x.mean():7.3f} ms  p50 {p50:7.3f}  p99 {p99:7.3f}  "
+          f"max {x.max():7.3f}  sd {x.std():7.3f}")
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Timestamp latency of thread, separate-process and fd-readiness serial reading.")
+    parser.add_argument("--events", "-n", type=int, default=2000)
+    parser.add_argument("--interval", "-i", type=float, default=0.01)
+    args = parser.parse_args()
+
+    for load in (False, True):
+        for mode in ("thread", "process", "fd"):
+            label = f"{mode}{' + load' if load else ''}"
+            summarize(label, measure(mode, args.events, args.interval, load))
@@ -0,0 +1,71 @@
+from asyncio import gather, sleep
+from os import sysconf
+from os.path import join
+from tempfile import TemporaryDirectory
+from typing import Callable
+from numpy.random import exponential
+from comprex.agent import RECORDER
+from mulmodal.recorder import RotatingWriter, _record, session_parts
+from mulmodal.util import clock
+from mulmodal.virtual import Post, SimAgent, run_virtually
+
+
+PAGE_SIZE = sysconf("SC_PAGE_SIZE")
+
+
+def rss() -> int:
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+async def _produce(agent: SimAgent, recorder: SimAgent, hours: float,
+                   rate: float, samples: list[tuple[float, int]],
+                   measure: Callable[[], int] = rss) -> None:
+    end = hours * 3600.
+    next_sample = 0.
+    while clock() < end:
+        await sleep(exponential(1. / rate))
+        agent.send_to(RECORDER, (clock(), -9))
+        if clock() >= next_sample:
+            samples.append((clock(), measure()))
+            next_sample += 600.
+    recorder.finish()
+
+
+async def _soak(filename: str, hours: float, rate: float,
+                samples: list[tuple[float, int]], max_bytes: int = 8 * 2 ** 20,
+                measure: Callable[[], int] = rss) -> None:
+    # e.g. tests/test_recorder.py runs a shorter soak with tracemalloc
+    post = Post()
+    producer = SimAgent("Producer", post)
+    recorder = SimAgent(RECORDER, post)
+    writer = RotatingWriter(filename, max_bytes=max_bytes)
+    await gather(_record(recorder, writer),
+                 _produce(producer, recorder, hours, rate, samples, measure))
+
+
+def soak(hours: float = 12., rate: float = 20.,
+         tolerance: int = 8 * 2 ** 20) -> list[tuple[float, int]]:
+    samples: list[tuple[float, int]] = []
+    with TemporaryDirectory() as d:
+        filename = join(d, "soak.csv")
+        run_virtually(_soak(filename, hours, rate, samples))
+        nparts = len(session_parts(filename))
+    # the first hour covers warm-up (imports, buffers, first rotation)
+    settled = [m for t, m in samples if t >= 3600.]
+    growth = max(settled) - settled[0]
+    print(f"{len(samples)} samples over {hours} h at {rate} events/s, {nparts} files")
+    print(f"RSS after 1 h: {settled[0] / 2 ** 20:.1f} MiB, "
+          f"peak: {max(settled) / 2 ** 20:.1f} MiB, growth: {growth / 2 ** 20:.2f} MiB")
+    assert growth < tolerance, "recorder memory is not flat"
+    return samples
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Soak the streaming recorder on a virtual clock.")
+    parser.add_argument("--hours", type=float, default=12.)
+    parser.add_argument("--rate", type=float, default=20.)
+    args = parser.parse_args()
+    soak(args.hours, args.rate)
@@ -0,0 +1,96 @@
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import READER, RECORDER, _self_terminate
+from pino.ino import Arduino
+from mulmodal.events import Codes
+from mulmodal.util import clock
+
+
+Send = Callable[[str, Any], None]
+
+
+class Subscription(NamedTuple):
+    addr: str
+    ranges: Optional[tuple[tuple[int, int], ...]]  # inclusive; None for every code
+    code_only: bool
+
+
+class Bus(object):
+    # Fans events out to the agents subscribed to their codes. An event is a
+    # (time, code, ...) tuple and is delivered as it is, the same object to
+    # every subscriber, or as its code alone for agents that only want the
+    # code (the controller's responses). Codes are routed once and the
+    # subscribers of each code are cached until the subscriptions change.
+    def __init__(self):
+        self.subscriptions: list[Subscription] = []
+        self._routes: dict[Any, tuple[tuple[str, bool], ...]] = {}
+
+    def subscribe(self, addr: str, ranges: Optional[Iterable[tuple[int, int]]] = None,
+                  code_only: bool = False) -> "Bus":
+        # e.g. subscribe("Camera", [(4, 8), (14, 16)]) for stimulus onsets
+        self.subscriptions.append(Subscription(
+            addr, None if ranges is None else tuple((int(lo), int(hi)) for lo, hi in ranges),
+            code_only))
+        self._routes.clear()
+        return self
+
+    def unsubscribe(self, addr: str) -> None:
+        self.subscriptions = [s for s in self.subscriptions if s.addr != addr]
+        self._routes.clear()
+
+    def route(self, code: Any) -> tuple[tuple[str, bool], ...]:
+        routes = self._routes.get(code)
+        if routes is None:
+            try:
+                value: Optional[int] = int(code)
+            except (TypeError, ValueError):
+                value = None
+            routes = self._routes[code] = tuple(
+                (s.addr, s.code_only) for s in self.subscriptions
+                if s.ranges is None or
+                (value is not None and any(lo <= value <= hi for lo, hi in s.ranges)))
+        return routes
+
+    def publish(self, sender: str, event: tuple, send: Send) -> None:
+        code = event[1]
+        for addr, code_only in self.route(code):
+            if addr != sender:
+                send(addr, code if code_only else event)
+
+
+class BusAgent(Agent):
+    # An agent whose events for the recorder are published on the bus
+    # instead, so that every subscriber gets them from one `send_to`.
+    # Without a bus it is a plain Agent.
+    def __init__(self, addr: str, bus: Optional[Bus] = None):
+        super().__init__(addr)
+        self.bus = bus
+
+    def send_to(self, to: str, message: Any) -> None:
+        if self.bus is not None and to == RECORDER and isinstance(message, tuple):
+            self.bus.publish(self.addr, message, super().send_to)
+        else:
+            super().send_to(to, message)
+
+
+def response_ranges(response_pins: Iterable[Any]) -> list[tuple[int, int]]:
+    return [(int(p), int(p)) for p in response_pins]
+
+
+async def read_to_bus(agent: Agent, ino: Arduino) -> None:
+    # `comprex.agent.Reader` for a BusAgent: every line is one event
+    codes = Codes()
+    try:
+        while agent.working():
+            input_: bytes = await agent.call_async(ino.read_until_eol)
+            if input_ is None:
+                continue
+            agent.send_to(RECORDER, (clock(), codes.parse(input_)))
+    except NotWorkingError:
+        ino.cancel_read()
+
+
+def bus_reader(ino: Arduino, bus: Bus) -> BusAgent:
+    return BusAgent(READER, bus) \
+        .assign_task(read_to_bus, ino=ino) \
+        .assign_task(_self_terminate)
@@ -0,0 +1,252 @@
+from dataclasses import fields
+from json import dumps
+from os import makedirs, walk
+from os.path import abspath, dirname, getmtime, join, splitext
+from re import search
+from sqlite3 import Connection, Row, connect
+from typing import Any, Iterable, NamedTuple, Optional
+from comprex.agent import ABEND, NEND
+from mulmodal.curves import TrialTracker
+from mulmodal.params import ConfigError, config_hash, config_key, task_params
+from mulmodal.recorder import iter_events
+
+
+DEFAULT_CATALOG = join(dirname(abspath(__file__)), "data", "catalog.sqlite")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    task TEXT,
+    subject TEXT,
+    condition TEXT,
+    recorded REAL,
+    config_hash TEXT,
+    metadata TEXT,
+    experimental TEXT,
+    events INTEGER,
+    trials INTEGER,
+    free_trials INTEGER,
+    correct INTEGER,
+    responses INTEGER,
+    duration REAL,
+    aborted INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_task_subject ON sessions (task, subject, recorded);
+CREATE INDEX IF NOT EXISTS sessions_subject ON sessions (subject, recorded);
+CREATE TABLE IF NOT EXISTS params (
+    session INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (key, value, session)
+) WITHOUT ROWID;
+"""
+# rotated parts (`name.001.csv`) belong to the session of the first part
+_PART = r"\.\d{3}$"
+
+
+class Summary(NamedTuple):
+    events: int
+    trials: int
+    free_trials: int
+    correct: int
+    responses: int
+    duration: float
+    aborted: bool
+
+
+def summarize(events: Iterable[tuple[float, str]],
+              response_pins: Iterable[Any] = (-9, -10),
+              reward_pins: Iterable[Any] = (6, 7)) -> Summary:
+    # Trials are those of the learning curves (`curves.TrialTracker`): a
+    # retry is not a trial of its own. NEND and ABEND share their codes with
+    # pins 1 and 2, so a session counts as aborted only when the last of
+    # the two codes it recorded is ABEND; the end is recorded after every
+    # reward's onset, and only offsets ("-2") can follow it.
+    responses = set(map(str, response_pins))
+    tracker = TrialTracker(reward_pins)
+    ends = {str(NEND), str(ABEND)}
+    n = trials = free = correct = nresponses = 0
+    first = last = 0.
+    end = ""
+    for t, code in events:
+        if n == 0:
+            first = t
+        last = t
+        n += 1
+        if code in responses:
+            nresponses += 1
+        elif code in ends:
+            end = code
+        outcome = tracker.feed(code)
+        if outcome is not None:
+            trials += 1
+            free += outcome.free
+            correct += outcome.correct
+    return Summary(n, trials, free, correct, nresponses, last - first, end == str(ABEND))
+
+
+def session_pins(task: str, experimental: dict) -> tuple[Any, Any]:
+    # response and reward pins, with the task's defaults
+    try:
+        params = task_params(task, experimental)
+    except ConfigError:
+        return experimental.get("response-pin", (-9, -10)), experimental.get("reward-pin", (6, 7))
+    return params.response_pin, params.reward_pin
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return str(value)
+
+
+def _value(value: Any) -> str:
+    # parameters are compared as canonical JSON with every number a float,
+    # so `violation=[0]` matches a config with `violation: [0.]`
+    return dumps(_normalize(value), sort_keys=True)
+
+
+def resolved_params(task: str, experimental: dict) -> dict:
+    # with the defaults filled in, so that queries also find sessions that
+    # left a key out of their config
+    try:
+        params = task_params(task, experimental)
+    except ConfigError:
+        return dict(experimental)
+    return {config_key(f): getattr(params, f.name) for f in fields(params) if f.init}
+
+
+class Catalog(object):
+    def __init__(self, path: str = DEFAULT_CATALOG):
+        makedirs(dirname(abspath(path)), exist_ok=True)
+        self.db: Connection = connect(path)
+        self.db.row_factory = Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def add(self, path: str, task: str, metadata: dict, experimental: dict,
+            summary: Optional[Summary] = None, recorded: Optional[float] = None,
+            aborted: bool = False) -> int:
+        # `aborted` is for sessions stopped before they could record ABEND,
+        # e.g. by a KeyboardInterrupt
+        path = abspath(path)
+        task = task.removeprefix("mulmodal.")
+        if summary is None:
+            summary = summarize(iter_events(path), *session_pins(task, experimental))
+        if aborted:
+            summary = summary._replace(aborted=True)
+        if recorded is None:
+            recorded = getmtime(path)
+        with self.db:
+            self.db.execute("DELETE FROM sessions WHERE path = ?", (path, ))
+            cursor = self.db.execute(
+                "INSERT INTO sessions (path, task, subject, condition, recorded, config_hash, "
+                "metadata, experimental, events, trials, free_trials, correct, responses, "
+                "duration, aborted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, task, metadata.get("subject"), metadata.get("condition"), recorded,
+                 config_hash(task, experimental), dumps(metadata), dumps(experimental),
+                 *summary[:-1], int(summary.aborted)))
+            session = cursor.lastrowid
+            self.db.executemany("INSERT INTO params VALUES (?, ?, ?)",
+                                [(session, k, _value(v))
+                                 for k, v in resolved_params(task, experimental).items()])
+        return session
+
+    def find(self, task: Optional[str] = None, subject: Optional[str] = None,
+             params: Optional[dict] = None, since: Optional[float] = None) -> list[Row]:
+        # e.g. find("main_task", "subject-a", {"violation": [0.]})
+        query = "SELECT s.* FROM sessions s"
+        args: list[Any] = []
+        for i, (key, value) in enumerate((params or {}).items()):
+            query += f" JOIN params p{i} ON p{i}.session = s.id AND p{i}.key = ? AND p{i}.value = ?"
+            args += [key, _value(value)]
+        where = []
+        if task is not None:
+            where.append("s.task = ?")
+            args.append(task.removeprefix("mulmodal."))
+        if subject is not None:
+            where.append("s.subject = ?")
+            args.append(subject)
+        if since is not None:
+            where.append("s.recorded >= ?")
+            args.append(since)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        return self.db.execute(query + " ORDER BY s.recorded", args).fetchall()
+
+    def backfill(self, root: str, task: str, keys: list[str],
+                 experimental: Optional[dict] = None) -> int:
+        # Data files only carry their metadata in the file name, which
+        # `namefile` joins with "-". The name is split into `keys` from the
+        # right, so that only the first field may contain "-".
+        n = 0
+        for directory, _, files in walk(root):
+            for name in sorted(files):
+                stem, ext = splitext(name)
+                if ext != ".csv" or search(_PART, stem):
+                    continue
+                values = stem.rsplit("-", len(keys) - 1)
+                metadata = dict(zip(keys, values)) if len(values) == len(keys) else {"name": stem}
+                self.add(join(directory, name), task, metadata, experimental or {})
+                n += 1
+        return n
+
+
+def print_sessions(rows: Iterable[Row]) -> None:
+    for r in rows:
+        status = "aborted" if r["aborted"] else "done"
+        print(f"{r['task']:<24} {r['subject'] or '':<16} {r['trials']:5d} trials "
+              f"{r['correct']:5d} correct {r['duration']:8.1f} s {status:<8} {r['path']}")
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from time import perf_counter
+
+    from mulmodal.session import load_config
+
+    parser = ArgumentParser(description="Index and query recorded sessions.")
+    parser.add_argument("--catalog", "-c", default=DEFAULT_CATALOG)
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill", help="add existing data files")
+    backfill.add_argument("root", help="data directory")
+    backfill.add_argument("--task", "-t", required=True)
+    backfill.add_argument("--config", "-y", help="config the sessions were run with")
+    backfill.add_argument("--keys", "-k", default="subject,condition",
+                          help="metadata keys the file names are made of")
+    query = commands.add_parser("query", help="list sessions")
+    query.add_argument("--task", "-t")
+    query.add_argument("--subject", "-s")
+    query.add_argument("--param", "-p", action="append", default=[],
+                       help="experimental key=value (yaml), e.g. violation=[0.]")
+    args = parser.parse_args()
+
+    with Catalog(args.catalog) as catalog:
+        if args.command == "backfill":
+            experimental = load_config(args.config).experimental if args.config else {}
+            n = catalog.backfill(args.root, args.task, args.keys.split(","), experimental)
+            print(f"{n} sessions added to {args.catalog}")
+        else:
+            from yaml import safe_load
+
+            params = {k: safe_load(v) for k, _, v in (p.partition("=") for p in args.param)}
+            s = perf_counter()
+            rows = catalog.find(args.task, args.subject, params)
+            elapsed = perf_counter() - s
+            print_sessions(rows)
+            print(f"{len(rows)} sessions in {elapsed * 1e3:.2f} ms")
@@ -0,0 +1,342 @@
+from collections import deque
+from types import ModuleType
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
+from comprex.util import timestamp
+from pino.ino import Arduino
+from yaml import safe_load
+from mulmodal.curves import TrialOutcome, TrialTracker
+from mulmodal.params import ConfigError, task_params
+from mulmodal.session import CONTROLLER, SessionConfig, load_config, load_task
+from mulmodal.util import clock
+
+
+STEP = 300  # recorded as STEP + index when a step starts
+# tasks that record attempts (100, 200, 201), which accuracy criteria need
+MARKS_ATTEMPTS = {"main_task"}
+ON_EXHAUST = ("repeat", "next", "stop")
+
+
+class Criterion(object):
+    # Scores a step online from the codes it records; `met` is checked at
+    # the end of every trial or reward.
+    def __init__(self, min_trials: int = 0):
+        self.min_trials = min_trials
+        self.trials = 0
+        self.rewards = 0
+
+    def trial(self, outcome: TrialOutcome) -> None:
+        self.trials += 1
+
+    def reward(self) -> None:
+        self.rewards += 1
+
+    def met(self) -> bool:
+        return False
+
+
+class Accuracy(Criterion):
+    # correct decisions among the last `window` decided attempts
+    def __init__(self, min: float = 0.8, window: int = 40, min_trials: int = 0,
+                 first_try: bool = False):
+        super().__init__(min_trials)
+        self.min = min
+        self.first_try = first_try
+        self.outcomes: deque[int] = deque(maxlen=window)
+
+    def trial(self, outcome: TrialOutcome) -> None:
+        super().trial(outcome)
+        if outcome.free:
+            return None
+        if self.first_try:
+            self.outcomes.append(int(outcome.correct and outcome.attempts == 1))
+            return None
+        errors = outcome.attempts - outcome.forced - outcome.correct
+        self.outcomes.extend([0] * errors + [1] * outcome.correct)
+
+    def met(self) -> bool:
+        full = len(self.outcomes) == self.outcomes.maxlen
+        return full and self.trials >= self.min_trials and \
+            sum(self.outcomes) / len(self.outcomes) >= self.min
+
+
+class Rewards(Criterion):
+    def __init__(self, count: int = 100):
+        super().__init__()
+        self.count = count
+
+    def met(self) -> bool:
+        return self.rewards >= self.count
+
+
+class Trials(Criterion):
+    def __init__(self, count: int = 100):
+        super().__init__()
+        self.count = count
+
+    def met(self) -> bool:
+        return self.trials >= self.count
+
+
+CRITERIA: dict[str, Callable[..., Criterion]] = {
+    "accuracy": Accuracy,
+    "first-try": lambda **kw: Accuracy(first_try=True, **kw),
+    "rewards": Rewards,
+    "trials": Trials,
+    "none": Criterion,
+}
+
+
+def make_criterion(spec: Optional[dict]) -> Criterion:
+    # e.g. {"kind": "accuracy", "min": 0.8, "window": 40, "min-trials": 100}
+    spec = dict(spec or {"kind": "none"})
+    kind = spec.pop("kind")
+    return CRITERIA[kind](**{k.replace("-", "_"): v for k, v in spec.items()})
+
+
+class StepAgent(object):
+    # Proxy for the controller that a step's `control` runs with. Once the
+    # criterion is met, the step's next wait raises NotWorkingError, and its
+    # end of session (NEND/ABEND to the observer, `finish`) only ends the
+    # step. Everything else goes to the real agent.
+    def __init__(self, agent: Agent, index: int, criterion: Criterion,
+                 reward_pins: Iterable[Any]):
+        self._agent = agent
+        self.index = index
+        self.criterion = criterion
+        self.tracker = TrialTracker(reward_pins)
+        self.rewards = set(map(str, reward_pins))
+        self.marked = False
+        self.started = False
+        self.ended = False
+        self.done = False
+        self.passed = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._agent, name)
+
+    def working(self) -> bool:
+        # Stays True after the criterion is met: the helpers in
+        # `mulmodal.util` skip their waits once an agent stops working,
+        # which would rush through the rest of the trial.
+        return not self.ended and self._agent.working()
+
+    def finish(self) -> None:
+        self.done = self.ended = True
+
+    def _check(self) -> None:
+        if self.done or not self._agent.working():
+            raise NotWorkingError
+
+    def send_to(self, to: str, message: Any) -> None:
+        if to == OBSERVER and message in (NEND, ABEND):
+            self.done = self.ended = True
+            return None
+        if to == RECORDER and isinstance(message, tuple):
+            # The curriculum records the start and end of the whole run.
+            # START, NEND and ABEND share their codes with pins 0 to 2, so
+            # they are told apart by when the step sends them.
+            code = str(message[1])
+            if not self.started and code == str(START):
+                self.started = True
+                return None
+            self.started = True
+            if self.ended and code in (str(NEND), str(ABEND)):
+                return None
+            self._score(code)
+        self._agent.send_to(to, message)
+
+    def _score(self, code: str) -> None:
+        if self.passed and code.startswith("-") and code[1:] in self.rewards:
+            # The step stops once the reward is off, at its next wait, which
+            # is the ISI; no output is left on and no trial is cut short.
+            self.done = True
+            return None
+        if code in self.rewards:
+            self.criterion.reward()
+        if code in ("100", "200"):
+            self.marked = True
+        outcome = self.tracker.feed(code)
+        if outcome is None and code in self.rewards and not self.marked:
+            # training steps have no trial markers: every reward ends a trial
+            outcome = TrialOutcome(True, 0, False, False)
+        if outcome is not None:
+            self.criterion.trial(outcome)
+            self.passed = self.passed or self.criterion.met()
+
+    async def recv(self) -> Any:
+        self._check()
+        return await self._agent.recv()
+
+    async def try_recv(self, timeout: float) -> Any:
+        self._check()
+        return await self._agent.try_recv(timeout)
+
+    async def sleep(self, duration: float) -> None:
+        self._check()
+        await self._agent.sleep(duration)
+
+
+class Step(NamedTuple):
+    task: ModuleType
+    name: str
+    config: SessionConfig
+    criterion: Optional[dict]
+    reward_pins: tuple
+    response_pins: tuple
+    on_exhaust: str  # "repeat", "next" or "stop"
+    max_repeats: int  # repeats before the session stops
+
+
+def load_steps(raw: list[dict], root: str = ".") -> list[Step]:
+    from os.path import exists, join
+
+    steps = []
+    for i, step in enumerate(raw):
+        name = step["task"]
+        kind = (step.get("criterion") or {}).get("kind", "none")
+        if kind not in CRITERIA:
+            raise ConfigError(f"{name}: unknown criterion {kind}, use one of {list(CRITERIA)}")
+        if kind in ("accuracy", "first-try") and \
+                name.removeprefix("mulmodal.") not in MARKS_ATTEMPTS:
+            # without attempt markers every trial is free and never scored
+            raise ConfigError(f"{name}: {kind} needs a task that marks attempts, "
+                              f"one of {sorted(MARKS_ATTEMPTS)}")
+        # the last step has nothing to repeat for
+        on_exhaust = step.get("on-exhaust", "stop" if i == len(raw) - 1 else "repeat")
+        if on_exhaust not in ON_EXHAUST:
+            raise ConfigError(f"{name}: on-exhaust must be one of {list(ON_EXHAUST)}")
+        max_repeats = step.get("max-repeats", 10)
+        if isinstance(max_repeats, bool) or not isinstance(max_repeats, int) or max_repeats < 0:
+            raise ConfigError(f"{name}: max-repeats must be a non-negative integer")
+        path = step["config"]
+        if not exists(path):
+            path = join(root, path)
+        config = load_config(path, step.get("metadata"))
+        # checked before anything touches the board
+        params = task_params(name, config.experimental)
+        steps.append(Step(load_task(name), name, config, step.get("criterion"),
+                          tuple(params.reward_pin), tuple(params.response_pin), on_exhaust,
+                          max_repeats))
+    return steps
+
+
+class Curriculum(object):
+    # Runs the steps one after another in one session, with one connection,
+    # reader and recorder. Audio buffers and schedules are shared through
+    # the caches in `mulmodal.util` and `mulmodal.schedule`.
+    def __init__(self, steps: list[Step]):
+        self.steps = steps
+        self.log: list[tuple[str, float, float, bool]] = []
+
+    async def control(self, agent: Agent, ino: Arduino, expvars: Any = None) -> None:
+        # A step's criterion is made once, so what it scored carries over
+        # when the step is repeated.
+        criteria: dict[int, Criterion] = {}
+        repeats = 0
+        i = 0
+        try:
+            agent.send_to(RECORDER, timestamp(START))
+            while i < len(self.steps) and agent.working():
+                step = self.steps[i]
+                if i not in criteria:
+                    criteria[i] = make_criterion(step.criterion)
+                proxy = StepAgent(agent, i, criteria[i], step.reward_pins)
+                agent.send_to(RECORDER, (clock(), STEP + i))
+                print(f"Step {i}: {step.name}")
+                started = clock()
+                await step.task.control(proxy, ino, step.config.experimental)
+                self.log.append((step.name, started, clock(), proxy.passed))
+                if not agent.working():
+                    raise NotWorkingError
+                # responses left over from the step
+                while await agent.try_recv(0.) is not None:
+                    pass
+                if proxy.passed or step.on_exhaust == "next":
+                    i, repeats = i + 1, 0
+                elif step.on_exhaust == "stop":
+                    break
+                elif repeats >= step.max_repeats:
+                    print(f"Step {i}: criterion not met after {repeats} repeats, stopping")
+                    break
+                else:
+                    repeats += 1
+            agent.send_to(OBSERVER, NEND)
+            agent.send_to(RECORDER, timestamp(NEND))
+            agent.finish()
+        except NotWorkingError:
+            agent.send_to(OBSERVER, ABEND)
+            agent.send_to(RECORDER, timestamp(ABEND))
+            agent.finish()
+
+    async def read(self, agent: Agent, ino: Arduino, expvars: Any = None) -> None:
+        # forwards the responses of every step to the controller
+        response_pins = {str(p) for step in self.steps for p in step.response_pins}
+        try:
+            while agent.working():
+                input_: bytes = await agent.call_async(ino.read_until_eol)
+                if input_ is None:
+                    continue
+                parsed_input = input_.rstrip().decode("utf-8")
+                if parsed_input in response_pins:
+                    agent.send_to(CONTROLLER, parsed_input)
+                agent.send_to(RECORDER, timestamp(parsed_input))
+        except NotWorkingError:
+            ino.cancel_read()
+
+    def print_report(self) -> None:
+        for name, started, ended, passed in self.log:
+            status = "passed" if passed else "ended"
+            print(f"{name:<32} {status:<7} after {ended - started:8.1f} s")
+
+
+def load_curriculum(path: str) -> tuple[Curriculum, dict, dict]:
+    from os.path import abspath, dirname
+
+    with open(path, "r") as f:
+        raw = safe_load(f) or {}
+    steps = load_steps(raw.get("Steps", []), dirname(abspath(path)))
+    comport = dict(raw.get("Comport", {})) or (steps[0].config.comport if steps else {})
+    return Curriculum(steps), comport, dict(raw.get("Metadata", {}))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    from amas.connection import Register
+    from amas.env import Environment
+    from comprex.agent import READER, Observer, Recorder, _self_terminate
+    from mulmodal.session import connect, data_file
+
+    parser = ArgumentParser(description="Run training steps in one session, moving on by criterion.")
+    parser.add_argument("curriculum", help="yaml file listing the steps")
+    args = parser.parse_args()
+
+    curriculum, comport, metadata = load_curriculum(args.curriculum)
+    ino = connect(comport)
+    pinmode: dict = {}
+    for step in curriculum.steps:
+        pinmode.update(step.config.pinmode)
+    ino.apply_pinmode_settings(pinmode)
+    filename = data_file(curriculum.steps[0].task, metadata)
+
+    controller = Agent(CONTROLLER) \
+        .assign_task(curriculum.control, ino=ino) \
+        .assign_task(_self_terminate)
+    reader = Agent(READER) \
+        .assign_task(curriculum.read, ino=ino) \
+        .assign_task(_self_terminate)
+    recorder = Recorder(filename=filename)
+    observer = Observer()
+
+    agents = [controller, reader, recorder, observer]
+    register = Register(agents)
+    env = Environment(agents)
+
+    try:
+        env.run()
+    except KeyboardInterrupt:
+        observer.send_all(ABEND)
+        observer.finish()
+    curriculum.print_report()
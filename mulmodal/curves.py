@@ -0,0 +1,227 @@
+from json import dumps, loads
+from os import SEEK_END, listdir, makedirs, remove
+from os.path import abspath, dirname, exists, join, splitext
+from typing import Any, Iterable, NamedTuple, Optional
+from numpy import array, int64, ndarray
+from mulmodal.recorder import iter_events
+
+
+DEFAULT_STORE = join(dirname(abspath(__file__)), "data", "curves")
+BLOCK = 20  # decided attempts per point of the block curve
+
+
+class TrialOutcome(NamedTuple):
+    free: bool
+    attempts: int
+    correct: bool  # a decision period ended with 201
+    forced: bool   # rewarded after the last retry without a decision
+
+
+class TrialTracker(object):
+    # A trial starts with 100 (free) or its first 200, gets one more 200 per
+    # retry and ends with the onset of a reward.
+    def __init__(self, reward_pins: Iterable[Any] = (6, 7)):
+        self.rewards = set(map(str, reward_pins))
+        self.free = self.correct = False
+        self.attempts = 0
+
+    def starts(self, code: str) -> bool:
+        # whether `code` starts a trial; a 200 within a trial is a retry
+        return code == "100" or (code == "200" and not (self.free or self.attempts))
+
+    def feed(self, code: str) -> Optional[TrialOutcome]:
+        if code == "100":
+            self.free, self.attempts, self.correct = True, 0, False
+        elif code == "200":
+            self.free = False
+            self.attempts += 1
+        elif code == "201":
+            self.correct = True
+        elif code in self.rewards and (self.free or self.attempts):
+            outcome = TrialOutcome(self.free, self.attempts, self.correct,
+                                   not self.free and not self.correct)
+            self.free, self.attempts, self.correct = False, 0, False
+            return outcome
+        return None
+
+
+def trial_numbers(codes: Iterable[str], reward_pins: Iterable[Any] = (6, 7)) -> ndarray:
+    # trial of each event, -1 before the first one; events after a reward
+    # (the ISI) belong to the trial it ended
+    tracker = TrialTracker(reward_pins)
+    n = -1
+    numbers = []
+    for code in codes:
+        n += tracker.starts(code)
+        tracker.feed(code)
+        numbers.append(n)
+    return array(numbers, dtype=int64)
+
+
+def trial_outcomes(events: Iterable[tuple[float, str]],
+                   reward_pins: Iterable[Any] = (6, 7)) -> list[TrialOutcome]:
+    tracker = TrialTracker(reward_pins)
+    outcomes = []
+    for _, code in events:
+        outcome = tracker.feed(code)
+        if outcome is not None:
+            outcomes.append(outcome)
+    return outcomes
+
+
+class SessionPoint(NamedTuple):
+    # one line of a subject's store: the session's own counts, then the
+    # running statistics after folding it in
+    path: str
+    task: str
+    recorded: float
+    trials: int
+    free: int
+    attempts: int
+    decided: int
+    correct: int
+    first_try: int
+    forced: int
+    total_decided: int
+    total_correct: int
+    ewma: float
+    blocks: list[float]       # accuracy of blocks completed in the session
+    open_block: list[int]     # decided and correct attempts of the unfinished block
+
+
+class LearningCurves(object):
+    # Append-only store with one JSON line per session in a file per subject
+    # and task. Each line carries the running statistics, so folding a
+    # session in only reads the last line of the file.
+    def __init__(self, root: str = DEFAULT_STORE, alpha: float = 0.3, block: int = BLOCK):
+        self.root = root
+        self.alpha = alpha
+        self.block = block
+
+    def _path(self, subject: str, task: str) -> str:
+        return join(self.root, subject, f"{task.removeprefix('mulmodal.')}.jsonl")
+
+    def tasks(self, subject: str) -> list[str]:
+        directory = join(self.root, subject)
+        if not exists(directory):
+            return []
+        return sorted(splitext(name)[0] for name in listdir(directory))
+
+    def last(self, subject: str, task: str) -> Optional[SessionPoint]:
+        path = self._path(subject, task)
+        if not exists(path):
+            return None
+        with open(path, "rb") as f:
+            f.seek(0, SEEK_END)
+            end = f.tell()
+            if end == 0:
+                return None
+            size = min(end, 4096)
+            while True:
+                f.seek(end - size)
+                lines = f.read(size).rstrip(b"\n").split(b"\n")
+                if len(lines) > 1 or size == end:
+                    return SessionPoint(*loads(lines[-1]))
+                size = min(size * 2, end)
+
+    def fold(self, subject: str, task: str, path: str, outcomes: list[TrialOutcome],
+             recorded: float = 0.) -> SessionPoint:
+        previous = self.last(subject, task)
+        decided = sum(o.attempts - o.forced for o in outcomes if not o.free)
+        correct = sum(o.correct for o in outcomes)
+        # every decided attempt but a trial's correct one was an error
+        stream = []
+        for o in outcomes:
+            if not o.free:
+                stream += [0] * (o.attempts - o.forced - o.correct) + [1] * o.correct
+        n, k = previous.open_block if previous else (0, 0)
+        blocks = []
+        for outcome in stream:
+            n, k = n + 1, k + outcome
+            if n == self.block:
+                blocks.append(k / n)
+                n, k = 0, 0
+        accuracy = correct / decided if decided else None
+        # seeded by the first session with decided trials, NaN until then
+        seeded = previous is not None and previous.total_decided > 0
+        if accuracy is None:
+            ewma = previous.ewma if seeded else float("nan")
+        elif seeded:
+            ewma = self.alpha * accuracy + (1 - self.alpha) * previous.ewma
+        else:
+            ewma = accuracy
+        point = SessionPoint(path, task.removeprefix("mulmodal."), recorded, len(outcomes),
+                             sum(o.free for o in outcomes),
+                             sum(o.attempts for o in outcomes), decided, correct,
+                             sum(o.correct and o.attempts == 1 for o in outcomes),
+                             sum(o.forced for o in outcomes),
+                             (previous.total_decided if previous else 0) + decided,
+                             (previous.total_correct if previous else 0) + correct,
+                             ewma, blocks, [n, k])
+        path = self._path(subject, task)
+        makedirs(dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            f.write(dumps(point) + "\n")
+        return point
+
+    def fold_file(self, subject: str, task: str, path: str,
+                  reward_pins: Iterable[Any] = (6, 7), recorded: float = 0.) -> SessionPoint:
+        return self.fold(subject, task, path, trial_outcomes(iter_events(path), reward_pins),
+                         recorded)
+
+    def sessions(self, subject: str, task: Optional[str] = None) -> list[SessionPoint]:
+        # one task, or all of them in the order they were recorded
+        points = []
+        for name in [task] if task is not None else self.tasks(subject):
+            path = self._path(subject, name)
+            if exists(path):
+                with open(path, "r") as f:
+                    points += [SessionPoint(*loads(line)) for line in f if line.strip()]
+        return sorted(points, key=lambda p: p.recorded) if task is None else points
+
+    def curve(self, subject: str, task: Optional[str] = None) -> dict[str, ndarray]:
+        # per-session accuracy and its running mean and EWMA, and the block curve
+        points = self.sessions(subject, task)
+        return {
+            "accuracy": array([p.correct / p.decided if p.decided else float("nan")
+                               for p in points]),
+            "first-try": array([p.first_try / (p.trials - p.free) if p.trials > p.free
+                                else float("nan") for p in points]),
+            "cumulative": array([p.total_correct / p.total_decided if p.total_decided
+                                 else float("nan") for p in points]),
+            "ewma": array([p.ewma for p in points]),
+            "blocks": array([b for p in points for b in p.blocks]),
+        }
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    from mulmodal.catalog import DEFAULT_CATALOG, Catalog
+    from mulmodal.params import ConfigError, task_params
+
+    parser = ArgumentParser(description="Per-subject learning curves.")
+    parser.add_argument("subject")
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    parser.add_argument("--task", "-t")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="fold every catalogued session of the subject again")
+    parser.add_argument("--catalog", "-c", default=DEFAULT_CATALOG)
+    args = parser.parse_args()
+
+    curves = LearningCurves(args.store)
+    if args.rebuild:
+        for task in curves.tasks(args.subject):
+            remove(curves._path(args.subject, task))
+        with Catalog(args.catalog) as catalog:
+            for row in catalog.find(subject=args.subject):
+                try:
+                    reward_pins = task_params(row["task"], loads(row["experimental"])).reward_pin
+                except ConfigError:
+                    reward_pins = (6, 7)
+                curves.fold_file(args.subject, row["task"], row["path"], reward_pins,
+                                 row["recorded"])
+    for p in curves.sessions(args.subject, args.task):
+        accuracy = p.correct / p.decided if p.decided else float("nan")
+        print(f"{p.task:<24} {p.trials:4d} trials {accuracy:6.3f} accuracy "
+              f"{p.ewma:6.3f} ewma {p.forced:4d} forced  {p.path}")
@@ -0,0 +1,25 @@
+from typing import Iterable
+
+
+class Codes(object):
+    # Canonical code strings for raw serial lines. A line seen before maps to
+    # the str made for it the first time, so the reader neither strips nor
+    # decodes it again and every event with that code carries the same
+    # object, which `in` and dict lookups downstream match by identity.
+    # `known` codes, e.g. the response pins, are used as they are, so the
+    # controller's own pin strings are the ones it receives. Lines are keyed
+    # with their line ending; at most `limit` distinct lines are kept, so
+    # lines that are all different (board time) do not grow the table.
+    def __init__(self, known: Iterable[str] = (), limit: int = 1024):
+        self.limit = limit
+        self.known = {code: code for code in known}
+        self.table: dict[bytes, str] = {}
+
+    def parse(self, line: bytes) -> str:
+        code = self.table.get(line)
+        if code is None:
+            code = line.rstrip().decode("utf-8")
+            code = self.known.get(code, code)
+            if len(self.table) < self.limit:
+                self.table[bytes(line)] = code
+        return code
@@ -0,0 +1,143 @@
+from asyncio import AbstractEventLoop, Future, get_running_loop
+from collections import deque
+from os import read
+from typing import Any, Iterable, Optional
+from amas.agent import NotWorkingError
+from comprex.agent import READER, RECORDER, _self_terminate
+from mulmodal.bus import Bus, BusAgent
+from mulmodal.events import Codes
+from mulmodal.hwclock import BoardClock, parse_line
+from mulmodal.util import clock
+
+
+CONTROLLER = "Controller"
+
+
+def serial_fileno(port: Any, depth: int = 3) -> int:
+    # pino keeps the pyserial port, which has `fileno`, inside the Comport
+    # inside the Arduino; anything else with `fileno` (e.g. a pty) works too
+    if isinstance(port, int):
+        return port
+    fileno = getattr(port, "fileno", None)
+    if callable(fileno):
+        return fileno()
+    if depth > 0 and hasattr(port, "__dict__"):
+        for value in vars(port).values():
+            if isinstance(value, (int, float, str, bytes)) or value is None:
+                continue
+            try:
+                return serial_fileno(value, depth - 1)
+            except ValueError:
+                continue
+    raise ValueError(f"No file descriptor in {type(port).__name__}")
+
+
+class SerialTransport(object):
+    # Reads lines from a serial port registered with the event loop. Bytes
+    # are read without blocking when the port becomes readable and each
+    # complete line is stamped right away, so no executor thread and no read
+    # timeout are involved. The port is expected to be non-blocking, as
+    # pyserial opens it.
+    def __init__(self, fd: int, max_line: int = 4096):
+        self.fd = fd
+        self.max_line = max_line
+        self.buffer = bytearray()
+        self.lines: deque[tuple[float, bytes]] = deque()
+        self.closed = False
+        self._loop: Optional[AbstractEventLoop] = None
+        self._waiter: Optional[Future] = None
+
+    def start(self) -> "SerialTransport":
+        self._loop = get_running_loop()
+        self._loop.add_reader(self.fd, self._on_readable)
+        return self
+
+    def _on_readable(self) -> None:
+        try:
+            data = read(self.fd, 4096)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError:
+            data = b""
+        t = clock()
+        if not data:
+            # the board went away
+            self.close()
+            return None
+        self.buffer += data
+        while True:
+            end = self.buffer.find(b"\n")
+            if end < 0:
+                break
+            self.lines.append((t, bytes(self.buffer[:end + 1])))
+            del self.buffer[:end + 1]
+        if len(self.buffer) > self.max_line:
+            self.buffer.clear()
+        if self.lines:
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def readline(self) -> Optional[tuple[float, bytes]]:
+        # (time the line arrived, line), or None once closed
+        while not self.lines:
+            if self.closed or self._loop is None:
+                return None
+            self._waiter = self._loop.create_future()
+            await self._waiter
+        return self.lines.popleft()
+
+    def close(self) -> None:
+        if self.closed:
+            return None
+        self.closed = True
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.remove_reader(self.fd)
+        self._wake()
+
+
+async def _read_fd(agent: "FdReader", response_pins: list[str], forward: bool,
+                   board_time: bool, board_clock: BoardClock) -> None:
+    transport = agent.transport.start()
+    codes = Codes(response_pins)
+    try:
+        while agent.working():
+            event = await transport.readline()
+            if event is None:
+                break
+            t, line = event
+            parsed_input, micros = parse_line(line.rstrip().decode("utf-8")) \
+                if board_time else (codes.parse(line), None)
+            if forward and parsed_input in response_pins:
+                agent.send_to(CONTROLLER, parsed_input)
+            if micros is None:
+                agent.send_to(RECORDER, (t, parsed_input))
+            else:
+                agent.send_to(RECORDER, (t, parsed_input, micros,
+                                         board_clock.update(micros, t)))
+    except NotWorkingError:
+        pass
+    finally:
+        transport.close()
+
+
+class FdReader(BusAgent):
+    # Reader that closes its transport when it is finished, which wakes the
+    # pending `readline` at once instead of after a read timeout.
+    def __init__(self, ino: Any, response_pins: Iterable[Any] = (-9, -10), forward: bool = True,
+                 board_time: bool = False, addr: Optional[str] = None,
+                 bus: Optional[Bus] = None, clock_forgetting: float = 0.99,
+                 clock_window: int = 256):
+        super().__init__(addr or READER, bus)
+        self.transport = SerialTransport(serial_fileno(ino))
+        response_pins = list(map(str, response_pins))
+        board_clock = BoardClock(clock_forgetting, clock_window)
+        self.assign_task(_read_fd, response_pins=response_pins, forward=forward,
+                         board_time=board_time, board_clock=board_clock) \
+            .assign_task(_self_terminate)
+
+    def finish(self) -> None:
+        self.transport.close()
+        super().finish()
@@ -0,0 +1,120 @@
+from collections import deque
+from typing import Any, Iterable, Optional
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import RECORDER
+from pino.ino import Arduino
+from mulmodal.util import clock
+
+
+CONTROLLER = "Controller"
+WRAP = 2 ** 32  # micros() is an unsigned long on the board
+
+
+# With the protocol extension enabled, the board appends its micros() to
+# every event line: b"-9,123456789\r\n". Lines without it are still accepted.
+def parse_line(line: str) -> tuple[str, Optional[int]]:
+    code, sep, micros = line.partition(",")
+    if not sep:
+        return code, None
+    try:
+        return code, int(micros)
+    except ValueError:
+        return line, None
+
+
+class BoardClock(object):
+    # Online mapping from board micros() to the host clock.
+    #
+    # Host stamps are late by a one-sided serial delay, so the mapping follows
+    # the lower envelope of (board, host) pairs: the drift is an exponentially
+    # weighted least-squares slope through the minimum-delay pair of every
+    # `block` events, and the offset is the smallest residual over the last
+    # `window` events.
+    def __init__(self, forgetting: float = 0.99, window: int = 256, block: int = 32):
+        self.forgetting = forgetting
+        self.window = window
+        self.block = block
+        self.origin: Optional[float] = None
+        self.host_origin = 0.
+        self.last_micros: Optional[int] = None
+        self.wraps = 0
+        self.sw = self.sx = self.sy = self.sxx = self.sxy = 0.
+        self.slope = 1.
+        self.block_min: Optional[tuple[float, float]] = None
+        self.residuals: deque[tuple[int, float, float]] = deque()
+        self.count = 0
+
+    def unwrap(self, micros: int) -> float:
+        if self.last_micros is not None and micros < self.last_micros:
+            self.wraps += 1
+        self.last_micros = micros
+        return (micros + self.wraps * WRAP) * 1e-6
+
+    def _fit(self, x: float, y: float) -> None:
+        lam = self.forgetting
+        self.sw = lam * self.sw + 1.
+        self.sx = lam * self.sx + x
+        self.sy = lam * self.sy + y
+        self.sxx = lam * self.sxx + x * x
+        self.sxy = lam * self.sxy + x * y
+        det = self.sw * self.sxx - self.sx * self.sx
+        if det > 1e-9:
+            self.slope = (self.sw * self.sxy - self.sx * self.sy) / det
+
+    def update(self, micros: int, host: float) -> float:
+        board = self.unwrap(micros)
+        if self.origin is None:
+            self.origin = board
+            self.host_origin = host
+        x = board - self.origin
+        y = host - self.host_origin
+        if self.block_min is None or y - x < self.block_min[1] - self.block_min[0]:
+            self.block_min = (x, y)
+        if self.count % self.block == self.block - 1:
+            self._fit(*self.block_min)
+            self.block_min = None
+        # sliding minimum of the residuals (monotonic deque)
+        while self.residuals and \
+                self.residuals[-1][2] - self.slope * self.residuals[-1][1] >= y - self.slope * x:
+            self.residuals.pop()
+        self.residuals.append((self.count, x, y))
+        if self.residuals[0][0] <= self.count - self.window:
+            self.residuals.popleft()
+        self.count += 1
+        return self.map(x)
+
+    @property
+    def offset(self) -> float:
+        if not self.residuals:
+            return 0.
+        _, x, y = self.residuals[0]
+        return y - self.slope * x
+
+    def map(self, x: float) -> float:
+        return self.host_origin + self.offset + self.slope * x
+
+
+async def read_with_board_time(agent: Agent, ino: Arduino,
+                               response_pins: Iterable[Any] = (-9, -10),
+                               forward: bool = True, clock_forgetting: float = 0.99,
+                               clock_window: int = 256) -> None:
+    response_pins_str = list(map(str, response_pins))
+    board_clock = BoardClock(clock_forgetting, clock_window)
+
+    try:
+        while agent.working():
+            input_: bytes = await agent.call_async(ino.read_until_eol)
+            host = clock()
+            if input_ is None:
+                continue
+            parsed_input, micros = parse_line(input_.rstrip().decode("utf-8"))
+            if forward and parsed_input in response_pins_str:
+                agent.send_to(CONTROLLER, parsed_input)
+            if micros is None:
+                agent.send_to(RECORDER, (host, parsed_input))
+            else:
+                board = board_clock.update(micros, host)
+                agent.send_to(RECORDER, (host, parsed_input, micros, board))
+
+    except NotWorkingError:
+        ino.cancel_read()
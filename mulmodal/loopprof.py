@@ -0,0 +1,141 @@
+from asyncio import get_running_loop, sleep
+from os.path import basename
+from sys import _current_frames
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from types import FrameType
+from typing import Optional
+from amas.agent import Agent, NotWorkingError
+from numpy import array, percentile
+
+
+PROFILER = "Profiler"
+# frames of the loop itself; the one above `Handle._run` is the coroutine
+# (or plain callback) that the loop is running
+_IDLE = ("select", "selectors.py")
+_RUN = ("_run", "events.py")
+
+
+def _frame_name(frame: FrameType) -> tuple[str, str]:
+    return frame.f_code.co_name, basename(frame.f_code.co_filename)
+
+
+def _stack(frame: Optional[FrameType]) -> list[tuple[str, str]]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class LoopProfiler(object):
+    # Sampling profiler for the event loop the agents share.
+    #
+    # A thread looks at the loop thread's stack every `interval` seconds and
+    # counts the stacks it finds busy, i.e. not waiting in `select`. Nothing
+    # is added to the loop's own callbacks, apart from a probe that sleeps
+    # for `probe` seconds and measures how late it wakes up. Stacks are
+    # written in the folded format of flamegraph.pl and speedscope.
+    #
+    # The sampler only gets the GIL when the loop releases it, which a busy
+    # callback does after the interpreter's switch interval (5 ms). Short
+    # callbacks therefore mostly go unseen, while the long ones that cause
+    # lag are sampled in proportion to their duration.
+    def __init__(self, interval: float = 0.01, probe: float = 0.05,
+                 threshold: float = 0.01, max_lags: int = 2 ** 16):
+        self.interval = interval
+        self.probe = probe
+        self.threshold = threshold
+        self.max_lags = max_lags
+        self.stacks: dict[tuple[tuple[str, str], ...], int] = {}
+        self.samples = 0
+        self.idle = 0
+        self.lags: list[float] = []
+        self.late = 0
+        self.worst = 0.
+        self._thread_id = 0
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> "LoopProfiler":
+        # must be called from the thread running the loop
+        self._thread_id = get_ident()
+        self._thread = Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = _current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            stack = _stack(frame)
+            if _IDLE in stack:
+                self.idle += 1
+                continue
+            if _RUN in stack:
+                stack = stack[len(stack) - stack[::-1].index(_RUN):]
+            key = tuple(stack)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def lag(self, value: float) -> None:
+        if len(self.lags) < self.max_lags:
+            self.lags.append(value)
+        if value > self.threshold:
+            self.late += 1
+        self.worst = max(self.worst, value)
+
+    async def run_probe(self, agent: Agent) -> None:
+        loop = get_running_loop()
+        while agent.working():
+            s = loop.time()
+            await sleep(self.probe)
+            self.lag(loop.time() - s - self.probe)
+
+    def owners(self) -> dict[str, int]:
+        # busy samples by the outermost frame, e.g. `control`, `read` or `_record`
+        owners: dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            owner = stack[0][0] if stack else "?"
+            owners[owner] = owners.get(owner, 0) + count
+        return owners
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda x: -x[1]):
+                names = ";".join(f"{name} ({file})" for name, file in stack)
+                f.write(f"{names} {count}\n")
+
+    def print_report(self) -> None:
+        busy = self.samples - self.idle
+        print(f"Event loop busy in {busy} of {self.samples} samples "
+              f"({self.interval * 1e3:.0f} ms apart)")
+        for owner, count in sorted(self.owners().items(), key=lambda x: -x[1])[:10]:
+            print(f"    {count:6d} {owner}")
+        if self.lags:
+            p50, p99 = percentile(array(self.lags), [50, 99]) * 1e3
+            print(f"Loop lag: median {p50:.2f} ms, p99 {p99:.2f} ms, "
+                  f"max {self.worst * 1e3:.2f} ms, {self.late} over "
+                  f"{self.threshold * 1e3:.0f} ms")
+
+
+async def profile_loop(agent: Agent, filename: str, interval: float = 0.01,
+                       probe: float = 0.05, threshold: float = 0.01) -> None:
+    profiler = LoopProfiler(interval, probe, threshold).start()
+    started = perf_counter()
+    try:
+        await profiler.run_probe(agent)
+    except NotWorkingError:
+        pass
+    finally:
+        profiler.stop()
+        profiler.write_folded(filename)
+        print(f"Loop profile of {perf_counter() - started:.1f} s written to {filename}")
+        profiler.print_report()
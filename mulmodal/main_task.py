@@ -1,13 +1,18 @@
-from time import perf_counter
-from typing import Any
+from typing import Any, Optional
 from amas.agent import Agent, NotWorkingError
 from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
-from comprex.audio import make_white_noise, Speaker
 from comprex.config import Experimental
-from comprex.scheduler import TrialIterator, blockwise_shuffle, unif_rng
+from comprex.scheduler import TrialIterator, unif_rng
 from comprex.util import timestamp
-from pino.ino import HIGH, LOW, Arduino
-from mulmodal.util import flush_message_for, present_stimulus, fixed_interval_with_limit
+from pino.ino import Arduino
+from mulmodal.events import Codes
+from mulmodal.util import clock, get_speaker, flush_message_for, \
+    fixed_interval_with_limit, precise_sleep, use_precision
+from mulmodal.params import MainTaskParams, cached_task_params, config_hash, task_params
+from mulmodal.scoring import Majority, Rule, make_rule
+from mulmodal.realtime import RealtimePhases
+from mulmodal.schedule import cached_schedule, counterbalanced
+from mulmodal.stimulus import Light, StimulusRegistry, make_modality
 from numpy.random import uniform, choice
 
 
@@ -15,185 +20,130 @@ NOISE_IDX = 14
 CONTROLLER = "Controller"
 
 
-async def decision_period(agent: Agent, duration: float, correct: Any) -> bool:
-    ncorrect = 0
-    nerror = 0
+async def decision_period(agent: Agent, duration: float, correct: Any,
+                          rule: Optional[Rule] = None) -> bool:
+    if rule is None:
+        rule = Majority(duration)
+    rule.reset()
+    start = clock()
     while duration >= 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         mail = await agent.try_recv(duration)
-        required_time = perf_counter() - s
+        required_time = clock() - s
         duration -= required_time
         if mail is None:
             break
         _, response = mail
-        if response == correct:
-            ncorrect += 1
-        else:
-            nerror += 1
-    return ncorrect > nerror
+        rule.feed(clock() - start, response == correct)
+    return rule.result()
 
 
 async def control(agent: Agent, ino: Arduino, expvars: Experimental) -> None:
-    first_duration = expvars.get("first-duration", 1.)
-    second_duration = expvars.get("second-duration", 1.)
-    decision_duration = expvars.get("decision-duration", 0.5)
-    violation = expvars.get("violation", [0.])
-    diff_first_second = first_duration - second_duration
-    diff_second_decision = second_duration - decision_duration
-    reward_duration = expvars.get("reward-duration", 0.05)
-
-    p_free_trial = expvars.get("propotion-of-free-trial", 0.2)
-    light_pin = expvars.get("light-pin", [8, 9, 10, 11, 12])
-    reward_pin = expvars.get("reward-pin", [6, 7])
-    response_pins = list(map(str, expvars.get("response-pin", [-9, -10])))
-    speaker = Speaker(expvars.get("speaker", 6))
-    white_noise = make_white_noise(first_duration * 2.)  # Click音でも良い？
-
-    mean_isi = expvars.get("inter-stimulus-interval", 19.)
-    range_isi = expvars.get("interval-range", 10.)
-    nretry = expvars.get("number-of-retry", 5)
-
-    number_of_trial = expvars.get("number-of-trial", 200)
-    isis = unif_rng(mean_isi, range_isi, number_of_trial)
-    number_of_blocks = int(number_of_trial / (len(light_pin) * 2))
-    light_positions = blockwise_shuffle(light_pin * 2 * number_of_blocks,
-                                    len(light_pin))
-    stimulus_order = blockwise_shuffle(
-        sum([[0, 1] for _ in range(5)], []) * number_of_blocks,
-        len(light_pin) * 2)  # 0: light -> sound / 1: sound -> light
+    params: MainTaskParams = cached_task_params("main_task", expvars)
+    decision_rule = make_rule(params.decision_rule, params.decision_duration)
+    speaker = get_speaker(params.speaker)
+    modalities = [make_modality(spec, ino, speaker, params.first_duration * 2.)
+                  for spec in params.modalities]
+    for modality in modalities:
+        modality.preload()
+    # the positional modality (the LED) takes the light positions of the
+    # schedule, wherever it is listed; `MainTaskParams` checks there is one
+    lit = next(m for m in modalities if m.positional)
+    other = next(m for m in modalities if m is not lit)
+
+    light_pin = list(params.light_pin)
+    number_of_trial = params.number_of_trial
+    isis = unif_rng(params.inter_stimulus_interval, params.interval_range, number_of_trial)
+    # light position and stimulus order (1: light -> sound / 0: sound -> light)
+    # are counterbalanced jointly
+    factors = (light_pin, (0, 1))
+    if params.schedule_cache > 0:
+        schedule = cached_schedule(factors, number_of_trial, params.schedule_cache,
+                                   params.max_run_length,
+                                   int(config_hash("main_task", expvars), 16))
+    else:
+        schedule = counterbalanced(factors, number_of_trial, params.max_run_length)
+    light_positions, stimulus_order = zip(*schedule)
     trial_iterator = TrialIterator(list(range(number_of_trial)),
                                    list(zip(stimulus_order, light_positions, isis)))
 
-    upper_second_duration = expvars.get("upper-second-duration", 1.)
-    second_duration_sound = second_duration
-    second_duration_light = second_duration
-    diff_first_second_sound = diff_first_second
-    diff_first_second_light = diff_first_second
-    diff_second_decision_sound = diff_second_decision
-    diff_second_decision_light = diff_second_decision
-    delta = (upper_second_duration - second_duration) / (number_of_trial / 2)
+    # indexed by side: 0 when the first modality (light) leads, 1 otherwise
+    second_durations = [params.second_duration, params.second_duration]
+    first_duration = params.first_duration
+    decision_duration = params.decision_duration
+    violation = list(params.violation)
+    reward_pin = params.reward_pin
+    reward_duration = params.reward_duration
+    response_pins = params.response_pins
+    nretry = params.number_of_retry
+    delta = params.delta
+
+    registry = StimulusRegistry(agent)
+    # reward valves go through the registry too, so that `all_off` closes them
+    valves = [Light(ino, pin) for pin in reward_pin]
+    cue_deadline = first_duration * 2.
+
+    realtime = RealtimePhases(params.realtime_gc, params.allocation_profile)
+    realtime.freeze()
+    precision = use_precision(params.precision_threshold, params.spin_margin)
 
     try:
         while agent.working():
             agent.send_to(RECORDER, timestamp(START))
             for i, (is_light_first, light_position, isi) in trial_iterator:
                 noise = choice(violation, 1)[0]
-                if uniform() <= p_free_trial:
+                positional = lit.arm(light_position)
+                if is_light_first:
+                    first, second, side = positional, other.arm(), 0
+                else:
+                    first, second, side = other.arm(), positional, 1
+                diff_first_second = first_duration - second_durations[side]
+                diff_second_decision = second_durations[side] - decision_duration
+                if uniform() <= params.proportion_of_free_trial:
                     agent.send_to(RECORDER, timestamp(100))
                     print(f"Trial {i}: Cue will be presented {isi} secs after.")
-                    await flush_message_for(agent, isi)
-                    if is_light_first:
-                        agent.send_to(RECORDER, timestamp(light_position))
-                        ino.digital_write(light_position, HIGH)
-                        await agent.sleep(diff_first_second_sound - noise)
-                        agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                        speaker.play(white_noise, False, True)
-                        await agent.sleep(second_duration_sound + noise)
-                        agent.send_to(RECORDER, timestamp(-light_position))
-                        agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                        ino.digital_write(light_position, LOW)
-                        speaker.stop()
-                        await present_stimulus(agent, ino, reward_pin[0], reward_duration)
-                        second_duration_sound += delta
-                        diff_first_second_sound = first_duration - second_duration_sound
-                        diff_second_decision_sound = second_duration_sound - decision_duration
-                        continue
-                    else:
-                        agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                        speaker.play(white_noise, False, True)
-                        await agent.sleep(diff_first_second_light - noise)
-                        agent.send_to(RECORDER, timestamp(light_position))
-                        ino.digital_write(light_position, HIGH)
-                        await agent.sleep(second_duration_light + noise)
-                        agent.send_to(RECORDER, timestamp(-light_position))
-                        agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                        ino.digital_write(light_position, LOW)
-                        speaker.stop()
-                        await present_stimulus(agent, ino, reward_pin[1], reward_duration)
-                        second_duration_light += delta
-                        diff_first_second_light = first_duration - second_duration_light
-                        diff_second_decision_light = second_duration_light - decision_duration
-                        continue
+                    with realtime.phase("isi", collect=True):
+                        await flush_message_for(agent, isi)
+                    with realtime.phase("cue"):
+                        async with registry.hold(first, cue_deadline):
+                            await precise_sleep(agent, diff_first_second - noise)
+                            async with registry.hold(second, cue_deadline):
+                                await precise_sleep(agent, second_durations[side] + noise)
+                    with realtime.phase("reward"):
+                        await registry.pulse(valves[side], reward_duration)
+                    second_durations[side] += delta
+                    continue
                 for retry in range(nretry):
                     agent.send_to(RECORDER, timestamp(200))
                     print(f"Trial {i}: Cue will be presented {isi} secs after.")
-                    await flush_message_for(agent, isi)
-                        
-                    if is_light_first:
-                        if retry >= (nretry - 1):
-                            agent.send_to(RECORDER, timestamp(light_position))
-                            ino.digital_write(light_position, HIGH)
-                            await flush_message_for(agent, diff_first_second_sound - noise)
-                            agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                            speaker.play(white_noise, False, True)
-                            await flush_message_for(agent, second_duration_sound + noise)
-                            agent.send_to(RECORDER, timestamp(-light_position))
-                            agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                            ino.digital_write(light_position, LOW)
-                            speaker.stop()
-                            await present_stimulus(agent, ino, reward_pin[0], reward_duration)
-                            second_duration_sound += delta
-                            diff_first_second_sound = first_duration - second_duration_sound
-                            diff_second_decision_sound = second_duration_sound - decision_duration
-                            break
-
-                        agent.send_to(RECORDER, timestamp(light_position))
-                        ino.digital_write(light_position, HIGH)
-                        await flush_message_for(agent, diff_first_second_sound - noise)
-                        agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                        speaker.play(white_noise, False, True)
-                        await flush_message_for(agent, diff_second_decision_sound + noise)
-                        is_correct = await decision_period(agent, decision_duration, response_pins[0])
-                        agent.send_to(RECORDER, timestamp(-light_position))
-                        agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                        ino.digital_write(light_position, LOW)
-                        speaker.stop()
-                        if is_correct:
-                            agent.send_to(RECORDER, timestamp(201))
-                            await present_stimulus(agent, ino, reward_pin[0], reward_duration)
-                            second_duration_sound += delta
-                            diff_first_second_sound = first_duration - second_duration_sound
-                            diff_second_decision_sound = second_duration_sound - decision_duration
-                            break
-                        else:
-                            continue
-                    else:
-                        if retry >= (nretry - 1):
-                            agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                            speaker.play(white_noise, False, True)
-                            await flush_message_for(agent, diff_first_second_light - noise)
-                            agent.send_to(RECORDER, timestamp(light_position))
-                            ino.digital_write(light_position, HIGH)
-                            await flush_message_for(agent, second_duration_light + noise)
-                            agent.send_to(RECORDER, timestamp(-light_position))
-                            agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                            ino.digital_write(light_position, LOW)
-                            speaker.stop()
-                            await present_stimulus(agent, ino, reward_pin[1], reward_duration)
-                            second_duration_light += delta
-                            diff_first_second_light = first_duration - second_duration_light
-                            diff_second_decision_light = second_duration_light - decision_duration
-                            break
-                        agent.send_to(RECORDER, timestamp(NOISE_IDX))
-                        speaker.play(white_noise, False, True)
-                        await flush_message_for(agent, diff_first_second_light - noise)
-                        agent.send_to(RECORDER, timestamp(light_position))
-                        ino.digital_write(light_position, HIGH)
-                        await flush_message_for(agent, diff_second_decision_light + noise)
-                        is_correct = await decision_period(agent, decision_duration, response_pins[1])
-                        agent.send_to(RECORDER, timestamp(-light_position))
-                        agent.send_to(RECORDER, timestamp(-NOISE_IDX))
-                        ino.digital_write(light_position, LOW)
-                        speaker.stop()
+                    with realtime.phase("isi", collect=True):
+                        await flush_message_for(agent, isi)
+                    # the last retry is rewarded without a decision
+                    forced = retry >= (nretry - 1)
+                    is_correct = False
+                    async with registry.hold(first, cue_deadline):
+                        with realtime.phase("cue"):
+                            await flush_message_for(agent, diff_first_second - noise)
+                        async with registry.hold(second, cue_deadline):
+                            if forced:
+                                with realtime.phase("cue"):
+                                    await flush_message_for(agent, second_durations[side] + noise)
+                            else:
+                                with realtime.phase("cue"):
+                                    await flush_message_for(agent, diff_second_decision + noise)
+                                with realtime.phase("decision"):
+                                    is_correct = await decision_period(agent, decision_duration,
+                                                                       response_pins[side],
+                                                                       decision_rule)
+                    if forced or is_correct:
                         if is_correct:
                             agent.send_to(RECORDER, timestamp(201))
-                            await present_stimulus(agent, ino, reward_pin[1], reward_duration)
-                            second_duration_light += delta
-                            diff_first_second_light = first_duration - second_duration_light
-                            diff_second_decision_light = second_duration_light - decision_duration
-                            break
-                        else:
-                            continue
+                        with realtime.phase("reward"):
+                            await registry.pulse(valves[side], reward_duration)
+                        second_durations[side] += delta
+                        break
+            registry.print_report()
+            realtime.print_report()
             agent.send_to(OBSERVER, NEND)
             agent.send_to(RECORDER, timestamp(NEND))
             agent.finish()
@@ -201,20 +151,25 @@ async def control(agent: Agent, ino: Arduino, expvars: Experimental) -> None:
         agent.send_to(OBSERVER, ABEND)
         agent.send_to(RECORDER, timestamp(ABEND))
         agent.finish()
+    finally:
+        registry.all_off()
+        realtime.release()
+        use_precision(*precision)
     return None
 
 
 async def read(agent: Agent, ino: Arduino, expvars: Experimental):
-    response_pin = expvars.get("response-pin", [-9, -10])
+    response_pin = task_params("main_task", expvars).response_pin
 
     response_pins_str = list(map(str, response_pin))
+    codes = Codes(response_pins_str)
 
     try:
         while agent.working():
             input_: bytes = await agent.call_async(ino.read_until_eol)
             if input_ is None:
                 continue
-            parsed_input = input_.rstrip().decode("utf-8")
+            parsed_input = codes.parse(input_)
             if parsed_input in response_pins_str:
                 agent.send_to(CONTROLLER, parsed_input)
             agent.send_to(RECORDER, timestamp(parsed_input))
@@ -235,6 +190,8 @@ if __name__ == '__main__':
     from pino.ino import Arduino, Comport
 
     config = PinoClap().config
+    # fail on a bad config before the board is touched
+    task_params("main_task", config.experimental)
 
     com = Comport() \
         .apply_settings(config.comport) \
@@ -1,34 +1,35 @@
 import sounddevice as sd
 from amas.agent import Agent, NotWorkingError
 from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
-from comprex.audio import make_white_noise, Speaker
 from comprex.config import Experimental
 from comprex.scheduler import TrialIterator, blockwise_shuffle, unif_rng
 from comprex.util import timestamp
 from pino.ino import HIGH, LOW, Arduino
-from mulmodal.util import flush_message_for, fixed_interval_with_limit, present_stimulus
+from mulmodal.params import MainTaskTrainingParams, task_params
+from mulmodal.util import cached_white_noise, get_speaker, flush_message_for, fixed_interval_with_limit, present_stimulus
 
 NOISE_IDX = 14
 CONTROLLER = "Controller"
 
 
 async def control(agent: Agent, ino: Arduino, expvars: Experimental) -> None:
-    first_duration = expvars.get("first-duration", 1.)
-    second_duration = expvars.get("second-duration", 1.)
+    params: MainTaskTrainingParams = task_params("main_task_training", expvars)
+    first_duration = params.first_duration
+    second_duration = params.second_duration
     diff_first_second = first_duration - second_duration
-    reward_duration = expvars.get("reward-duration", 0.05)
-    postpone = expvars.get("postpone", .5)
+    reward_duration = params.reward_duration
+    postpone = params.postpone
 
-    light_pin = expvars.get("light-pin", [8, 9, 10, 11, 12])
-    reward_pin = expvars.get("reward-pin", [6, 7])
-    response_pins = list(map(str, expvars.get("response-pin", [-9, -10])))
-    speaker = Speaker(expvars.get("speaker", 6))
-    noise = make_white_noise(first_duration * 2.)  # Click音でも良い？
+    light_pin = list(params.light_pin)
+    reward_pin = list(params.reward_pin)
+    response_pins = list(map(str, params.response_pin))
+    speaker = get_speaker(params.speaker)
+    noise = cached_white_noise(first_duration * 2.)  # Click音でも良い？
 
-    mean_isi = expvars.get("inter-stimulus-interval", 19.)
-    range_isi = expvars.get("interval-range", 10.)
+    mean_isi = params.inter_stimulus_interval
+    range_isi = params.interval_range
 
-    number_of_trial = expvars.get("number-of-trial", 200)
+    number_of_trial = params.number_of_trial
     isis = unif_rng(mean_isi, range_isi, number_of_trial)
     number_of_blocks = int(number_of_trial / (len(light_pin) * 2))
     light_positions = blockwise_shuffle(light_pin * 2 * number_of_blocks,
@@ -86,7 +87,7 @@ async def control(agent: Agent, ino: Arduino, expvars: Experimental) -> None:
 
 
 async def read(agent: Agent, ino: Arduino, expvars: Experimental):
-    response_pin = expvars.get("response-pin", [-9, -10])
+    response_pin = task_params("main_task_training", expvars).response_pin
 
     response_pins_str = list(map(str, response_pin))
 
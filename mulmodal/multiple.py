@@ -0,0 +1,104 @@
+from typing import Any, Iterator, NamedTuple, Optional, Sequence
+from amas.agent import Agent
+from numpy import random as global_random
+from pino.ino import Arduino
+from mulmodal.stimulus import Light, Stimulus, StimulusRegistry
+from mulmodal.util import fixed_interval_with_postpone, fixed_time_with_postpone, \
+    flush_message_for
+
+
+# schedule -> (variable interval, wait primitive). Time schedules deliver the
+# reward when the interval ends; interval schedules wait for the first
+# correct response after it.
+SCHEDULES = {
+    "FT": (False, fixed_time_with_postpone),
+    "VT": (True, fixed_time_with_postpone),
+    "FI": (False, fixed_interval_with_postpone),
+    "VI": (True, fixed_interval_with_postpone),
+}
+
+
+class Component(NamedTuple):
+    kind: int
+    length: int  # number of rewards
+
+
+def alternating_components(nkinds: int, mean_length: int, range_length: int,
+                           number_of_rewards: int, rng: Any = None) -> Iterator[Component]:
+    # Component kinds cycle 0, 1, ..., nkinds - 1 with lengths drawn as they
+    # are needed; the last one is cut so that the lengths sum to the rewards.
+    rng = global_random if rng is None else rng
+    remaining = number_of_rewards
+    i = 0
+    while remaining > 0:
+        length = int(rng.uniform(mean_length - range_length, mean_length + range_length)) + 1
+        length = min(max(length, 1), remaining)
+        yield Component(i % nkinds, length)
+        remaining -= length
+        i += 1
+
+
+class MultipleSchedule(object):
+    # Runs components of a multiple schedule, or of a mixed schedule for kinds
+    # without stimuli. Per kind there is a schedule, a target response, a
+    # reward pin and a list of stimuli that successive components of the kind
+    # cycle through.
+    def __init__(self, agent: Agent, ino: Arduino, registry: StimulusRegistry,
+                 schedules: Sequence[str], stimuli: Sequence[Sequence[Stimulus]],
+                 targets: Sequence[Any], reward_pins: Sequence[int],
+                 mean_interval: float, range_interval: float,
+                 reward_duration: float, postpone: float = 0., gap: float = 0.,
+                 rng: Any = None):
+        for schedule in schedules:
+            if schedule not in SCHEDULES:
+                raise ValueError(f"Unknown schedule {schedule}, use one of {list(SCHEDULES)}")
+        self.agent = agent
+        self.ino = ino
+        self.registry = registry
+        self.schedules = [SCHEDULES[s] for s in schedules]
+        self.stimuli = stimuli
+        self.targets = targets
+        # reward valves are switched through the registry, like the stimuli
+        self.valves = [Light(ino, pin) for pin in reward_pins]
+        self.mean_interval = mean_interval
+        self.range_interval = range_interval
+        self.reward_duration = reward_duration
+        self.postpone = postpone
+        self.gap = gap
+        self.rng = global_random if rng is None else rng
+        self.occurrences = [0] * len(schedules)
+        self.rewards = 0
+
+    def interval(self, variable: bool) -> float:
+        if not variable:
+            return self.mean_interval
+        return self.rng.uniform(self.mean_interval - self.range_interval,
+                                self.mean_interval + self.range_interval)
+
+    def stimulus(self, kind: int) -> Optional[Stimulus]:
+        options = self.stimuli[kind]
+        if not options:
+            return None
+        stimulus = options[self.occurrences[kind] % len(options)]
+        self.occurrences[kind] += 1
+        return stimulus
+
+    async def component(self, kind: int, length: int) -> None:
+        variable, wait = self.schedules[kind]
+        stimulus = self.stimulus(kind)
+        if stimulus is not None:
+            self.registry.on(stimulus)
+        for _ in range(length):
+            interval = self.interval(variable)
+            print(f"Trial {self.rewards}: Reward will occur {interval} secs after.")
+            await wait(self.agent, interval, self.targets[kind], self.postpone)
+            await self.registry.pulse(self.valves[kind], self.reward_duration)
+            self.rewards += 1
+        if stimulus is not None:
+            self.registry.off(stimulus)
+
+    async def run(self, components: Iterator[Component]) -> None:
+        for i, (kind, length) in enumerate(components):
+            if i > 0 and self.gap > 0.:
+                await flush_message_for(self.agent, self.gap)
+            await self.component(kind, length)
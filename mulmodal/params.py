@@ -0,0 +1,314 @@
+from dataclasses import MISSING, dataclass, field, fields
+from difflib import get_close_matches
+from hashlib import sha1
+from json import dumps
+from os import makedirs
+from os.path import abspath, dirname, exists, join
+from pickle import dump, load
+from typing import Any, ClassVar, Mapping, Optional, get_args, get_origin
+
+
+CACHE_DIR = join(dirname(abspath(__file__)), "cache")
+# misspelled keys that older configs still use
+ALIASES = {"propotion-of-free-trial": "proportion-of-free-trial"}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+# Config keys are the field names with "-" for "_", unless a field sets
+# metadata={"key": ...}. Fields with init=False are derived in __post_init__.
+# `shared_keys` are keys of the tasks that share a sample config with this
+# one; they are ignored, and every other unknown key is rejected.
+@dataclass(frozen=True, slots=True)
+class PavlovianSoundParams:
+    # sample.yaml serves the pavlovian light tasks too
+    shared_keys: ClassVar[frozenset[str]] = frozenset({"light-duration", "light-pin"})
+    sound_duration: float = 1.
+    reward_duration: float = 0.03
+    speaker: int = 6
+    reward_pin: tuple[int, ...] = (2, 3)
+    inter_stimulus_interval: float = 19.
+    interval_range: float = 10.
+    number_of_trial: int = 120
+    response_pin: tuple[int, ...] = (-9, -10)
+
+
+@dataclass(frozen=True, slots=True)
+class PavlovianLightParams:
+    shared_keys: ClassVar[frozenset[str]] = frozenset({"sound-duration", "speaker"})
+    light_duration: float = 1.
+    reward_duration: float = 0.03
+    light_pin: tuple[int, ...] = (4, 5, 6, 7, 8)
+    reward_pin: tuple[int, ...] = (2, 3)
+    inter_stimulus_interval: float = 19.
+    interval_range: float = 10.
+    number_of_trial: int = 150
+    response_pin: tuple[int, ...] = (-9, -10)
+
+
+@dataclass(frozen=True, slots=True)
+class ComponentParams:
+    mean_component_length: int = 25
+    range_component_length: int = 10
+    # opt-in pause between components; the baseline ran them back to back
+    interval_between_component: float = 0.
+    inter_reward_interval: float = 10.
+    range_iri: float = field(default=5., metadata={"key": "range-IRI"})
+    number_of_rewards: int = 200
+    light_pin: tuple[int, ...] = (4, 5, 6, 7, 8)
+    reward_pin: tuple[int, ...] = (2, 3)
+    speaker: int = 6
+    response_pin: tuple[int, ...] = (-9, -10)
+    reward_duration: float = 0.01
+    postpone: float = 2.
+    # per component kind (light, noise): FT, VT, FI or VI
+    component_schedules: tuple[str, ...] = ("VT", "VT")
+
+    def __post_init__(self):
+        for schedule in self.component_schedules:
+            if schedule not in ("FT", "VT", "FI", "VI"):
+                raise ConfigError(f"component-schedules: unknown schedule {schedule}")
+
+
+@dataclass(frozen=True, slots=True)
+class DiscriminationParams:
+    light_duration: float = 1.
+    sound_duration: float = 1.
+    reward_duration: float = 0.05
+    postpone: float = 0.5
+    light_pin: tuple[int, ...] = (8, 9, 10, 11, 12)
+    reward_pin: tuple[int, ...] = (6, 7)
+    response_pin: tuple[int, ...] = (-9, -10)
+    speaker: int = 6
+    inter_stimulus_interval: float = 19.
+    interval_range: float = 10.
+    number_of_trial: int = 200
+
+
+@dataclass(frozen=True, slots=True)
+class ErrorDiscriminationParams(DiscriminationParams):
+    # a rule of `mulmodal.scoring`; without one, the first wrong response aborts
+    response_rule: Optional[str] = None
+
+    def __post_init__(self):
+        if self.response_rule is not None:
+            check_rule("response-rule", self.response_rule)
+
+
+@dataclass(frozen=True, slots=True)
+class MainTaskTrainingParams:
+    first_duration: float = 1.
+    second_duration: float = 1.
+    reward_duration: float = 0.05
+    postpone: float = 0.5
+    light_pin: tuple[int, ...] = (8, 9, 10, 11, 12)
+    reward_pin: tuple[int, ...] = (6, 7)
+    response_pin: tuple[int, ...] = (-9, -10)
+    speaker: int = 6
+    inter_stimulus_interval: float = 19.
+    interval_range: float = 10.
+    number_of_trial: int = 200
+
+
+@dataclass(frozen=True, slots=True)
+class AdaptiveMainTaskTrainingParams:
+    first_duration: float = 1.
+    initial_second_duration: float = 1.
+    last_second_duration: float = 1.
+    reward_duration: float = 0.05
+    postpone: float = 0.5
+    light_pin: tuple[int, ...] = (8, 9, 10, 11, 12)
+    reward_pin: tuple[int, ...] = (6, 7)
+    response_pin: tuple[int, ...] = (-9, -10)
+    speaker: int = 6
+    inter_stimulus_interval: float = 19.
+    interval_range: float = 10.
+    number_of_trial: int = 200
+
+
+@dataclass(frozen=True, slots=True)
+class MainTaskParams:
+    first_duration: float = 1.
+    second_duration: float = 1.
+    decision_duration: float = 0.5
+    decision_rule: str = "majority"
+    violation: tuple[float, ...] = (0., )
+    reward_duration: float = 0.05
+    proportion_of_free_trial: float = 0.2
+    light_pin: tuple[int, ...] = (8, 9, 10, 11, 12)
+    reward_pin: tuple[int, ...] = (6, 7)
+    response_pin: tuple[int, ...] = (-9, -10)
+    speaker: int = 6
+    modalities: tuple[Any, ...] = ("led", "noise")
+    inter_stimulus_interval: float = 19.
+    interval_range: float = 10.
+    number_of_retry: int = 5
+    number_of_trial: int = 200
+    upper_second_duration: float = 1.
+    max_run_length: int = 3
+    schedule_cache: int = 0
+    precision_threshold: float = 0.1
+    spin_margin: float = 0.002
+    realtime_gc: bool = False
+    allocation_profile: bool = False
+    # derived
+    response_pins: tuple[str, ...] = field(init=False)
+    delta: float = field(init=False)
+
+    def __post_init__(self):
+        from mulmodal.stimulus import check_modalities
+
+        check_rule("decision-rule", self.decision_rule)
+        problems = check_modalities(self.modalities)
+        if problems:
+            raise ConfigError(f"modalities: {'; '.join(problems)}")
+        object.__setattr__(self, "response_pins", tuple(map(str, self.response_pin)))
+        object.__setattr__(self, "delta", (self.upper_second_duration - self.second_duration) /
+                           (self.number_of_trial / 2))
+
+
+def check_rule(key: str, name: str) -> None:
+    from mulmodal.scoring import RULES
+
+    if name not in RULES:
+        close = get_close_matches(name, RULES, 1)
+        hint = f" (did you mean {close[0]}?)" if close else f", use one of {list(RULES)}"
+        raise ConfigError(f"{key}: unknown rule {name}{hint}")
+
+
+# task -> schema and the task's own defaults where they differ from it
+TASKS: dict[str, tuple[type, dict[str, Any]]] = {
+    "pavlovian_sound": (PavlovianSoundParams, {}),
+    "pavlovian_single_light": (PavlovianLightParams, {}),
+    "pavlovian_multi_light": (PavlovianLightParams,
+                              {"light-pin": [6, 7, 8, 9, 10], "number-of-trial": 120}),
+    "1st_step_of_training": (ComponentParams, {}),
+    "2nd_step_of_training": (ComponentParams, {"light-pin": [4, 5, 7, 8]}),
+    "3rd_step_of_training": (DiscriminationParams, {}),
+    "4th_step_of_training": (DiscriminationParams,
+                             {"light-pin": [4, 5, 6, 7, 8], "reward-pin": [2, 3]}),
+    "witherr.3rd_step_of_training": (ErrorDiscriminationParams, {}),
+    "witherr.4th_step_of_training": (ErrorDiscriminationParams,
+                                     {"light-pin": [4, 5, 6, 7, 8], "reward-pin": [2, 3]}),
+    "main_task_training": (MainTaskTrainingParams, {}),
+    "_main_task_training": (AdaptiveMainTaskTrainingParams, {}),
+    "main_task": (MainTaskParams, {}),
+}
+
+
+def config_key(f: Any) -> str:
+    return f.metadata.get("key", f.name.replace("_", "-"))
+
+
+def _as_dict(expvars: Any) -> dict[str, Any]:
+    if isinstance(expvars, Mapping):
+        return dict(expvars)
+    if hasattr(expvars, "items"):
+        return dict(expvars.items())
+    # e.g. a wrapper that keeps the yaml mapping in an attribute
+    for value in vars(expvars).values():
+        if isinstance(value, dict):
+            return dict(value)
+    raise ConfigError(f"Cannot read the keys of {type(expvars).__name__}")
+
+
+def _coerce(key: str, value: Any, annotation: Any) -> Any:
+    origin = get_origin(annotation)
+    if annotation is Any:
+        return tuple(value) if isinstance(value, list) else value
+    if annotation == Optional[str]:
+        return None if value is None else _coerce(key, value, str)
+    if annotation is str:
+        if not isinstance(value, str):
+            raise ConfigError(f"{key}: expected a string, got {value!r}")
+        return value
+    if origin is tuple:
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        item = get_args(annotation)[0]
+        return tuple(_coerce(key, v, item) for v in value)
+    if annotation is bool:
+        if not isinstance(value, bool):
+            raise ConfigError(f"{key}: expected true or false, got {value!r}")
+        return value
+    if annotation is int:
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ConfigError(f"{key}: expected an integer, got {value!r}")
+        return value
+    if annotation is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ConfigError(f"{key}: expected a number, got {value!r}")
+        return float(value)
+    return value
+
+
+def compile_params(schema: type, expvars: Any,
+                   defaults: Optional[dict[str, Any]] = None) -> Any:
+    raw = _as_dict(expvars)
+    for old, new in ALIASES.items():
+        if old in raw and new not in raw:
+            print(f"Config key {old} is deprecated, use {new}")
+            raw[new] = raw.pop(old)
+    settable = [f for f in fields(schema) if f.init]
+    keys = {config_key(f): f for f in settable}
+    shared = getattr(schema, "shared_keys", frozenset())
+    for k in [k for k in raw if k not in keys and k in shared]:
+        del raw[k]
+    unknown = [k for k in raw if k not in keys]
+    if unknown:
+        hints = []
+        for k in unknown:
+            close = get_close_matches(k, keys, 1)
+            hints.append(f"{k} (did you mean {close[0]}?)" if close else k)
+        raise ConfigError(f"Unknown keys for {schema.__name__}: {', '.join(hints)}")
+    values = dict(defaults or {})
+    values.update(raw)
+    kwargs = {}
+    for key, value in values.items():
+        f = keys[key]
+        kwargs[f.name] = _coerce(key, value, f.type)
+    for f in settable:
+        if f.name not in kwargs and f.default is MISSING and f.default_factory is MISSING:
+            raise ConfigError(f"Missing key for {schema.__name__}: {config_key(f)}")
+    return schema(**kwargs)
+
+
+def task_params(task: str, expvars: Any) -> Any:
+    name = task.removeprefix("mulmodal.")
+    if name not in TASKS:
+        raise ConfigError(f"No config schema for task {task}")
+    schema, defaults = TASKS[name]
+    return compile_params(schema, expvars, defaults)
+
+
+def config_hash(task: str, expvars: Any) -> str:
+    raw = {"task": task.removeprefix("mulmodal."), "config": _as_dict(expvars)}
+    return sha1(dumps(raw, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def schema_hash(task: str) -> str:
+    # changes with the schema's fields and the task's defaults, so that a
+    # cache written by an older version of the code is not read back
+    schema, defaults = TASKS[task.removeprefix("mulmodal.")]
+    raw = {"schema": [(f.name, str(f.type), repr(f.default)) for f in fields(schema)],
+           "defaults": defaults}
+    return sha1(dumps(raw, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def cache_path(task: str, expvars: Any, suffix: str) -> str:
+    return join(CACHE_DIR, f"{config_hash(task, expvars)}-{schema_hash(task)}.{suffix}")
+
+
+def cached_task_params(task: str, expvars: Any) -> Any:
+    # compiled once per config and kept next to the compiled schedules
+    path = cache_path(task, expvars, "params.pickle")
+    if exists(path):
+        with open(path, "rb") as f:
+            return load(f)
+    params = task_params(task, expvars)
+    makedirs(CACHE_DIR, exist_ok=True)
+    with open(path, "wb") as f:
+        dump(params, f)
+    return params
@@ -3,30 +3,23 @@ from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
 from comprex.config import Experimental
 from comprex.scheduler import TrialIterator, blockwise_shuffle, unif_rng
 from comprex.util import timestamp
-from pino.ino import HIGH, LOW, OUTPUT, Arduino
-
-
-async def present_stimulus(agent: Agent, ino: Arduino, pin: int,
-                           duration: float) -> None:
-    ino.digital_write(pin, HIGH)
-    agent.send_to(RECORDER, timestamp(pin))
-    await agent.sleep(duration)
-    ino.digital_write(pin, LOW)
-    agent.send_to(RECORDER, timestamp(-pin))
-    return None
+from pino.ino import OUTPUT, Arduino
+from mulmodal.params import PavlovianLightParams, task_params
+from mulmodal.util import present_stimulus
 
 
 async def control(agent: Agent, ino: Arduino, expvars: Experimental) -> None:
-    light_duration = expvars.get("light-duration", 1.)
-    reward_duration = expvars.get("reward-duration", 0.03)
+    params: PavlovianLightParams = task_params("pavlovian_multi_light", expvars)
+    light_duration = params.light_duration
+    reward_duration = params.reward_duration
 
-    light_pins = expvars.get("light-pin", [6, 7, 8, 9, 10])
-    reward_pin = expvars.get("reward-pin", [2, 3])[1]
+    light_pins = list(params.light_pin)
+    reward_pin = params.reward_pin[1]
 
-    mean_isi = expvars.get("inter-stimulus-interval", 19.)
-    range_isi = expvars.get("interval-range", 10.)
+    mean_isi = params.inter_stimulus_interval
+    range_isi = params.interval_range
 
-    number_of_trial = expvars.get("number-of-trial", 120)
+    number_of_trial = params.number_of_trial
     number_of_blocks = int(number_of_trial / len(light_pins))
     light_order = blockwise_shuffle(light_pins * number_of_blocks,
                                     len(light_pins))
@@ -1,36 +1,28 @@
 from amas.agent import Agent, NotWorkingError
 from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
-from comprex.audio import Speaker, make_white_noise
 from comprex.config import Experimental
 from comprex.scheduler import TrialIterator, unif_rng
 from comprex.util import timestamp
-from pino.ino import HIGH, LOW, Arduino
+from pino.ino import Arduino
+from mulmodal.params import PavlovianSoundParams, task_params
+from mulmodal.util import cached_white_noise, get_speaker, present_stimulus
 
 
 NOISE_IDX = 14
 
-async def present_stimulus(agent: Agent, ino: Arduino, pin: int,
-                           duration: float) -> None:
-    ino.digital_write(pin, HIGH)
-    agent.send_to(RECORDER, timestamp(pin))
-    await agent.sleep(duration)
-    ino.digital_write(pin, LOW)
-    agent.send_to(RECORDER, timestamp(-pin))
-    return None
-
-
 async def control(agent: Agent, ino: Arduino, expvars: Experimental) -> None:
-    sound_duration = expvars.get("sound-duration", 1.)
-    reward_duration = expvars.get("reward-duration", 0.03)
+    params: PavlovianSoundParams = task_params("pavlovian_sound", expvars)
+    sound_duration = params.sound_duration
+    reward_duration = params.reward_duration
 
-    speaker = Speaker(expvars.get("speaker", 6))
-    noise = make_white_noise(sound_duration)
-    reward_pin = expvars.get("reward-pin", [2, 3])[0]
+    speaker = get_speaker(params.speaker)
+    noise = cached_white_noise(sound_duration)
+    reward_pin = params.reward_pin[0]
 
-    mean_isi = expvars.get("inter-stimulus-interval", 19.)
-    range_isi = expvars.get("interval-range", 10.)
+    mean_isi = params.inter_stimulus_interval
+    range_isi = params.interval_range
 
-    number_of_trial = expvars.get("number-of-trial", 120)
+    number_of_trial = params.number_of_trial
     isis = unif_rng(mean_isi, range_isi, number_of_trial)
     trial_iterator = TrialIterator(list(range(number_of_trial)), isis)
 
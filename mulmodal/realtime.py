@@ -0,0 +1,94 @@
+import gc
+from contextlib import contextmanager
+from sys import getallocatedblocks
+from tracemalloc import Snapshot, is_tracing, start, stop, take_snapshot
+from typing import Iterator, Optional
+
+
+class RealtimePhases(object):
+    # Keeps the cyclic GC out of timing-critical phases of a trial.
+    #
+    # After setup, `freeze` collects once and moves every live object to the
+    # permanent generation, then disables automatic collection. Collections
+    # only happen on entering a phase opened with `collect=True` (the ISI).
+    #
+    # With `profile`, each phase also counts the net number of GC-tracked
+    # objects and memory blocks it allocated, whether or not automatic GC is
+    # on: a collection resets the count, so it is carried over from a GC
+    # callback. With `trace`, tracemalloc
+    # snapshots give the allocation sites per phase (slow, for profiling only).
+    def __init__(self, enabled: bool = True, profile: bool = False,
+                 trace: bool = False):
+        self.enabled = enabled
+        self.profile = profile or trace
+        self.trace = trace
+        self.counts: dict[str, list[int]] = {}
+        self.sites: dict[str, dict[str, int]] = {}
+        self._was_enabled = gc.isenabled()
+        # GC-tracked objects counted before the collections since `freeze`
+        self._collected = 0
+
+    def freeze(self) -> None:
+        if self.enabled:
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+        if self.profile:
+            gc.callbacks.append(self._on_collect)
+        if self.trace and not is_tracing():
+            start()
+
+    def release(self) -> None:
+        if self.enabled:
+            gc.unfreeze()
+            if self._was_enabled:
+                gc.enable()
+        if self.profile and self._on_collect in gc.callbacks:
+            gc.callbacks.remove(self._on_collect)
+        if self.trace and is_tracing():
+            stop()
+
+    def _on_collect(self, phase: str, info: dict) -> None:
+        if phase == "start":
+            self._collected += gc.get_count()[0]
+
+    def _allocated(self) -> int:
+        return self._collected + gc.get_count()[0]
+
+    @contextmanager
+    def phase(self, name: str, collect: bool = False) -> Iterator[None]:
+        if self.enabled and collect:
+            gc.collect()
+        if not self.profile:
+            yield
+            return
+        snapshot: Optional[Snapshot] = take_snapshot() if self.trace else None
+        objects = self._allocated()
+        blocks = getallocatedblocks()
+        try:
+            yield
+        finally:
+            new_objects = self._allocated() - objects
+            counts = self.counts.setdefault(name, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += max(new_objects, 0)
+            counts[2] += getallocatedblocks() - blocks
+            if snapshot is not None:
+                sites = self.sites.setdefault(name, {})
+                for stat in take_snapshot().compare_to(snapshot, "lineno")[:10]:
+                    if stat.count_diff > 0:
+                        site = str(stat.traceback)
+                        sites[site] = sites.get(site, 0) + stat.count_diff
+
+    def report(self) -> dict[str, tuple[int, float, float]]:
+        # phase -> (times entered, objects and blocks per entry)
+        return {name: (n, objects / n, blocks / n)
+                for name, (n, objects, blocks) in self.counts.items()}
+
+    def print_report(self) -> None:
+        for name, (n, objects, blocks) in self.report().items():
+            print(f"Phase {name}: {n} times, {objects:.1f} objects and "
+                  f"{blocks:.1f} blocks allocated per entry")
+            for site, count in sorted(self.sites.get(name, {}).items(),
+                                      key=lambda x: -x[1])[:5]:
+                print(f"    {count:6d} {site}")
@@ -0,0 +1,176 @@
+from os import close, dup, fsync
+from os.path import exists, splitext
+from queue import Queue
+from threading import Thread
+from typing import Any, IO, Iterable, Iterator, Optional
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import RECORDER, _self_terminate
+from mulmodal.util import clock
+
+
+HEADER = "time, event\n"
+
+
+def part_name(filename: str, part: int) -> str:
+    if part == 0:
+        return filename
+    root, ext = splitext(filename)
+    return f"{root}.{part:03d}{ext}"
+
+
+def session_parts(filename: str) -> list[str]:
+    parts = []
+    while exists(part_name(filename, len(parts))):
+        parts.append(part_name(filename, len(parts)))
+    return parts
+
+
+def iter_events(filename: str) -> Iterator[tuple[float, str]]:
+    # A rotated session is read back as one stream.
+    for path in session_parts(filename) or [filename]:
+        with open(path, "r") as f:
+            for line in f:
+                # rows may carry extra columns, e.g. board time (see `mulmodal.hwclock`)
+                time, _, rest = line.partition(",")
+                try:
+                    t = float(time)
+                except ValueError:
+                    # header or a truncated line
+                    continue
+                yield t, rest.partition(",")[0].strip()
+
+
+def read_events(filename: str) -> list[tuple[float, str]]:
+    return list(iter_events(filename))
+
+
+def write_events(filename: str, events: Iterable[tuple[float, Any]]) -> None:
+    with open(filename, "w") as f:
+        f.write(HEADER)
+        for t, e in events:
+            f.write(f"{t}, {e}\n")
+
+
+class _Syncer(Thread):
+    # Only fsyncs. The writer flushes its file on its own thread and hands
+    # over a duplicate of the descriptor, which stays valid after the file
+    # is closed and is closed here once it is synced.
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.requests: Queue = Queue()
+
+    def run(self) -> None:
+        while True:
+            fd = self.requests.get()
+            if fd is None:
+                break
+            try:
+                fsync(fd)
+            except OSError:
+                pass
+            finally:
+                close(fd)
+
+    def sync(self, f: IO, force: bool = False) -> None:
+        # plain syncs are coalesced so that a slow disk cannot make the
+        # request queue grow; the last sync of a part is forced
+        if force or self.requests.qsize() < 2:
+            self.requests.put(dup(f.fileno()))
+
+    def stop(self) -> None:
+        self.requests.put(None)
+        self.join()
+
+
+class RotatingWriter(object):
+    def __init__(self, filename: str, chunk_size: int = 256,
+                 max_bytes: int = 64 * 2 ** 20, max_seconds: float = 3600.):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.part = 0
+        self.buffer: list[tuple] = []
+        self.plain = True
+        self.syncer = _Syncer()
+        self.syncer.start()
+        self._open()
+
+    def _open(self) -> None:
+        self.file = open(part_name(self.filename, self.part), "w")
+        self.file.write(HEADER)
+        self.written = len(HEADER)
+        self.opened = clock()
+
+    def _rotate(self) -> None:
+        self.syncer.sync(self.file, force=True)
+        self.file.close()
+        self.part += 1
+        self._open()
+
+    def write(self, t: float, event: Any, *extra: Any) -> None:
+        self.append((t, event, *extra))
+
+    def append(self, row: tuple) -> None:
+        # rows are kept as they came and formatted a chunk at a time
+        self.buffer.append(row)
+        if len(row) != 2:
+            self.plain = False
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def format(self) -> str:
+        if self.plain:
+            # one format over the chunk instead of a string per row
+            flat = [x for row in self.buffer for x in row]
+            return ("%s, %s\n" * len(self.buffer)) % tuple(flat)
+        return "".join(f"{', '.join(map(str, row))}\n" for row in self.buffer)
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return None
+        chunk = self.format()
+        self.buffer.clear()
+        self.plain = True
+        self.file.write(chunk)
+        self.file.flush()
+        self.written += len(chunk)
+        if self.written >= self.max_bytes or \
+                clock() - self.opened >= self.max_seconds:
+            self._rotate()
+        else:
+            self.syncer.sync(self.file)
+
+    def close(self) -> None:
+        self.flush()
+        self.file.flush()
+        self.syncer.sync(self.file, force=True)
+        self.file.close()
+        self.syncer.stop()
+
+
+async def _record(agent: Agent, writer: RotatingWriter,
+                  flush_interval: float = 1.) -> None:
+    try:
+        while agent.working():
+            mail = await agent.try_recv(flush_interval)
+            if mail is None:
+                writer.flush()
+                continue
+            _, message = mail
+            if isinstance(message, tuple):
+                writer.append(message)
+    except NotWorkingError:
+        pass
+    finally:
+        writer.close()
+
+
+class StreamingRecorder(Agent):
+    def __init__(self, filename: str, chunk_size: int = 256,
+                 max_bytes: int = 64 * 2 ** 20, max_seconds: float = 3600.,
+                 flush_interval: float = 1., addr: Optional[str] = None):
+        super().__init__(addr or RECORDER)
+        writer = RotatingWriter(filename, chunk_size, max_bytes, max_seconds)
+        self.assign_task(_record, writer=writer, flush_interval=flush_interval) \
+            .assign_task(_self_terminate)
@@ -0,0 +1,82 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+from os import devnull
+from typing import NamedTuple, Optional
+from comprex.agent import START
+from mulmodal.recorder import read_events
+from mulmodal.session import SessionConfig, load_config
+from mulmodal.virtual import run_task_virtually
+
+
+class ReplayResult(NamedTuple):
+    filename: str
+    recorded: dict[str, int]
+    replayed: dict[str, int]
+    recorded_duration: float
+    replayed_duration: float
+
+
+def response_stream(events: list[tuple[float, str]],
+                    response_pins: list[str]) -> list[tuple[float, str]]:
+    if not events:
+        return []
+    start = str(START)
+    origin = next((t for t, e in events if e == start), events[0][0])
+    return [(t - origin, e) for t, e in events
+            if e in response_pins and t >= origin]
+
+
+def count_events(events: list[tuple[float, str]]) -> dict[str, int]:
+    return dict(Counter(str(e) for _, e in events))
+
+
+def replay_session(filename: str, task: str, config: SessionConfig,
+                   seed: Optional[int] = None) -> ReplayResult:
+    response_pins = list(map(str, config.experimental.get("response-pin", [-9, -10])))
+    events = read_events(filename)
+    inputs = [(t, e.encode()) for t, e in response_stream(events, response_pins)]
+    with open(devnull, "w") as f, redirect_stdout(f):
+        session = run_task_virtually(task, config, inputs, seed)
+    recorded_duration = events[-1][0] - events[0][0] if events else 0.
+    return ReplayResult(filename, count_events(events),
+                        count_events(session.records),
+                        recorded_duration, session.duration)
+
+
+def replay_many(filenames: list[str], task: str, config: SessionConfig,
+                seed: Optional[int] = None,
+                workers: Optional[int] = None) -> list[ReplayResult]:
+    replay = partial(replay_session, task=task, config=config, seed=seed)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(replay, filenames, chunksize=4))
+
+
+def print_results(results: list[ReplayResult], codes: list[str]) -> None:
+    for r in results:
+        diffs = ", ".join(f"{c}: {r.recorded.get(c, 0)} -> {r.replayed.get(c, 0)}"
+                          for c in codes)
+        print(f"{r.filename}: {diffs} "
+              f"({r.recorded_duration:.1f} s -> {r.replayed_duration:.1f} s)")
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from time import perf_counter
+
+    parser = ArgumentParser(description="Replay recorded responses through a task's control.")
+    parser.add_argument("files", nargs="+", help="recorder files to replay")
+    parser.add_argument("--task", "-t", default="main_task")
+    parser.add_argument("--yaml", "-y", required=True, help="config the task is replayed with")
+    parser.add_argument("--seed", "-s", type=int, default=None)
+    parser.add_argument("--workers", "-w", type=int, default=None)
+    parser.add_argument("--codes", "-c", nargs="+", default=["100", "200", "201"],
+                        help="event codes to compare")
+    args = parser.parse_args()
+
+    config = load_config(args.yaml)
+    s = perf_counter()
+    results = replay_many(args.files, args.task, config, args.seed, args.workers)
+    print_results(results, args.codes)
+    print(f"Replayed {len(results)} sessions in {perf_counter() - s:.1f} s")
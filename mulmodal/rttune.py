@@ -0,0 +1,105 @@
+import os
+from ctypes import CDLL, get_errno
+from ctypes.util import find_library
+from typing import Iterable, NamedTuple, Optional
+
+
+# from <sys/mman.h>
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+POLICIES = {
+    "other": getattr(os, "SCHED_OTHER", None),
+    "batch": getattr(os, "SCHED_BATCH", None),
+    "fifo": getattr(os, "SCHED_FIFO", None),
+    "rr": getattr(os, "SCHED_RR", None),
+}
+
+
+class Tuning(NamedTuple):
+    # what was actually applied; `notes` says what was not and why
+    role: str
+    cpus: Optional[list[int]]
+    policy: str
+    priority: int
+    nice: int
+    locked: bool
+    notes: list[str]
+
+
+def lock_memory() -> None:
+    # mlockall(MCL_CURRENT | MCL_FUTURE): no page faults on memory the
+    # process has or will get, at the cost of pinning it in RAM
+    libc = CDLL(find_library("c"), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        errno = get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def tune(role: str, cpus: Optional[Iterable[int]] = None, policy: str = "other",
+         priority: int = 0, nice: Optional[int] = None, lock: bool = False) -> Tuning:
+    # Applies to the calling thread on Linux, and to the threads and
+    # processes it starts later. Every setting is optional and is skipped
+    # with a note when the platform or the permissions do not allow it.
+    notes = []
+    if cpus is not None:
+        try:
+            os.sched_setaffinity(0, set(cpus))
+        except AttributeError:
+            notes.append("CPU affinity is not supported here")
+        except OSError as e:
+            notes.append(f"CPU affinity {sorted(cpus)}: {e.strerror}")
+    if policy != "other" or priority:
+        number = POLICIES.get(policy)
+        if number is None:
+            notes.append(f"Scheduling policy {policy} is not supported here")
+        else:
+            try:
+                os.sched_setscheduler(0, number, os.sched_param(priority))
+            except OSError as e:
+                # e.g. no CAP_SYS_NICE and no RLIMIT_RTPRIO for this user
+                notes.append(f"Scheduling {policy} at {priority}: {e.strerror}")
+    if nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+        except OSError as e:
+            notes.append(f"Nice {nice}: {e.strerror}")
+    locked = False
+    if lock:
+        try:
+            lock_memory()
+            locked = True
+        except (AttributeError, OSError, TypeError) as e:
+            notes.append(f"Memory lock: {getattr(e, 'strerror', None) or e}")
+    return current(role, locked, notes)
+
+
+def current(role: str, locked: bool = False, notes: Optional[list[str]] = None) -> Tuning:
+    # the settings in effect for the calling thread
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    policy, priority = "other", 0
+    if hasattr(os, "sched_getscheduler"):
+        number = os.sched_getscheduler(0)
+        policy = next((k for k, v in POLICIES.items() if v == number), str(number))
+        priority = os.sched_getparam(0).sched_priority
+    nice = os.getpriority(os.PRIO_PROCESS, 0) if hasattr(os, "getpriority") else 0
+    return Tuning(role, cpus, policy, priority, nice, locked, notes or [])
+
+
+def tune_role(config: Optional[dict], role: str) -> Optional[Tuning]:
+    # from a `Realtime` block, e.g.
+    #   controller: {cpus: [2], policy: fifo, priority: 50, lock-memory: true}
+    settings = (config or {}).get(role)
+    if settings is None:
+        return None
+    return tune(role, settings.get("cpus"), settings.get("policy", "other"),
+                settings.get("priority", 0), settings.get("nice"),
+                settings.get("lock-memory", False))
+
+
+def print_tuning(tuning: Tuning) -> None:
+    cpus = ",".join(map(str, tuning.cpus)) if tuning.cpus is not None else "any"
+    print(f"{tuning.role}: CPUs {cpus}, {tuning.policy} priority {tuning.priority}, "
+          f"nice {tuning.nice}, memory {'locked' if tuning.locked else 'not locked'}")
+    for note in tuning.notes:
+        print(f"    not applied: {note}")
+
@@ -0,0 +1,141 @@
+from itertools import product
+from os import makedirs
+from os.path import dirname, exists, join
+from typing import Any, Optional, Sequence
+from numpy import arange, asarray, concatenate, cumsum, empty, int8, load, ndarray, \
+    save, zeros
+from numpy import random as global_random
+from numpy.random import default_rng
+from mulmodal.params import CACHE_DIR
+
+
+# A schedule is an int array (trials, factors) of level indices. Every block
+# of `prod(levels)` trials is a permutation of the full factor crossing, so
+# the factors are counterbalanced jointly and not only one by one. A last,
+# shorter block takes distinct cells of the crossing, so no trial is dropped
+# when the number of trials is not a multiple of the block size.
+def crossing(levels: Sequence[int]) -> ndarray:
+    return asarray(list(product(*[range(n) for n in levels])), dtype=int8)
+
+
+def varied(levels: Sequence[int]) -> list[int]:
+    # a factor with a single level cannot but repeat it, so runs are only
+    # limited for the others
+    return [i for i, n in enumerate(levels) if n > 1]
+
+
+def run_violations(schedules: ndarray, max_run: int,
+                   factors: Optional[Sequence[int]] = None) -> ndarray:
+    # rows of (n, trials, factors) where one of `factors` (all by default)
+    # keeps its level for more than `max_run` trials in a row
+    if factors is not None:
+        schedules = schedules[:, :, list(factors)]
+    if max_run <= 0 or schedules.shape[1] <= max_run or schedules.shape[2] == 0:
+        return zeros(schedules.shape[0], dtype=bool)
+    same = (schedules[:, 1:] == schedules[:, :-1]).astype(int8)
+    c = cumsum(same, axis=1, dtype="i4")
+    c = concatenate([zeros((c.shape[0], 1, c.shape[2]), dtype=c.dtype), c], axis=1)
+    window = c[:, max_run:] - c[:, :-max_run]
+    return (window >= max_run).any(axis=(1, 2))
+
+
+def _backtrack(cells: ndarray, head: ndarray, size: int, max_run: int,
+               rng: Any, factors: Sequence[int], budget: int = 100000) -> Optional[ndarray]:
+    # depth-first search over the order of `size` of `cells`, continuing `head`
+    order: list[int] = []
+    used = zeros(len(cells), dtype=bool)
+    candidates = [rng.permutation(len(cells))]
+    steps = 0
+    while candidates:
+        steps += 1
+        if steps > budget:
+            return None
+        if len(order) == size:
+            return cells[order]
+        options = candidates[-1]
+        if len(options) == 0:
+            candidates.pop()
+            if order:
+                used[order.pop()] = False
+            continue
+        i, candidates[-1] = options[0], options[1:]
+        if used[i]:
+            continue
+        if max_run > 0 and factors:
+            tail = concatenate([head, cells[order]])[-max_run:, factors]
+            if len(tail) == max_run and (tail == cells[i, factors]).all(axis=0).any():
+                continue
+        order.append(i)
+        used[i] = True
+        candidates.append(rng.permutation(len(cells)))
+    return None
+
+
+def generate_schedules(levels: Sequence[int], ntrials: int, count: int = 1,
+                       max_run: int = 0, rng: Any = None,
+                       max_attempts: int = 50) -> ndarray:
+    # Blocks are drawn for all schedules at once; schedules whose new block
+    # breaks the run-length limit redraw only that block, and the few that
+    # keep failing are finished by backtracking.
+    rng = global_random if rng is None else rng
+    cells = crossing(levels)
+    factors = varied(levels)
+    size = len(cells)
+    schedules = empty((count, ntrials, len(levels)), dtype=int8)
+    for start in range(0, ntrials, size):
+        n = min(size, ntrials - start)
+        lo = max(start - max_run, 0)
+        pending = arange(count)
+        for _ in range(max_attempts):
+            order = rng.random((len(pending), size)).argsort(axis=1)[:, :n]
+            schedules[pending, start:start + n] = cells[order]
+            bad = run_violations(schedules[pending, lo:start + n], max_run, factors)
+            pending = pending[bad]
+            if len(pending) == 0:
+                break
+        for row in pending:
+            block = _backtrack(cells, schedules[row, lo:start], n, max_run, rng, factors)
+            if block is None:
+                raise ValueError(f"No schedule of {ntrials} trials over {list(levels)} "
+                                 f"levels has runs of at most {max_run}")
+            schedules[row, start:start + n] = block
+    return schedules
+
+
+def load_schedules(path: str, levels: Sequence[int], ntrials: int,
+                   count: int = 1000, max_run: int = 0, seed: int = 0) -> ndarray:
+    # Generated once and memory-mapped afterwards, so that picking one at
+    # session start costs no search.
+    if exists(path):
+        schedules = load(path, mmap_mode="r")
+        if schedules.shape == (count, ntrials, len(levels)):
+            return schedules
+    # a seeded generator of its own keeps the session's random state
+    # untouched and makes the file reproducible
+    schedules = generate_schedules(levels, ntrials, count, max_run, default_rng(seed))
+    makedirs(dirname(path), exist_ok=True)
+    save(path, schedules)
+    return schedules
+
+
+def pick_schedule(schedules: ndarray, factors: Sequence[Sequence[Any]],
+                  rng: Any = None) -> list[tuple]:
+    rng = global_random if rng is None else rng
+    row = schedules[int(rng.random() * len(schedules))]
+    return [tuple(factor[i] for factor, i in zip(factors, trial)) for trial in row]
+
+
+def counterbalanced(factors: Sequence[Sequence[Any]], ntrials: int,
+                    max_run: int = 0, rng: Any = None) -> list[tuple]:
+    schedules = generate_schedules([len(f) for f in factors], ntrials, 1, max_run, rng)
+    return pick_schedule(schedules, factors, rng)
+
+
+def cached_schedule(factors: Sequence[Sequence[Any]], ntrials: int, count: int = 1000,
+                    max_run: int = 0, seed: int = 0) -> list[tuple]:
+    # Schedules only depend on the numbers of levels and the seed; a task
+    # seeds them from its config hash, so the same config gets the same file.
+    levels = [len(f) for f in factors]
+    name = f"{'x'.join(map(str, levels))}-{ntrials}-{max_run}-{count}-{seed:x}.schedules.npy"
+    schedules = load_schedules(join(CACHE_DIR, name), levels, ntrials, count, max_run, seed)
+    return pick_schedule(schedules, factors)
@@ -0,0 +1,206 @@
+from typing import Any, Optional, Union
+from numpy import bincount, diff, float64, int64, ndarray, searchsorted, unique, \
+    zeros, asarray
+
+
+# Every rule can be used online, fed one response at a time while a window is
+# open, and offline over a whole session at once. Both forms use the same
+# arithmetic in the same order, so they agree exactly on the same input.
+class Rule(object):
+    name = ""
+
+    def __init__(self, duration: float = 0.5):
+        self.duration = duration
+        self.reset()
+
+    def reset(self) -> None:
+        return None
+
+    def feed(self, latency: float, correct: bool) -> None:
+        raise NotImplementedError
+
+    def result(self) -> bool:
+        raise NotImplementedError
+
+    def batch(self, latency: ndarray, correct: ndarray, window: ndarray,
+              nwindows: int) -> ndarray:
+        raise NotImplementedError
+
+
+class FirstResponse(Rule):
+    name = "first-response"
+
+    def reset(self) -> None:
+        self.first: Optional[bool] = None
+
+    def feed(self, latency: float, correct: bool) -> None:
+        if self.first is None:
+            self.first = correct
+
+    def result(self) -> bool:
+        return bool(self.first)
+
+    def batch(self, latency: ndarray, correct: ndarray, window: ndarray,
+              nwindows: int) -> ndarray:
+        scores = zeros(nwindows, dtype=bool)
+        windows, first = unique(window, return_index=True)
+        scores[windows] = correct[first]
+        return scores
+
+
+class Majority(Rule):
+    name = "majority"
+
+    def reset(self) -> None:
+        self.ncorrect = 0
+        self.nerror = 0
+
+    def feed(self, latency: float, correct: bool) -> None:
+        if correct:
+            self.ncorrect += 1
+        else:
+            self.nerror += 1
+
+    def result(self) -> bool:
+        return self.ncorrect > self.nerror
+
+    def _counts(self, correct: ndarray, window: ndarray,
+                nwindows: int) -> tuple[ndarray, ndarray]:
+        ncorrect = bincount(window[correct], minlength=nwindows)
+        nerror = bincount(window[~correct], minlength=nwindows)
+        return ncorrect, nerror
+
+    def batch(self, latency: ndarray, correct: ndarray, window: ndarray,
+              nwindows: int) -> ndarray:
+        ncorrect, nerror = self._counts(correct, window, nwindows)
+        return ncorrect > nerror
+
+
+class RateDifference(Majority):
+    name = "rate-difference"
+
+    def __init__(self, duration: float = 0.5, min_rate: float = 2.):
+        self.min_rate = min_rate
+        super().__init__(duration)
+
+    def result(self) -> bool:
+        return (self.ncorrect - self.nerror) / self.duration >= self.min_rate
+
+    def batch(self, latency: ndarray, correct: ndarray, window: ndarray,
+              nwindows: int) -> ndarray:
+        ncorrect, nerror = self._counts(correct, window, nwindows)
+        return (ncorrect - nerror) / self.duration >= self.min_rate
+
+
+class LatencyWeighted(Rule):
+    name = "latency-weighted"
+
+    # Weights are tau / (tau + latency) rather than an exponential so that
+    # they are computed with correctly rounded operations only.
+    def __init__(self, duration: float = 0.5, tau: float = 0.2):
+        self.tau = tau
+        super().__init__(duration)
+
+    def reset(self) -> None:
+        self.score = 0.
+
+    def feed(self, latency: float, correct: bool) -> None:
+        w = self.tau / (self.tau + latency)
+        self.score += w if correct else -w
+
+    def result(self) -> bool:
+        return self.score > 0.
+
+    def batch(self, latency: ndarray, correct: ndarray, window: ndarray,
+              nwindows: int) -> ndarray:
+        w = self.tau / (self.tau + latency)
+        w[~correct] *= -1.
+        return bincount(window, weights=w, minlength=nwindows) > 0.
+
+
+class HoldDuration(Rule):
+    name = "hold-duration"
+
+    # Consecutive responses on the same side closer than `max_gap` are taken
+    # as one continuous hold.
+    def __init__(self, duration: float = 0.5, max_gap: float = 0.1,
+                 min_hold: float = 0.1):
+        self.max_gap = max_gap
+        self.min_hold = min_hold
+        super().__init__(duration)
+
+    def reset(self) -> None:
+        self.hold_correct = 0.
+        self.hold_error = 0.
+        self.last: Optional[tuple[float, bool]] = None
+
+    def feed(self, latency: float, correct: bool) -> None:
+        if self.last is not None:
+            last_latency, last_correct = self.last
+            gap = latency - last_latency
+            if last_correct == correct and gap <= self.max_gap:
+                if correct:
+                    self.hold_correct += gap
+                else:
+                    self.hold_error += gap
+        self.last = (latency, correct)
+
+    def result(self) -> bool:
+        return self.hold_correct - self.hold_error >= self.min_hold
+
+    def batch(self, latency: ndarray, correct: ndarray, window: ndarray,
+              nwindows: int) -> ndarray:
+        gap = diff(latency)
+        held = (window[1:] == window[:-1]) & (correct[1:] == correct[:-1]) & \
+            (gap <= self.max_gap)
+        gap_window = window[1:]
+        gap_correct = correct[1:]
+        hold_correct = bincount(gap_window[held & gap_correct],
+                                weights=gap[held & gap_correct],
+                                minlength=nwindows)
+        hold_error = bincount(gap_window[held & ~gap_correct],
+                              weights=gap[held & ~gap_correct],
+                              minlength=nwindows)
+        return hold_correct - hold_error >= self.min_hold
+
+
+RULES: dict[str, type[Rule]] = {
+    r.name: r for r in (FirstResponse, Majority, RateDifference,
+                        LatencyWeighted, HoldDuration)
+}
+
+
+def make_rule(spec: Union[str, dict, None], duration: float = 0.5) -> Rule:
+    # `spec` is a rule name or a mapping such as
+    # {"name": "latency-weighted", "tau": 0.2} taken from the experimental config
+    if spec is None:
+        return Majority(duration)
+    if isinstance(spec, str):
+        return RULES[spec](duration)
+    params = {k.replace("-", "_"): v for k, v in spec.items() if k != "name"}
+    return RULES[spec["name"]](duration, **params)
+
+
+def assign_windows(times: ndarray, responses: ndarray, starts: ndarray,
+                   duration: float, correct: Union[ndarray, Any]
+                   ) -> tuple[ndarray, ndarray, ndarray]:
+    # Maps each response to the window [start, start + duration] it falls in.
+    # `correct` is the correct response, either one for all windows or one
+    # per window. Returns latency, correctness and window index, in time order.
+    times = asarray(times, dtype=float64)
+    starts = asarray(starts, dtype=float64)
+    window = searchsorted(starts, times, side="right").astype(int64) - 1
+    inside = window >= 0
+    inside[inside] &= times[inside] <= starts[window[inside]] + duration
+    window = window[inside]
+    latency = times[inside] - starts[window]
+    correct = asarray(correct)
+    target = correct[window] if correct.ndim > 0 else correct
+    return latency, asarray(responses)[inside] == target, window
+
+
+def score_session(rule: Rule, times: ndarray, responses: ndarray,
+                  starts: ndarray, correct: Union[ndarray, Any]) -> ndarray:
+    latency, is_correct, window = assign_windows(times, responses, starts,
+                                                 rule.duration, correct)
+    return rule.batch(latency, is_correct, window, len(starts))
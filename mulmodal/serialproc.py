@@ -0,0 +1,243 @@
+from asyncio import Event, TimeoutError, get_running_loop, wait_for
+from multiprocessing import get_context
+from multiprocessing.reduction import DupFd
+from multiprocessing.shared_memory import SharedMemory
+from os import close, pipe, read, write
+from select import select
+from time import perf_counter
+from typing import Any, Iterable, Optional
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import RECORDER
+from numpy import dtype, int64, ndarray
+from mulmodal.events import Codes
+from mulmodal.fdserial import serial_fileno
+from mulmodal.hwclock import BoardClock, parse_line
+from mulmodal.rttune import print_tuning, tune_role
+
+
+CONTROLLER = "Controller"
+# longest line a slot holds; board-time lines ("-9,4294967295") are well within
+MAX_LINE = 64
+# head, tail, the number of events dropped because the ring was full and the
+# number of lines rejected because they were longer than a slot
+_HEADER = 4
+
+
+def event_dtype(max_line: int = MAX_LINE) -> dtype:
+    return dtype([("time", "f8"), ("line", f"S{max_line}")])
+
+
+class EventRing(object):
+    # Single-producer/single-consumer ring in shared memory. The producer
+    # only moves `head` and the consumer only moves `tail`.
+    def __init__(self, capacity: int = 4096, name: Optional[str] = None,
+                 max_line: int = MAX_LINE):
+        event = event_dtype(max_line)
+        size = _HEADER * 8 + capacity * event.itemsize
+        self.owner = name is None
+        self.shm = SharedMemory(name=name, create=self.owner, size=size)
+        self.capacity = capacity
+        self.max_line = max_line
+        # the consumer's; lines come stripped from the producer
+        self.codes = Codes()
+        self.header: ndarray = ndarray((_HEADER, ), int64, self.shm.buf, 0)
+        self.slots: ndarray = ndarray((capacity, ), event, self.shm.buf, _HEADER * 8)
+        if self.owner:
+            self.header[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def dropped(self) -> int:
+        return int(self.header[2])
+
+    @property
+    def overlong(self) -> int:
+        return int(self.header[3])
+
+    def put(self, t: float, line: bytes) -> bool:
+        if len(line) > self.max_line:
+            # a slot would silently cut it short
+            self.header[3] += 1
+            return False
+        head, tail = self.header[0], self.header[1]
+        if head - tail >= self.capacity:
+            self.header[2] += 1
+            return False
+        slot = self.slots[head % self.capacity]
+        slot["time"] = t
+        slot["line"] = line
+        self.header[0] = head + 1
+        return True
+
+    def drain(self) -> list[tuple[float, str]]:
+        head, tail = int(self.header[0]), int(self.header[1])
+        events = []
+        for i in range(tail, head):
+            slot = self.slots[i % self.capacity]
+            events.append((float(slot["time"]), self.codes.parse(slot["line"])))
+        self.header[1] = head
+        return events
+
+    def close(self) -> None:
+        del self.header, self.slots
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _detach(fd: Any) -> int:
+    return fd.detach()
+
+
+class _PassFd(object):
+    # A file descriptor handed to a spawned child, where it unpickles as
+    # the int of the child's copy.
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __reduce__(self) -> tuple:
+        return _detach, (DupFd(self.fd), )
+
+
+def _serial_loop(port: int, ring_name: str, capacity: int, max_line: int, notify: int,
+                 stop: Any, realtime: Optional[dict] = None, poll: float = 0.1) -> None:
+    # Runs in a spawned process, which shares no threads or locks with the
+    # session's. It reads the port's file descriptor, which pyserial opened
+    # non-blocking, and attaches to the ring by name.
+    ring = EventRing(capacity, ring_name, max_line)
+    tuning = tune_role(realtime, "reader")
+    if tuning is not None:
+        print_tuning(tuning)
+    # ready: lines from now on are stamped as they come in
+    write(notify, b"\0")
+    buffer = b""
+    # the rest of an overlong line, up to its line ending, is dropped too
+    skipping = False
+    try:
+        while not stop.is_set():
+            ready, _, _ = select([port], [], [], poll)
+            if not ready:
+                continue
+            try:
+                data = read(port, 4096)
+            except (BlockingIOError, InterruptedError):
+                continue
+            # stamped as soon as the line is complete, before anything else
+            t = perf_counter()
+            if not data:
+                # the board went away
+                break
+            *lines, buffer = (buffer + data).split(b"\n")
+            for line in lines:
+                if skipping:
+                    skipping = False
+                    continue
+                line = line.rstrip()
+                if line:
+                    ring.put(t, line)
+            if len(buffer) > max_line and not skipping:
+                # no line ending in sight; counted as an overlong line
+                ring.put(t, buffer)
+                skipping = True
+            if skipping:
+                buffer = b""
+            if lines:
+                write(notify, b"\0")
+    finally:
+        ring.close()
+        close(port)
+        close(notify)
+
+
+class SerialProcess(object):
+    # Reads lines from the board in a spawned process, which gets a copy of
+    # the port's file descriptor and only reads from it; the parent keeps
+    # writing to the port (e.g. `digital_write`) as before.
+    def __init__(self, ino: Any, capacity: int = 4096, realtime: Optional[dict] = None,
+                 max_line: int = MAX_LINE):
+        self.ino = ino
+        self.ring = EventRing(capacity, max_line=max_line)
+        self.ctx = get_context("spawn")
+        self.stop_event = self.ctx.Event()
+        self._notify_r, self._notify_w = pipe()
+        self.process = self.ctx.Process(target=_serial_loop,
+                                        args=(_PassFd(serial_fileno(ino)), self.ring.name,
+                                              capacity, max_line, _PassFd(self._notify_w),
+                                              self.stop_event, realtime),
+                                        daemon=True)
+        self._ready: Optional[Event] = None
+
+    def start(self, timeout: float = 10.) -> "SerialProcess":
+        # Waits until the child is ready, which takes a new interpreter's
+        # start-up; lines that come in before are stamped late.
+        self.process.start()
+        ready, _, _ = select([self._notify_r], [], [], timeout)
+        if not ready:
+            self.stop()
+            raise RuntimeError(f"Serial reader did not start within {timeout} s")
+        read(self._notify_r, 1)
+        return self
+
+    def _on_notify(self) -> None:
+        read(self._notify_r, 4096)
+        if self._ready is not None:
+            self._ready.set()
+
+    async def get(self, timeout: float = 1.) -> list[tuple[float, str]]:
+        if self._ready is None:
+            self._ready = Event()
+            get_running_loop().add_reader(self._notify_r, self._on_notify)
+        events = self.ring.drain()
+        if events:
+            return events
+        self._ready.clear()
+        try:
+            await wait_for(self._ready.wait(), timeout)
+        except TimeoutError:
+            pass
+        return self.ring.drain()
+
+    def stop(self) -> None:
+        if self._ready is not None:
+            get_running_loop().remove_reader(self._notify_r)
+            self._ready = None
+        self.stop_event.set()
+        self.process.join(2.)
+        if self.process.is_alive():
+            self.process.terminate()
+        close(self._notify_r)
+        close(self._notify_w)
+        self.ring.close()
+
+
+async def read_in_process(agent: Agent, ino: Any, response_pins: Iterable[Any] = (-9, -10),
+                          forward: bool = True, capacity: int = 4096,
+                          board_time: bool = False, realtime: Optional[dict] = None,
+                          max_line: int = MAX_LINE, clock_forgetting: float = 0.99,
+                          clock_window: int = 256) -> None:
+    response_pins_str = list(map(str, response_pins))
+    board_clock = BoardClock(clock_forgetting, clock_window)
+    serial = SerialProcess(ino, capacity, realtime, max_line).start()
+    try:
+        while agent.working():
+            for t, line in await serial.get():
+                parsed_input, micros = parse_line(line) if board_time else (line, None)
+                if forward and parsed_input in response_pins_str:
+                    agent.send_to(CONTROLLER, parsed_input)
+                if micros is None:
+                    agent.send_to(RECORDER, (t, parsed_input))
+                else:
+                    board = board_clock.update(micros, t)
+                    agent.send_to(RECORDER, (t, parsed_input, micros, board))
+    except NotWorkingError:
+        pass
+    finally:
+        if serial.ring.dropped:
+            print(f"Serial reader dropped {serial.ring.dropped} events")
+        if serial.ring.overlong:
+            print(f"Serial reader rejected {serial.ring.overlong} lines longer than "
+                  f"{serial.ring.max_line} bytes")
+        serial.stop()
@@ -0,0 +1,335 @@
+from importlib import import_module
+from os import mkdir
+from os.path import abspath, dirname, exists, join, splitext
+from time import perf_counter, time
+from types import ModuleType
+from typing import Awaitable, Callable, NamedTuple, Optional
+from amas.agent import Agent
+from amas.connection import Register
+from amas.env import Environment
+from comprex.agent import ABEND, READER, RECORDER, Observer, Reader, Recorder, \
+    _self_terminate
+from comprex.util import namefile
+from pino.ino import Arduino, Comport
+from yaml import safe_load
+from mulmodal.bus import Bus, BusAgent, read_to_bus, response_ranges
+from mulmodal.catalog import Catalog
+from mulmodal.curves import LearningCurves
+from mulmodal.fdserial import FdReader
+from mulmodal.hwclock import read_with_board_time
+from mulmodal.loopprof import PROFILER, profile_loop
+from mulmodal.params import task_params
+from mulmodal.recorder import StreamingRecorder
+from mulmodal.rttune import print_tuning, tune_role
+from mulmodal.serialproc import MAX_LINE, read_in_process
+from mulmodal.util import get_speaker
+from mulmodal.watchdog import Progress, monitored, watchdog_agent
+
+
+CONTROLLER = "Controller"
+
+
+class SessionConfig(NamedTuple):
+    comport: dict
+    experimental: dict
+    metadata: dict
+    pinmode: dict
+
+
+class SessionEntry(NamedTuple):
+    task: str
+    config: SessionConfig
+
+
+def load_config(path: str, metadata: Optional[dict] = None) -> SessionConfig:
+    with open(path, "r") as f:
+        raw = safe_load(f) or {}
+    meta = dict(raw.get("Metadata", {}))
+    meta.update(metadata or {})
+    return SessionConfig(dict(raw.get("Comport", {})),
+                         dict(raw.get("Experimental", {})),
+                         meta,
+                         dict(raw.get("PinMode", {})))
+
+
+def load_task(name: str) -> ModuleType:
+    # Task scripts are named like `1st_step_of_training`, which cannot be
+    # imported with a plain `import` statement.
+    if not name.startswith("mulmodal."):
+        name = f"mulmodal.{name}"
+    return import_module(name)
+
+
+class QueueConfig(NamedTuple):
+    comport: dict
+    recorder: Optional[dict]
+    reader: Optional[dict]
+    watchdog: Optional[dict]
+    profiler: Optional[dict]
+    realtime: Optional[dict]
+    bus: Optional[dict]
+    entries: list[SessionEntry]
+
+
+def load_queue(path: str) -> QueueConfig:
+    with open(path, "r") as f:
+        raw = safe_load(f) or {}
+    root = dirname(abspath(path))
+    entries = []
+    for session in raw.get("Sessions", []):
+        config_path = session["config"]
+        if not exists(config_path):
+            config_path = join(root, config_path)
+        config = load_config(config_path, session.get("metadata"))
+        # every entry is checked before the queue connects to the board
+        task_params(session["task"], config.experimental)
+        entries.append(SessionEntry(session["task"], config))
+    comport = dict(raw.get("Comport", {}))
+    if not comport and entries:
+        comport = entries[0].config.comport
+    return QueueConfig(comport, raw.get("Recorder"), raw.get("Reader"),
+                       raw.get("Watchdog"), raw.get("Profiler"), raw.get("Realtime"),
+                       raw.get("Bus"), entries)
+
+
+def connect(comport: dict, timeout: float = 1.0) -> Arduino:
+    com = Comport() \
+        .apply_settings(comport) \
+        .set_timeout(timeout) \
+        .deploy() \
+        .connect()
+    return Arduino(com)
+
+
+def data_file(task: ModuleType, metadata: dict) -> str:
+    data_dir = join(dirname(abspath(task.__file__)), "data")
+    if not exists(data_dir):
+        mkdir(data_dir)
+    return join(data_dir, namefile(metadata))
+
+
+def build_agents(task: ModuleType, ino: Arduino, config: SessionConfig,
+                 filename: str, recorder: Optional[dict] = None,
+                 reader: Optional[dict] = None,
+                 watchdog: Optional[dict] = None,
+                 profiler: Optional[dict] = None,
+                 realtime: Optional[dict] = None,
+                 bus: Optional[Bus] = None) -> list[Agent]:
+    # With a bus, the controller and reader publish their events once and the
+    # recorder, the controller (responses) and any other subscriber get them
+    # from it. Without one, BusAgent is a plain Agent.
+    # With a watchdog, the controller's and reader's loops report their
+    # progress (see `mulmodal.watchdog`).
+    params = task_params(task.__name__, config.experimental)
+    progress = {addr: Progress(addr) for addr in (CONTROLLER, READER)} \
+        if watchdog is not None else {}
+
+    def watched(f: Callable[..., Awaitable], addr: str) -> Callable[..., Awaitable]:
+        return monitored(f, progress[addr]) if addr in progress else f
+
+    controller = BusAgent(CONTROLLER, bus) \
+        .assign_task(watched(task.control, CONTROLLER), ino=ino,
+                     expvars=config.experimental) \
+        .assign_task(_self_terminate)
+
+    read = getattr(task, "read", None)
+    reader = reader or {}
+    board_time = reader.get("board-time", False)
+    # settings of the board clock, which only readers with board time use
+    clock_settings = {"clock_forgetting": reader.get("clock-forgetting", 0.99),
+                      "clock_window": reader.get("clock-window", 256)}
+    # whether the reader built here forwards responses to the controller
+    forwards = read is not None
+    if reader.get("process", False):
+        # responses are forwarded to the controller only by tasks with their own `read`
+        reader_ = BusAgent(READER, bus) \
+            .assign_task(watched(read_in_process, READER), ino=ino,
+                         response_pins=params.response_pin,
+                         forward=forwards and bus is None,
+                         capacity=reader.get("capacity", 4096),
+                         board_time=board_time, realtime=realtime,
+                         max_line=reader.get("max-line", MAX_LINE), **clock_settings) \
+            .assign_task(_self_terminate)
+    elif reader.get("fd", False):
+        # waits on the event loop itself, which the watchdog probes
+        progress.pop(READER, None)
+        reader_ = FdReader(ino, params.response_pin, forward=forwards and bus is None,
+                           board_time=board_time, bus=bus, **clock_settings)
+    elif board_time:
+        reader_ = BusAgent(READER, bus) \
+            .assign_task(watched(read_with_board_time, READER), ino=ino,
+                         response_pins=params.response_pin, forward=forwards and bus is None,
+                         **clock_settings) \
+            .assign_task(_self_terminate)
+    elif read is None:
+        forwards = False
+        # comprex's Reader cannot be watched; `read_to_bus` does the same
+        reader_ = Reader(ino=ino) if bus is None and not progress else \
+            BusAgent(READER, bus) \
+            .assign_task(watched(read_to_bus, READER), ino=ino) \
+            .assign_task(_self_terminate)
+    else:
+        # the task's own `read` forwards responses itself
+        forwards = False
+        reader_ = BusAgent(READER, bus) \
+            .assign_task(watched(read, READER), ino=ino, expvars=config.experimental) \
+            .assign_task(_self_terminate)
+    if bus is not None:
+        bus.subscribe(RECORDER)
+        if forwards:
+            bus.subscribe(CONTROLLER, response_ranges(params.response_pin), code_only=True)
+
+    # rows with board time have extra columns, which only StreamingRecorder writes
+    if recorder is None and board_time:
+        recorder = {}
+    if recorder is None:
+        recorder_ = Recorder(filename=filename)
+    else:
+        recorder_ = StreamingRecorder(filename,
+                                      recorder.get("chunk-size", 256),
+                                      recorder.get("max-bytes", 64 * 2 ** 20),
+                                      recorder.get("max-seconds", 3600.),
+                                      recorder.get("flush-interval", 1.))
+    observer = Observer()
+    agents = [controller, reader_, recorder_]
+    if profiler is not None:
+        profiler_ = Agent(PROFILER) \
+            .assign_task(profile_loop, filename=f"{splitext(filename)[0]}.loop.folded",
+                         interval=profiler.get("interval", 0.01),
+                         probe=profiler.get("probe", 0.05),
+                         threshold=profiler.get("threshold", 0.01)) \
+            .assign_task(_self_terminate)
+        agents.append(profiler_)
+    if watchdog is None:
+        return agents + [observer]
+
+    # the task's speaker, with its default when the config leaves it out
+    speakers = [get_speaker(params.speaker)] if hasattr(params, "speaker") else []
+    watchdog_ = watchdog_agent(ino, progress.values(), config.pinmode, speakers, watchdog)
+    return agents + [watchdog_, observer]
+
+
+class SessionReport(NamedTuple):
+    task: str
+    filename: str
+    setup: float
+    duration: float
+    turnaround: float
+    aborted: bool
+
+
+def run_session(ino: Arduino, entry: SessionEntry, recorder: Optional[dict] = None,
+                reader: Optional[dict] = None,
+                watchdog: Optional[dict] = None,
+                profiler: Optional[dict] = None,
+                realtime: Optional[dict] = None,
+                bus: Optional[dict] = None) -> tuple[str, float, float, bool]:
+    task = load_task(entry.task)
+    ino.apply_pinmode_settings(entry.config.pinmode)
+    filename = data_file(task, entry.config.metadata)
+    agents = build_agents(task, ino, entry.config, filename, recorder, reader, watchdog,
+                          profiler, realtime, Bus() if bus is not None else None)
+    observer = agents[-1]
+    Register(agents)
+    env = Environment(agents)
+    aborted = False
+    started = perf_counter()
+    try:
+        env.run()
+    except KeyboardInterrupt:
+        observer.send_all(ABEND)
+        observer.finish()
+        aborted = True
+    ended = perf_counter()
+    try:
+        with Catalog() as catalog:
+            catalog.add(filename, entry.task, entry.config.metadata, entry.config.experimental,
+                        aborted=aborted)
+    except Exception as e:
+        # the data file is what matters; the catalog can be backfilled
+        print(f"Could not add {filename} to the catalog: {e}")
+    subject = entry.config.metadata.get("subject")
+    if subject is not None:
+        try:
+            reward_pins = task_params(entry.task, entry.config.experimental).reward_pin
+            LearningCurves().fold_file(subject, entry.task, filename, reward_pins, time())
+        except Exception as e:
+            print(f"Could not update the learning curve of {subject}: {e}")
+    return filename, started, ended, aborted
+
+
+class SessionQueue(object):
+    def __init__(self, ino: Arduino, entries: list[SessionEntry],
+                 recorder: Optional[dict] = None, reader: Optional[dict] = None,
+                 watchdog: Optional[dict] = None, profiler: Optional[dict] = None,
+                 realtime: Optional[dict] = None, bus: Optional[dict] = None):
+        self.ino = ino
+        self.entries = entries
+        self.recorder = recorder
+        self.reader = reader
+        self.watchdog = watchdog
+        self.profiler = profiler
+        self.realtime = realtime
+        self.bus = bus
+        self.reports: list[SessionReport] = []
+
+    def tune(self) -> None:
+        # The controller's settings apply to this process, and so to the
+        # event loop and the executor threads it starts later. The reader
+        # can only have its own when it runs in a process.
+        tuning = tune_role(self.realtime, "controller")
+        if tuning is not None:
+            print_tuning(tuning)
+        if (self.realtime or {}).get("reader") and not (self.reader or {}).get("process"):
+            print("reader: not applied: the reader has its own settings only with "
+                  "`process: true` under Reader")
+
+    def run(self) -> list[SessionReport]:
+        self.tune()
+        previous_end: Optional[float] = None
+        for i, entry in enumerate(self.entries):
+            setup_start = perf_counter()
+            subject = entry.config.metadata.get("subject", "")
+            print(f"Session {i}: {entry.task} ({subject})")
+            filename, started, ended, aborted = run_session(self.ino, entry, self.recorder,
+                                                           self.reader, self.watchdog,
+                                                           self.profiler, self.realtime,
+                                                           self.bus)
+            # Turnaround is the dead time between the end of one session and
+            # the start of the next one, including building its agents.
+            turnaround = 0. if previous_end is None else started - previous_end
+            previous_end = ended
+            self.reports.append(SessionReport(entry.task, filename,
+                                              started - setup_start,
+                                              ended - started, turnaround,
+                                              aborted))
+            if aborted:
+                break
+        return self.reports
+
+
+def print_reports(reports: list[SessionReport]) -> None:
+    for i, r in enumerate(reports):
+        status = "aborted" if r.aborted else "done"
+        print(f"Session {i}: {r.task} {status} in {r.duration:.1f} s "
+              f"(setup {r.setup * 1e3:.1f} ms, turnaround {r.turnaround * 1e3:.1f} ms)")
+    turnarounds = [r.turnaround for r in reports[1:]]
+    if turnarounds:
+        mean = sum(turnarounds) / len(turnarounds)
+        print(f"Mean inter-session turnaround: {mean * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Run a queue of sessions on one connection.")
+    parser.add_argument("queue", help="yaml file listing the sessions to run")
+    args = parser.parse_args()
+
+    queue_config = load_queue(args.queue)
+    ino = connect(queue_config.comport)
+    queue = SessionQueue(ino, queue_config.entries, queue_config.recorder,
+                         queue_config.reader, queue_config.watchdog,
+                         queue_config.profiler, queue_config.realtime,
+                         queue_config.bus)
+    print_reports(queue.run())
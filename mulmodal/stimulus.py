@@ -0,0 +1,261 @@
+from asyncio import TimerHandle, get_running_loop
+from contextlib import asynccontextmanager
+from inspect import signature
+from typing import Any, AsyncIterator, Iterable, Optional, Union
+from amas.agent import Agent
+from comprex.agent import RECORDER
+from comprex.audio import PureTone
+from numpy import float32, zeros
+from pino.ino import HIGH, LOW, Arduino
+from mulmodal.util import cached_white_noise, clock, precise_sleep
+
+
+class Stimulus(object):
+    # `code` is what the recorder gets at onset; offset is recorded as -code.
+    def __init__(self, code: int):
+        self.code = code
+
+    def turn_on(self) -> None:
+        raise NotImplementedError
+
+    def turn_off(self) -> None:
+        raise NotImplementedError
+
+
+class Light(Stimulus):
+    def __init__(self, ino: Arduino, pin: int):
+        super().__init__(pin)
+        self.ino = ino
+        self.pin = pin
+
+    def turn_on(self) -> None:
+        self.ino.digital_write(self.pin, HIGH)
+
+    def turn_off(self) -> None:
+        self.ino.digital_write(self.pin, LOW)
+
+
+class Sound(Stimulus):
+    def __init__(self, speaker: Any, sound: Any, code: int, loop: bool = True):
+        super().__init__(code)
+        self.speaker = speaker
+        self.sound = sound
+        self.loop = loop
+
+    def turn_on(self) -> None:
+        self.speaker.play(self.sound, False, self.loop)
+
+    def turn_off(self) -> None:
+        self.speaker.stop()
+
+
+class StimulusRegistry(object):
+    # Keeps track of every stimulus that is on, so that all of them can be
+    # switched off at once when a session ends or is aborted.
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.active: dict[Stimulus, tuple[float, Optional[TimerHandle]]] = {}
+        self.history: list[tuple[int, float, float]] = []
+
+    def on(self, stimulus: Stimulus, deadline: Optional[float] = None) -> Stimulus:
+        if stimulus in self.active:
+            return stimulus
+        stimulus.turn_on()
+        onset = clock()
+        self.agent.send_to(RECORDER, (onset, stimulus.code))
+        timer = None
+        if deadline is not None:
+            timer = get_running_loop().call_later(deadline, self.off, stimulus)
+        self.active[stimulus] = (onset, timer)
+        return stimulus
+
+    def off(self, stimulus: Stimulus) -> None:
+        entry = self.active.pop(stimulus, None)
+        if entry is None:
+            return None
+        onset, timer = entry
+        if timer is not None:
+            timer.cancel()
+        stimulus.turn_off()
+        offset = clock()
+        self.agent.send_to(RECORDER, (offset, -stimulus.code))
+        self.history.append((stimulus.code, onset, offset))
+
+    def all_off(self) -> None:
+        # outputs first, bookkeeping after, so that nothing stays on longer
+        # than it takes to write to every pin
+        stimuli = list(self.active.items())
+        self.active.clear()
+        for stimulus, _ in stimuli:
+            stimulus.turn_off()
+        offset = clock()
+        for stimulus, (onset, timer) in stimuli:
+            if timer is not None:
+                timer.cancel()
+            self.agent.send_to(RECORDER, (offset, -stimulus.code))
+            self.history.append((stimulus.code, onset, offset))
+
+    @asynccontextmanager
+    async def hold(self, stimulus: Stimulus,
+                   deadline: Optional[float] = None) -> AsyncIterator[Stimulus]:
+        self.on(stimulus, deadline)
+        try:
+            yield stimulus
+        finally:
+            self.off(stimulus)
+
+    async def pulse(self, stimulus: Stimulus, duration: float) -> None:
+        # e.g. a reward valve, which `all_off` closes if the wait is aborted
+        async with self.hold(stimulus):
+            await precise_sleep(self.agent, duration)
+
+    def report(self) -> dict[int, tuple[int, float, float]]:
+        # code -> (number of presentations, mean and max time on)
+        durations: dict[int, list[float]] = {}
+        for code, onset, offset in self.history:
+            durations.setdefault(code, []).append(offset - onset)
+        return {code: (len(d), sum(d) / len(d), max(d)) for code, d in durations.items()}
+
+    def print_report(self) -> None:
+        for code, (n, mean, longest) in sorted(self.report().items()):
+            print(f"Stimulus {code}: {n} times, on for {mean:.4f} s on average "
+                  f"(longest {longest:.4f} s)")
+
+
+# Modalities are stimuli with a lifecycle that keeps expensive work out of
+# the trial: `preload` once per session (e.g. building sound buffers), `arm`
+# in the ISI (e.g. choosing the LED position), then `turn_on`/`turn_off`,
+# which only write a pin or start a preloaded buffer.
+class Modality(Stimulus):
+    kind = ""
+    # takes the light position of each trial at `arm`
+    positional = False
+
+    def preload(self) -> None:
+        return None
+
+    def arm(self, position: Optional[int] = None) -> "Modality":
+        return self
+
+
+class LedModality(Modality, Light):
+    kind = "led"
+    positional = True
+
+    def __init__(self, ino: Arduino, pin: int = 0):
+        Light.__init__(self, ino, pin)
+
+    def arm(self, position: Optional[int] = None) -> "Modality":
+        if position is not None:
+            self.pin = self.code = position
+        return self
+
+
+class VibrotactileModality(Modality, Light):
+    kind = "vibration"
+
+    def __init__(self, ino: Arduino, pin: int):
+        Light.__init__(self, ino, pin)
+
+
+class NoiseModality(Modality, Sound):
+    kind = "noise"
+
+    def __init__(self, speaker: Any, duration: float, code: int = 14):
+        Sound.__init__(self, speaker, None, code)
+        self.duration = duration
+
+    def preload(self) -> None:
+        self.sound = cached_white_noise(self.duration)
+
+
+class ToneModality(Modality, Sound):
+    kind = "tone"
+
+    def __init__(self, speaker: Any, duration: float, frequency: float = 440.,
+                 code: int = 15):
+        Sound.__init__(self, speaker, None, code)
+        self.duration = duration
+        self.frequency = frequency
+
+    def preload(self) -> None:
+        self.sound = PureTone(self.frequency, self.duration)
+
+
+class ClickTrainModality(Modality, Sound):
+    kind = "click"
+
+    def __init__(self, speaker: Any, duration: float, rate: float = 20.,
+                 click_width: float = 0.001, samplerate: int = 44100,
+                 code: int = 16):
+        Sound.__init__(self, speaker, None, code)
+        self.duration = duration
+        self.rate = rate
+        self.click_width = click_width
+        self.samplerate = samplerate
+
+    def preload(self) -> None:
+        n = int(self.duration * self.samplerate)
+        period = max(int(self.samplerate / self.rate), 1)
+        width = max(int(self.click_width * self.samplerate), 1)
+        train = zeros(n, dtype=float32)
+        for onset in range(0, n, period):
+            train[onset:onset + width] = 1.
+        self.sound = train
+
+
+MODALITIES: dict[str, type[Modality]] = {
+    m.kind: m for m in (LedModality, VibrotactileModality, NoiseModality,
+                        ToneModality, ClickTrainModality)
+}
+# passed by `make_modality` rather than set in the config
+_PROVIDED = {"self", "ino", "speaker", "duration"}
+
+
+def _spec(spec: Union[str, dict]) -> dict:
+    return {"kind": spec} if isinstance(spec, str) else dict(spec)
+
+
+def check_modalities(specs: Iterable[Union[str, dict]]) -> list[str]:
+    # What the main task needs: two modalities, one of them positional, every
+    # setting a modality has no default for, and at most one sound, since
+    # all sounds play on the one speaker and would stop each other.
+    problems = []
+    specs = [_spec(s) for s in specs]
+    if len(specs) != 2:
+        problems.append(f"expected two modalities, got {len(specs)}")
+    positional = sounds = 0
+    for spec in specs:
+        kind = spec.get("kind")
+        cls = MODALITIES.get(kind)
+        if cls is None:
+            problems.append(f"unknown modality {kind!r}, use one of {list(MODALITIES)}")
+            continue
+        positional += cls.positional
+        sounds += issubclass(cls, Sound)
+        given = {k.replace("-", "_") for k in spec if k != "kind"}
+        parameters = signature(cls.__init__).parameters
+        for name, p in parameters.items():
+            if name not in _PROVIDED and p.default is p.empty and name not in given:
+                problems.append(f"{kind}: missing {name.replace('_', '-')}")
+        for name in sorted(given - set(parameters) - _PROVIDED):
+            problems.append(f"{kind}: unknown setting {name.replace('_', '-')}")
+    if positional != 1:
+        kinds = ", ".join(k for k, m in MODALITIES.items() if m.positional)
+        problems.append(f"expected one positional modality ({kinds}), got {positional}")
+    if sounds > 1:
+        problems.append(f"{sounds} sound modalities would share one speaker")
+    return problems
+
+
+def make_modality(spec: Union[str, dict], ino: Arduino, speaker: Any,
+                  duration: float) -> Modality:
+    # `spec` is a kind or a mapping such as {"kind": "tone", "frequency": 880.}
+    # taken from the experimental config; sounds default to `duration`.
+    spec = _spec(spec)
+    params = {k.replace("-", "_"): v for k, v in spec.items() if k != "kind"}
+    cls = MODALITIES[spec["kind"]]
+    if issubclass(cls, Light):
+        return cls(ino, **params)
+    params.setdefault("duration", duration)
+    return cls(speaker, **params)
@@ -0,0 +1,244 @@
+from math import exp
+from typing import Any, Iterable, NamedTuple, Optional
+from numpy import mean
+from numpy.random import Generator, default_rng
+from mulmodal.recorder import iter_events
+from mulmodal.util import clock
+from mulmodal.virtual import READER, RECORDER, SimAgent, VirtualArduino, \
+    VirtualEnvironment
+
+
+SUBJECT = "Subject"
+MARKERS = {"100", "200", "201"}
+SOUNDS = {"14", "15", "16"}
+
+
+def _is_stimulus(code: str, rewards: set[str]) -> bool:
+    # onsets; 0 to 2 are also START, NEND and ABEND
+    return code.isdigit() and 2 < int(code) < 100 and code not in rewards
+
+
+class Responder(object):
+    # A subject that sees what the task records and presses levers.
+    #
+    # Each attempt (100 or 200) it notes which modality comes first. From
+    # `latency` seconds after the `cue_onset`-th stimulus onset until the
+    # attempt ends, it responds at `cue_rate` on one lever chosen by `choose`;
+    # otherwise at `spontaneous_rate` on any lever. In the main task the
+    # light leading asks for the first response pin and the sound leading for
+    # the second, which is what `correct` assumes.
+    def __init__(self, response_pins: Iterable[Any] = (-9, -10),
+                 reward_pins: Iterable[Any] = (6, 7),
+                 spontaneous_rate: float = 0.05, cue_rate: float = 4.,
+                 latency: float = 0.4, cue_onset: int = 2):
+        self.response_pins = list(map(str, response_pins))
+        self.rewards = set(map(str, reward_pins))
+        self.spontaneous_rate = spontaneous_rate
+        self.cue_rate = cue_rate
+        self.latency = latency
+        self.cue_onset = cue_onset
+        self.rng: Generator = default_rng()
+        self._clear()
+
+    def _clear(self) -> None:
+        self.state: Optional[str] = None
+        self.onsets = 0
+        self.choice: Optional[str] = None
+        self.cue_from = float("inf")
+        self.next: Optional[tuple[float, str]] = None
+
+    def reset(self, rng: Generator) -> None:
+        self.rng = rng
+        self._clear()
+
+    def correct(self, state: Optional[str]) -> str:
+        return self.response_pins[0 if state == "light" else 1]
+
+    def choose(self, state: Optional[str]) -> str:
+        return self.response_pins[self.rng.integers(len(self.response_pins))]
+
+    def learn(self, state: Optional[str], choice: str, reward: float) -> None:
+        return None
+
+    def _end_attempt(self, reward: float) -> None:
+        if self.choice is not None:
+            self.learn(self.state, self.choice, reward)
+        self._clear()
+
+    def observe(self, t: float, code: str) -> None:
+        if code in ("100", "200"):
+            # a retry follows an attempt that went wrong
+            self._end_attempt(0.)
+        elif code == "201":
+            self._end_attempt(1.)
+        elif code in self.rewards:
+            # forced reward, or the end of a free trial
+            self._end_attempt(0.)
+        elif _is_stimulus(code, self.rewards):
+            self.onsets += 1
+            if self.onsets == 1:
+                self.state = "sound" if code in SOUNDS else "light"
+            if self.onsets == self.cue_onset:
+                self.choice = self.choose(self.state)
+                self.cue_from = t + self.rng.exponential(self.latency)
+                self.next = (self.cue_from, self.choice)
+
+    def next_response(self, t: float) -> tuple[float, str]:
+        # (time, lever) of the next response, drawn anew after each one
+        if self.next is None:
+            if t >= self.cue_from and self.choice is not None:
+                rate, pin = self.cue_rate, self.choice
+            else:
+                rate = self.spontaneous_rate
+                pin = self.response_pins[self.rng.integers(len(self.response_pins))]
+            due = t + self.rng.exponential(1. / rate) if rate > 0. else float("inf")
+            if t < self.cue_from <= due:
+                due, pin = self.cue_from, self.choice or pin
+            self.next = (due, pin)
+        return self.next
+
+    def responded(self, t: float) -> None:
+        self.next = None
+
+
+class PoissonSubject(Responder):
+    # responds at random, in and out of the cue alike
+    def __init__(self, rate: float = 0.5, **kwargs: Any):
+        super().__init__(spontaneous_rate=rate, cue_rate=rate, **kwargs)
+
+
+class LearningSubject(Responder):
+    # Rescorla-Wagner values per first modality and lever, softmax choice
+    def __init__(self, alpha: float = 0.1, beta: float = 5., **kwargs: Any):
+        super().__init__(**kwargs)
+        self.alpha = alpha
+        self.beta = beta
+        self.values: dict[Optional[str], dict[str, float]] = {}
+
+    def reset(self, rng: Generator) -> None:
+        super().reset(rng)
+        self.values = {}
+
+    def _values(self, state: Optional[str]) -> dict[str, float]:
+        return self.values.setdefault(state, {pin: 0.5 for pin in self.response_pins})
+
+    def choose(self, state: Optional[str]) -> str:
+        values = self._values(state)
+        weights = [exp(self.beta * v) for v in values.values()]
+        i = self.rng.choice(len(weights), p=[w / sum(weights) for w in weights])
+        return list(values)[i]
+
+    def learn(self, state: Optional[str], choice: str, reward: float) -> None:
+        values = self._values(state)
+        values[choice] += self.alpha * (reward - values[choice])
+
+
+class FittedSubject(Responder):
+    # picks the correct lever with a fixed probability per first modality
+    def __init__(self, accuracy: Optional[dict[str, float]] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.accuracy = accuracy or {}
+
+    def choose(self, state: Optional[str]) -> str:
+        correct = self.correct(state)
+        if self.rng.random() < self.accuracy.get(state or "", 0.5):
+            return correct
+        others = [pin for pin in self.response_pins if pin != correct]
+        return others[self.rng.integers(len(others))] if others else correct
+
+
+class Fit(NamedTuple):
+    spontaneous_rate: float
+    cue_rate: float
+    latency: float
+    accuracy: dict[str, float]
+
+
+def fit_sessions(paths: Iterable[str], response_pins: Iterable[Any] = (-9, -10),
+                 reward_pins: Iterable[Any] = (6, 7), cue_onset: int = 2) -> Fit:
+    # Response rates in and out of the cue, the latency of the first response
+    # to the cue and the accuracy of decided attempts per first modality,
+    # from recorded sessions of the main task.
+    responses = set(map(str, response_pins))
+    rewards = set(map(str, reward_pins))
+    latencies: list[float] = []
+    outcomes: dict[str, list[bool]] = {}
+    total = cue_time = cue_count = quiet_count = 0.
+    for path in paths:
+        attempt, state, onsets, cue, first = None, None, 0, None, False
+        start = end = None
+        for t, code in iter_events(path):
+            start = t if start is None else start
+            end = t
+            if code in MARKERS or code in rewards:
+                if cue is not None:
+                    cue_time += t - cue
+                # a decided attempt ends with 201 or the next retry
+                if attempt == "200" and code in ("200", "201") and state is not None:
+                    outcomes.setdefault(state, []).append(code == "201")
+                attempt = code if code in ("100", "200") else None
+                state, onsets, cue, first = None, 0, None, False
+            elif code in responses:
+                if cue is None:
+                    quiet_count += 1
+                    continue
+                cue_count += 1
+                if not first:
+                    first = True
+                    latencies.append(t - cue)
+            elif _is_stimulus(code, rewards):
+                onsets += 1
+                if onsets == 1:
+                    state = "sound" if code in SOUNDS else "light"
+                if onsets == cue_onset:
+                    cue = t
+        if start is not None and end is not None:
+            total += end - start
+    quiet_time = total - cue_time
+    return Fit(quiet_count / quiet_time if quiet_time > 0 else 0.,
+               cue_count / cue_time if cue_time > 0 else 0.,
+               float(mean(latencies)) if latencies else 0.4,
+               {k: float(mean(v)) for k, v in outcomes.items()})
+
+
+SUBJECTS = {
+    "poisson": PoissonSubject,
+    "learning": LearningSubject,
+    "fitted": FittedSubject,
+}
+
+
+def make_subject(spec: Optional[dict], response_pins: Iterable[Any] = (-9, -10),
+                 reward_pins: Iterable[Any] = (6, 7)) -> Responder:
+    # e.g. {"kind": "learning", "alpha": 0.1, "cue-rate": 4.}
+    spec = dict(spec or {"kind": "poisson"})
+    kind = spec.pop("kind")
+    kwargs = {k.replace("-", "_"): v for k, v in spec.items()}
+    return SUBJECTS[kind](response_pins=response_pins, reward_pins=reward_pins, **kwargs)
+
+
+async def _respond(agent: SimAgent, ino: VirtualArduino, subject: Responder) -> None:
+    while agent.working():
+        due, pin = subject.next_response(clock())
+        mail = await agent.try_recv(max(due - clock(), 0.) if due < float("inf") else 60.)
+        if mail is None:
+            if due <= clock() and agent.working():
+                ino.push(pin.encode())
+                subject.responded(clock())
+            continue
+        sender, message = mail
+        # the task's own events, not what the reader passes on
+        if sender != READER and isinstance(message, tuple):
+            subject.observe(clock(), str(message[1]))
+
+
+class SubjectEnvironment(VirtualEnvironment):
+    # a virtual session with a simulated subject in place of recorded responses
+    def __init__(self, task: Any, config: Any, subject: Responder):
+        super().__init__(task, config)
+        self.subject = subject
+        self.agent = SimAgent(SUBJECT, self.post)
+        self.post.watch(RECORDER, SUBJECT)
+
+    def coroutines(self) -> list:
+        return [*super().coroutines(), _respond(self.agent, self.ino, self.subject)]
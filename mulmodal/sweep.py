@@ -0,0 +1,146 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import product
+from os import devnull
+from typing import Any, Iterable, NamedTuple, Optional
+from numpy import mean, std
+from numpy.random import SeedSequence, default_rng
+from mulmodal.curves import trial_outcomes
+from mulmodal.params import task_params
+from mulmodal.subjects import SubjectEnvironment, make_subject
+from mulmodal.session import SessionConfig
+from mulmodal.virtual import set_seed
+
+
+class Outcome(NamedTuple):
+    duration: float
+    trials: int
+    free: int
+    rewards: int
+    decided: int
+    correct: int
+    first_try: int
+
+
+class Estimate(NamedTuple):
+    params: dict
+    sessions: int
+    duration: float
+    duration_sd: float
+    rewards: float
+    accuracy: float
+    first_try: float
+
+
+def grid(axes: dict[str, list]) -> list[dict]:
+    # every combination, e.g. {"number-of-retry": [1, 3], "postpone": [0., .5]}
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in product(*(axes[k] for k in keys))]
+
+
+def simulate(task: str, experimental: dict, subject: Optional[dict], seed: int) -> Outcome:
+    params = task_params(task, experimental)
+    reward_pins = getattr(params, "reward_pin", (6, 7))
+    responder = make_subject(subject, getattr(params, "response_pin", (-9, -10)), reward_pins)
+    # the task draws from numpy's global state, the subject from its own
+    set_seed(seed % 2 ** 32)
+    responder.reset(default_rng(seed))
+    config = SessionConfig({}, experimental, {}, {})
+    with open(devnull, "w") as f, redirect_stdout(f):
+        session = SubjectEnvironment(task, config, responder).run()
+    rewards = set(map(str, reward_pins))
+    events = [(t, str(code)) for t, code, *_ in session.records]
+    outcomes = trial_outcomes(events, reward_pins)
+    decided = [o for o in outcomes if not o.free]
+    return Outcome(session.duration, len(outcomes), len(outcomes) - len(decided),
+                   sum(code in rewards for _, code in events),
+                   sum(o.attempts - o.forced for o in decided),
+                   sum(o.correct for o in decided),
+                   sum(o.correct and o.attempts == 1 for o in decided))
+
+
+def _simulate(job: tuple[str, dict, Optional[dict], int]) -> Outcome:
+    return simulate(*job)
+
+
+def estimate(params: dict, outcomes: list[Outcome]) -> Estimate:
+    durations = [o.duration for o in outcomes]
+    decided = sum(o.decided for o in outcomes)
+    trials = sum(o.trials - o.free for o in outcomes)
+    return Estimate(params, len(outcomes), float(mean(durations)), float(std(durations)),
+                    float(mean([o.rewards for o in outcomes])),
+                    sum(o.correct for o in outcomes) / decided if decided else float("nan"),
+                    sum(o.first_try for o in outcomes) / trials if trials else float("nan"))
+
+
+def sweep(task: str, experimental: dict, points: Iterable[dict], subject: Optional[dict] = None,
+          sessions: int = 100, workers: Optional[int] = None, seed: int = 0) -> list[Estimate]:
+    # Runs `sessions` simulated sessions per parameter set, each with its own
+    # seed, spread over worker processes. Every set sees the same seeds.
+    points = list(points)
+    seeds = [int(s.generate_state(1)[0]) for s in SeedSequence(seed).spawn(sessions)]
+    jobs = [(task, {**experimental, **p}, subject, s) for p in points for s in seeds]
+    for p in points:
+        # fail on a bad key before starting any worker
+        task_params(task, {**experimental, **p})
+    with ProcessPoolExecutor(workers) as pool:
+        outcomes = list(pool.map(_simulate, jobs, chunksize=max(1, len(jobs) // 64)))
+    return [estimate(p, outcomes[i * sessions:(i + 1) * sessions]) for i, p in enumerate(points)]
+
+
+def print_estimates(estimates: list[Estimate]) -> None:
+    for e in estimates:
+        params = " ".join(f"{k}={v}" for k, v in e.params.items())
+        print(f"{params:<48} {e.duration / 60:7.1f} ± {e.duration_sd / 60:5.1f} min "
+              f"{e.rewards:7.1f} rewards {e.accuracy:6.3f} accuracy "
+              f"{e.first_try:6.3f} first-try")
+
+
+def parse_axes(values: list[str]) -> dict[str, list]:
+    # key=v1,v2,... with each value read as yaml
+    from yaml import safe_load
+
+    axes: dict[str, list] = {}
+    for value in values:
+        key, _, levels = value.partition("=")
+        axes[key] = [safe_load(v) for v in levels.split(",")]
+    return axes
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from time import perf_counter
+
+    from yaml import safe_load
+    from mulmodal.session import load_config
+    from mulmodal.subjects import fit_sessions
+
+    parser = ArgumentParser(description="Estimate session length, rewards and accuracy "
+                                        "with simulated subjects over a parameter grid.")
+    parser.add_argument("--task", "-t", default="main_task")
+    parser.add_argument("--yaml", "-y", required=True)
+    parser.add_argument("--param", "-p", action="append", default=[],
+                        help="key=v1,v2,... e.g. number-of-retry=1,3,5")
+    parser.add_argument("--subject", default="{kind: learning}",
+                        help="subject model (yaml), e.g. '{kind: poisson, rate: 0.5}'")
+    parser.add_argument("--fit", nargs="+", default=None,
+                        help="recorder files to fit a subject to, instead of --subject")
+    parser.add_argument("--sessions", "-n", type=int, default=100)
+    parser.add_argument("--workers", "-w", type=int, default=None)
+    parser.add_argument("--seed", "-s", type=int, default=0)
+    args = parser.parse_args()
+
+    experimental = load_config(args.yaml).experimental
+    subject: dict[str, Any] = safe_load(args.subject)
+    if args.fit is not None:
+        params = task_params(args.task, experimental)
+        fit = fit_sessions(args.fit, params.response_pin, params.reward_pin)
+        subject = {"kind": "fitted", **{k.replace("_", "-"): v for k, v in fit._asdict().items()}}
+        print(f"Fitted: {subject}")
+    points = grid(parse_axes(args.param))
+    s = perf_counter()
+    estimates = sweep(args.task, experimental, points, subject, args.sessions,
+                      args.workers, args.seed)
+    elapsed = perf_counter() - s
+    print_estimates(estimates)
+    print(f"{len(points) * args.sessions} sessions in {elapsed:.1f} s")
@@ -1,40 +1,112 @@
+from asyncio import get_running_loop
+from functools import lru_cache
 from time import perf_counter
 from typing import Any, Callable, Optional
 from amas.agent import Agent
+from numpy import ndarray
 from numpy.random import uniform
+from comprex.audio import Speaker, make_white_noise
 from comprex.util import timestamp
 from comprex.agent import RECORDER
 from pino.ino import Arduino, HIGH, LOW
+from mulmodal.scoring import Rule
+
+
+_speaker_factory: Callable[[int], Any] = Speaker
+_clock: Callable[[], float] = perf_counter
+# sleeps shorter than the threshold end with a busy-wait of up to the margin
+_precision: tuple[float, float] = (0.1, 0.002)
+
+
+# Sound buffers and speakers are reused across the sessions of a queue
+# (see `mulmodal.session`) instead of being rebuilt by every `control`.
+@lru_cache(maxsize=None)
+def cached_white_noise(duration: float) -> ndarray:
+    return make_white_noise(duration)
+
+
+@lru_cache(maxsize=None)
+def get_speaker(device: int) -> Speaker:
+    return _speaker_factory(device)
+
+
+def use_speaker(factory: Callable[[int], Any]) -> None:
+    global _speaker_factory
+    _speaker_factory = factory
+    get_speaker.cache_clear()
+
+
+# The window functions below measure elapsed time with `clock`, so that they
+# can be driven by a virtual clock (see `mulmodal.virtual`).
+def clock() -> float:
+    return _clock()
+
+
+def use_clock(f: Callable[[], float]) -> None:
+    global _clock
+    _clock = f
+
+
+def use_precision(threshold: float, margin: float = 0.002) -> tuple[float, float]:
+    # a threshold of 0 turns the busy-wait off; returns the previous setting,
+    # which a task restores when it ends so later sessions start from it
+    global _precision
+    previous, _precision = _precision, (threshold, margin)
+    return previous
+
+
+async def precise_sleep(agent: Agent, duration: float) -> None:
+    # A timer sleep wakes up late by up to the loop's timer granularity
+    # (epoll rounds up to whole milliseconds) plus the OS timer slack. Short
+    # phases sleep until `margin` before the deadline and spin the rest.
+    # The spin blocks the loop, so it is bounded by the margin and only used
+    # below the threshold. The virtual clock does not move while spinning.
+    threshold, margin = _precision
+    if duration >= threshold or duration <= 0. or getattr(get_running_loop(), "virtual", False):
+        await agent.sleep(duration)
+        return None
+    deadline = clock() + duration
+    if duration > margin:
+        await agent.sleep(duration - margin)
+    while clock() < deadline:
+        pass
+    return None
 
 
 async def flush_message_for(agent: Agent, duration: float):
     while duration >= 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         await agent.try_recv(duration)
-        e = perf_counter()
+        e = clock()
         duration -= e - s
 
 
 async def fixed_interval_with_postpone(agent: Agent, duration: float,
                                         target_response: Any, postpone: float = 0.):
+    over = False
     while duration >= 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         mail = await agent.try_recv(duration)
-        duration -= perf_counter() - s
+        duration -= clock() - s
         if mail is None:
+            # the interval is over, the next correct response ends the wait
+            over = True
             duration = 1e-3
             continue
         _, response = mail
+        if response == target_response and over:
+            break
         if response != target_response and duration < postpone:
+            over = False
             duration = postpone
 
 
 async def fixed_time_with_postpone(agent: Agent, duration: float,
                                     target_response: Any, postpone: float = 0.):
     while duration >= 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         mail = await agent.try_recv(duration)
-        duration -= perf_counter() - s
+        duration -= clock() - s
         if mail is None:
             break
         _, response = mail
@@ -46,9 +118,9 @@ async def fixed_interval_with_limit(agent: Agent, duration: float, target_respon
                                     postpone: float = 0., limit: float = 10.):
     _limit = limit
     while duration >= 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         mail = await agent.try_recv(duration)
-        required_time = perf_counter() - s
+        required_time = clock() - s
         duration -= required_time
         if limit < 0 and duration < 0:
             break
@@ -62,38 +134,56 @@ async def fixed_interval_with_limit(agent: Agent, duration: float, target_respon
             limit = _limit
 
 
-async def fixed_time_with_error(agent: Agent, duration: float, target_response: Any) -> bool:
+async def fixed_time_with_error(agent: Agent, duration: float, target_response: Any,
+                                rule: Optional[Rule] = None) -> bool:
+    # Without a rule the window is aborted on the first wrong response,
+    # otherwise every response in the window is scored by the rule.
+    if rule is not None:
+        rule.reset()
+    start = clock()
     while duration > 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         mail = await agent.try_recv(duration)
-        duration -= perf_counter() - s
+        duration -= clock() - s
         if mail is None:
             break
         _, response = mail
-        if response != target_response:
+        if rule is not None:
+            rule.feed(clock() - start, response == target_response)
+        elif response != target_response:
             return False
-    return True
+    return True if rule is None else rule.result()
 
 
-async def fixed_interval_with_error(agent: Agent, duration: float, target_response: Any) -> bool:
+async def fixed_interval_with_error(agent: Agent, duration: float, target_response: Any,
+                                    rule: Optional[Rule] = None) -> bool:
+    if rule is not None:
+        rule.reset()
+    start = clock()
     while duration >= 0. and agent.working():
-        s = perf_counter()
+        s = clock()
         mail = await agent.try_recv(duration)
-        duration -= perf_counter() - s
+        duration -= clock() - s
         if mail is None:
             duration = 1e-3
             continue
         _, response = mail
-        if response != target_response:
+        if rule is not None:
+            rule.feed(clock() - start, response == target_response)
+        elif response != target_response:
             return False
-    return True
+    return True if rule is None else rule.result()
 
 
 async def present_stimulus(agent: Agent, ino: Arduino, pin: int,
                            duration: float) -> None:
+    # tasks with a `StimulusRegistry` use its `pulse` instead
     ino.digital_write(pin, HIGH)
     agent.send_to(RECORDER, timestamp(pin))
-    await agent.sleep(duration)
-    ino.digital_write(pin, LOW)
-    agent.send_to(RECORDER, timestamp(-pin))
+    try:
+        await precise_sleep(agent, duration)
+    finally:
+        # also when the wait is aborted, so that no valve is left open
+        ino.digital_write(pin, LOW)
+        agent.send_to(RECORDER, timestamp(-pin))
     return None
@@ -0,0 +1,318 @@
+from asyncio import Queue, SelectorEventLoop, TimeoutError, all_tasks, gather, \
+    get_running_loop, sleep, wait_for
+from inspect import isawaitable
+from time import perf_counter
+from types import ModuleType
+from typing import Any, Callable, Coroutine, Iterable, NamedTuple, Optional, Union
+from amas.agent import NotWorkingError
+from comprex.agent import ABEND, NEND, OBSERVER, READER, RECORDER
+from comprex.audio import Speaker
+from numpy.random import seed as set_seed
+from mulmodal.events import Codes
+from mulmodal.session import CONTROLLER, SessionConfig, load_task
+from mulmodal.util import clock, use_clock, use_speaker
+
+
+class _VirtualSelector(object):
+    def __init__(self, selector: Any, loop: "VirtualEventLoop"):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout: Optional[float] = None) -> list:
+        # Nothing is scheduled: only a real event (e.g. an executor result)
+        # can wake the loop up, so block on the real selector.
+        if timeout is None:
+            return self._selector.select(None)
+        events = self._selector.select(0)
+        if not events:
+            self._loop.advance(timeout)
+        return events
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._selector, name)
+
+
+class VirtualEventLoop(SelectorEventLoop):
+    virtual = True
+
+    def __init__(self, start: float = 0.):
+        self._virtual_time = start
+        super().__init__()
+        self._selector = _VirtualSelector(self._selector, self)
+
+    def time(self) -> float:
+        return self._virtual_time
+
+    def advance(self, duration: float) -> None:
+        if duration > 0.:
+            self._virtual_time += duration
+
+
+class NullArduino(object):
+    def __init__(self):
+        self.edges: list[tuple[float, int, int]] = []
+
+    def digital_write(self, pin: int, state: int) -> None:
+        self.edges.append((clock(), pin, state))
+
+    def apply_pinmode_settings(self, settings: dict) -> None:
+        return None
+
+    def read_until_eol(self) -> Optional[bytes]:
+        return None
+
+    def cancel_read(self) -> None:
+        return None
+
+
+# Stand-in for the board. Lines pushed into it are returned by
+# `read_until_eol`, which times out like a `Comport` with `set_timeout`.
+class VirtualArduino(NullArduino):
+    def __init__(self, timeout: float = 1.0):
+        super().__init__()
+        self.timeout = timeout
+        self.lines: Queue = Queue()
+
+    def push(self, line: bytes) -> None:
+        self.lines.put_nowait(line)
+
+    def read_until_eol(self) -> Coroutine:
+        return self._read()
+
+    async def _read(self) -> Optional[bytes]:
+        try:
+            return await wait_for(self.lines.get(), self.timeout)
+        except TimeoutError:
+            return None
+
+
+class NullSpeaker(object):
+    def __init__(self, device: int = 0):
+        self.device = device
+        self.playing = False
+
+    def play(self, sound: Any, *args, **kwargs) -> None:
+        self.playing = True
+
+    def stop(self) -> None:
+        self.playing = False
+
+
+class Post(object):
+    def __init__(self):
+        self.agents: dict[str, "SimAgent"] = {}
+        self.watchers: dict[str, list[str]] = {}
+
+    def register(self, agent: "SimAgent") -> None:
+        self.agents[agent.addr] = agent
+
+    def watch(self, to: str, addr: str) -> None:
+        # mail to `to` is also delivered to `addr`
+        self.watchers.setdefault(to, []).append(addr)
+
+    def deliver(self, sender: str, to: str, message: Any) -> None:
+        for addr in [to, *self.watchers.get(to, ())]:
+            agent = self.agents.get(addr)
+            if agent is not None and agent.working():
+                agent.mailbox.put_nowait((sender, message))
+
+
+class SimAgent(object):
+    # Smallest time a receive can take. Without it, the window functions in
+    # `mulmodal.util`, which loop until `duration < 0`, would spin forever
+    # because a zero timeout never advances the virtual clock.
+    tick = 1e-6
+
+    def __init__(self, addr: str, post: Post):
+        self.addr = addr
+        self.post = post
+        self.mailbox: Queue = Queue()
+        self._working = True
+        post.register(self)
+
+    def working(self) -> bool:
+        return self._working
+
+    def finish(self) -> None:
+        if self._working:
+            self._working = False
+            # wake up a pending `recv`
+            self.mailbox.put_nowait(None)
+
+    def send_to(self, to: str, message: Any) -> None:
+        # Events sent to the recorder are re-stamped with the virtual clock
+        # because `comprex.util.timestamp` always reads the wall clock.
+        if to == RECORDER and isinstance(message, tuple) and len(message) == 2:
+            message = (clock(), message[1])
+        self.post.deliver(self.addr, to, message)
+
+    def send_all(self, message: Any) -> None:
+        for to in self.post.agents:
+            if to != self.addr:
+                self.send_to(to, message)
+
+    async def recv(self) -> tuple[str, Any]:
+        if not self._working:
+            raise NotWorkingError
+        return await self.mailbox.get()
+
+    async def try_recv(self, timeout: float) -> Optional[tuple[str, Any]]:
+        if not self._working:
+            raise NotWorkingError
+        try:
+            return await wait_for(self.mailbox.get(), max(timeout, self.tick))
+        except TimeoutError:
+            return None
+
+    async def sleep(self, duration: float) -> None:
+        if not self._working:
+            raise NotWorkingError
+        await sleep(max(duration, 0.))
+
+    async def call_async(self, f: Callable, *args, **kwargs) -> Any:
+        result = f(*args, **kwargs)
+        if isawaitable(result):
+            return await result
+        return result
+
+
+def run_virtually(main: Coroutine, start: float = 0.) -> Any:
+    loop = VirtualEventLoop(start)
+    use_clock(loop.time)
+    use_speaker(NullSpeaker)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        pending = all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(gather(*pending, return_exceptions=True))
+        loop.close()
+        use_clock(perf_counter)
+        use_speaker(Speaker)
+
+
+async def _observe(agent: SimAgent) -> None:
+    while agent.working():
+        mail = await agent.recv()
+        if mail is None:
+            break
+        _, message = mail
+        if message in (NEND, ABEND):
+            for a in agent.post.agents.values():
+                a.finish()
+
+
+async def _record(agent: SimAgent, rows: list[tuple[float, Any]]) -> None:
+    while agent.working():
+        mail = await agent.recv()
+        if mail is None:
+            break
+        _, message = mail
+        if isinstance(message, tuple):
+            rows.append(message)
+
+
+async def _read(agent: SimAgent, ino: VirtualArduino) -> None:
+    # same as `comprex.agent.Reader`, for tasks without their own `read`
+    codes = Codes()
+    try:
+        while agent.working():
+            input_ = await agent.call_async(ino.read_until_eol)
+            if input_ is None:
+                continue
+            agent.send_to(RECORDER, (clock(), codes.parse(input_)))
+    except NotWorkingError:
+        ino.cancel_read()
+
+
+async def _feed(agent: SimAgent, ino: VirtualArduino,
+                inputs: Iterable[tuple[float, bytes]]) -> None:
+    loop = get_running_loop()
+    for t, line in inputs:
+        await sleep(t - loop.time())
+        if not agent.working():
+            break
+        ino.push(line)
+
+
+class VirtualSession(NamedTuple):
+    records: list[tuple[float, Any]]
+    edges: list[tuple[float, int, int]]
+    duration: float
+
+
+class VirtualEnvironment(object):
+    def __init__(self, task: Union[str, ModuleType], config: SessionConfig,
+                 inputs: Iterable[tuple[float, bytes]] = ()):
+        self.task = load_task(task) if isinstance(task, str) else task
+        self.config = config
+        self.inputs = inputs
+        self.post = Post()
+        self.ino = VirtualArduino()
+        self.rows: list[tuple[float, Any]] = []
+        self.controller = SimAgent(CONTROLLER, self.post)
+        self.reader = SimAgent(READER, self.post)
+        self.recorder = SimAgent(RECORDER, self.post)
+        self.observer = SimAgent(OBSERVER, self.post)
+
+    def coroutines(self) -> list[Coroutine]:
+        expvars = self.config.experimental
+        read = getattr(self.task, "read", None)
+        reader = _read(self.reader, self.ino) if read is None \
+            else read(self.reader, self.ino, expvars)
+        return [self.task.control(self.controller, self.ino, expvars),
+                reader,
+                _record(self.recorder, self.rows),
+                _observe(self.observer),
+                _feed(self.reader, self.ino, self.inputs)]
+
+    async def _run(self) -> None:
+        await gather(*self.coroutines())
+
+    def run(self) -> VirtualSession:
+        run_virtually(self._run())
+        rows = self.rows
+        duration = rows[-1][0] - rows[0][0] if rows else 0.
+        return VirtualSession(rows, self.ino.edges, duration)
+
+
+def run_task_virtually(task: Union[str, ModuleType], config: SessionConfig,
+                       inputs: Iterable[tuple[float, bytes]] = (),
+                       seed: Optional[int] = None) -> VirtualSession:
+    if seed is not None:
+        set_seed(seed)
+    return VirtualEnvironment(task, config, inputs).run()
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from contextlib import redirect_stdout
+    from os import devnull
+    from mulmodal.recorder import read_events, write_events
+    from mulmodal.session import load_config
+
+    parser = ArgumentParser(description="Run a task on a virtual clock with stand-in hardware.")
+    parser.add_argument("--task", "-t", default="main_task")
+    parser.add_argument("--yaml", "-y", required=True)
+    parser.add_argument("--responses", "-r", default=None,
+                        help="recorder file whose events are fed to the reader")
+    parser.add_argument("--output", "-o", default=None)
+    parser.add_argument("--seed", "-s", type=int, default=None)
+    args = parser.parse_args()
+
+    config = load_config(args.yaml)
+    inputs = []
+    if args.responses is not None:
+        events = read_events(args.responses)
+        origin = events[0][0] if events else 0.
+        inputs = [(t - origin, e.encode()) for t, e in events]
+
+    s = perf_counter()
+    with open(devnull, "w") as f, redirect_stdout(f):
+        session = run_task_virtually(args.task, config, inputs, args.seed)
+    print(f"Simulated {session.duration:.1f} s with {len(session.records)} events "
+          f"in {perf_counter() - s:.2f} s")
+    if args.output is not None:
+        write_events(args.output, session.records)
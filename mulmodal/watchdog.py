@@ -0,0 +1,252 @@
+import gc
+from asyncio import AbstractEventLoop, get_running_loop
+from threading import Event, Thread
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import ABEND, OBSERVER, RECORDER, _self_terminate
+from pino.ino import LOW, Arduino
+from mulmodal.util import clock
+
+
+WATCHDOG = "Watchdog"
+LOOP = "event loop"
+
+
+class Progress(object):
+    # When a watched loop last got somewhere and how long it may take to get
+    # somewhere next: a wait for up to `timeout` allows that long, a wait for
+    # mail with no end allows any time. Written on the event loop, read by
+    # the watchdog's thread; `state` is replaced as a whole.
+    def __init__(self, name: str):
+        self.name = name
+        self.state = (clock(), 0.)
+        self.beats = 0
+        self.lag = 0.
+        self.max_lag = 0.
+
+    def beat(self, allowed: float = 0.) -> None:
+        self.state = (clock(), allowed)
+        self.beats += 1
+
+    def late(self, lag: float) -> None:
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def silent(self, now: float) -> float:
+        # how far past what it was allowed
+        last, allowed = self.state
+        return now - last - allowed
+
+
+class MonitoredAgent(object):
+    # Proxy for the agent a `control` or `read` runs with. Every turn of its
+    # loop (`working`) and every wait is a beat, so a loop that stops coming
+    # back, e.g. stuck in a `call_async` on a read that never returns, goes
+    # silent even though the agent and its event loop are alive.
+    def __init__(self, agent: Agent, progress: Progress):
+        self._agent = agent
+        self.progress = progress
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._agent, name)
+
+    def working(self) -> bool:
+        self.progress.beat()
+        return self._agent.working()
+
+    async def recv(self) -> Any:
+        self.progress.beat(float("inf"))
+        try:
+            return await self._agent.recv()
+        finally:
+            self.progress.beat()
+
+    async def try_recv(self, timeout: float) -> Any:
+        self.progress.beat(max(timeout, 0.))
+        try:
+            return await self._agent.try_recv(timeout)
+        finally:
+            self.progress.beat()
+
+    async def sleep(self, duration: float) -> None:
+        self.progress.beat(max(duration, 0.))
+        try:
+            await self._agent.sleep(duration)
+        finally:
+            self.progress.beat()
+
+    async def call_async(self, f: Callable, *args: Any) -> Any:
+        self.progress.beat()
+        try:
+            return await self._agent.call_async(f, *args)
+        finally:
+            self.progress.beat()
+
+
+def monitored(task: Callable[..., Awaitable], progress: Progress) -> Callable[..., Awaitable]:
+    # e.g. agent.assign_task(monitored(task.control, progress), ino=ino, ...)
+    async def run(agent: Agent, **kwargs: Any) -> Any:
+        try:
+            return await task(MonitoredAgent(agent, progress), **kwargs)
+        finally:
+            # a loop that has ended is not silent
+            progress.beat(float("inf"))
+    return run
+
+
+def output_pins(pinmode: dict) -> list[int]:
+    return [int(pin) for pin, mode in pinmode.items() if mode == "OUTPUT"]
+
+
+def switch_off(ino: Arduino, pins: Iterable[int], speakers: Iterable[Any] = ()) -> None:
+    for pin in pins:
+        try:
+            ino.digital_write(pin, LOW)
+        except Exception as e:
+            print(f"Could not switch off pin {pin}: {e}")
+    for speaker in speakers:
+        try:
+            speaker.stop()
+        except Exception as e:
+            print(f"Could not stop speaker: {e}")
+
+
+def problems(watched: Iterable[Progress], now: float, silence: float,
+             max_lag: float) -> list[str]:
+    found = []
+    for progress in watched:
+        over = progress.silent(now)
+        if over > silence:
+            found.append(f"{progress.name} silent for {over:.3f} s")
+        elif progress.lag > max_lag:
+            found.append(f"{progress.name} lag {progress.lag * 1e3:.1f} ms")
+    return found
+
+
+def print_health(watched: Iterable[Progress], now: float) -> None:
+    for progress in watched:
+        last, _ = progress.state
+        print(f"    {progress.name}: {progress.beats} beats, last {now - last:.3f} s ago, "
+              f"lag {progress.lag * 1e3:.1f} ms (max {progress.max_lag * 1e3:.1f} ms)")
+
+
+class Watchdog(object):
+    # Checks the watched loops from its own thread, so that it still runs
+    # when the event loop is blocked. On a problem the outputs are switched
+    # off and the ABEND sent on the event loop, which is the only thread
+    # writing to the port. Only when the loop does not get to it within
+    # `fallback` seconds does this thread switch them off itself.
+    def __init__(self, ino: Arduino, watched: Iterable[Progress], pins: Iterable[int] = (),
+                 speakers: Iterable[Any] = (), silence: float = 5., max_lag: float = 0.25,
+                 interval: float = 0.05, grace: float = 5., fallback: float = 1.):
+        self.ino = ino
+        self.watched = list(watched)
+        self.pins = list(pins)
+        self.speakers = list(speakers)
+        self.silence = silence
+        self.max_lag = max_lag
+        self.interval = interval
+        self.grace = grace
+        self.fallback = fallback
+        self.fired = False
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self, loop: AbstractEventLoop, abort: Callable[[float], None]) -> "Watchdog":
+        self._thread = Thread(target=self._check, args=(loop, abort), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _check(self, loop: AbstractEventLoop, abort: Callable[[float], None]) -> None:
+        start = clock()
+        while not self._stop.wait(self.interval):
+            now = clock()
+            if now - start < self.grace:
+                continue
+            found = problems(self.watched, now, self.silence, self.max_lag)
+            if not found:
+                continue
+            self.fired = True
+            print(f"Watchdog abort: {'; '.join(found)}")
+            print_health(self.watched, now)
+            done = Event()
+
+            def shutdown() -> None:
+                switch_off(self.ino, self.pins, self.speakers)
+                done.set()
+                abort(now)
+
+            try:
+                loop.call_soon_threadsafe(shutdown)
+            except RuntimeError:
+                # the loop is closed, so nothing else writes to the port
+                switch_off(self.ino, self.pins, self.speakers)
+                break
+            if not done.wait(self.fallback):
+                print("Watchdog: the event loop is blocked, switching off from the watchdog")
+                switch_off(self.ino, self.pins, self.speakers)
+            break
+
+
+async def watch(agent: Agent, ino: Arduino, watched: Iterable[Progress],
+                pins: Iterable[int] = (), speakers: Iterable[Any] = (),
+                silence: float = 5., max_lag: float = 0.25,
+                interval: float = 0.05, grace: float = 5., probe: float = 0.1,
+                fallback: float = 1.) -> None:
+    # Aborts the session when a watched loop stays silent for `silence`
+    # seconds past what its waits allowed, or the event loop lags by more
+    # than `max_lag`. This task only probes the event loop: its beats stop
+    # when the loop is blocked, which the watchdog's thread sees. Time spent
+    # in garbage collection, e.g. a task's own collection in the ISI (see
+    # `mulmodal.realtime`), is not lag.
+    loop_progress = Progress(LOOP)
+    dog = Watchdog(ino, [*watched, loop_progress], pins, speakers, silence, max_lag,
+                   interval, grace, fallback)
+    collecting = 0.
+    collected = 0.
+
+    def on_collect(phase: str, info: dict) -> None:
+        nonlocal collecting, collected
+        if phase == "start":
+            collecting = clock()
+        else:
+            collected += clock() - collecting
+
+    def abort(now: float) -> None:
+        agent.send_to(RECORDER, (now, ABEND))
+        agent.send_to(OBSERVER, ABEND)
+
+    gc.callbacks.append(on_collect)
+    dog.start(get_running_loop(), abort)
+    try:
+        while agent.working() and not dog.fired:
+            s, c = clock(), collected
+            loop_progress.beat(probe)
+            await agent.sleep(probe)
+            loop_progress.late(max(clock() - s - probe - (collected - c), 0.))
+            loop_progress.beat()
+    except NotWorkingError:
+        pass
+    finally:
+        dog.stop()
+        gc.callbacks.remove(on_collect)
+
+
+def watchdog_agent(ino: Arduino, watched: Iterable[Progress], pinmode: dict,
+                   speakers: Iterable[Any] = (), settings: Optional[dict] = None) -> Agent:
+    settings = settings or {}
+    return Agent(WATCHDOG) \
+        .assign_task(watch, ino=ino, watched=list(watched), pins=output_pins(pinmode),
+                     speakers=list(speakers),
+                     silence=settings.get("silence", 5.),
+                     max_lag=settings.get("max-lag", 0.25),
+                     interval=settings.get("interval", 0.05),
+                     grace=settings.get("grace", 5.),
+                     probe=settings.get("heartbeat-interval", 0.1),
+                     fallback=settings.get("fallback", 1.)) \
+        .assign_task(_self_terminate)
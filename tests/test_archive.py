@@ -0,0 +1,79 @@
+import pytest
+from mulmodal.archive import Archive, ArchiveWriter, convert
+
+
+def session(ntrials: int, t0: float = 0.) -> list[tuple[float, str]]:
+    # every trial: two attempts, a correct decision and the reward
+    events = [(t0, "0")]
+    for i in range(ntrials):
+        t = t0 + 10. * i + 1.
+        events += [(t, "200"), (t + 0.5, "-9"), (t + 1., "200"), (t + 1.2, "-10"),
+                   (t + 1.5, "201"), (t + 1.6, "6"), (t + 1.65, "-6"), (t + 5., "-9")]
+    return events + [(t0 + 10. * ntrials, "1")]
+
+
+def codes(archive: Archive, session: str) -> list[tuple[float, str]]:
+    times, ids = archive.events(session)
+    return [(round(float(t), 6), archive.codes[i]) for t, i in zip(times, ids)]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "a.mma")
+    events = session(40)
+    with ArchiveWriter(path, trials_per_block=16) as writer:
+        index = writer.add_session("s", events)
+    assert index.trials == 40
+    assert len(index.blocks) == 3
+    with Archive(path) as archive:
+        assert codes(archive, "s") == events
+
+
+def test_retries_belong_to_their_trial(tmp_path):
+    path = str(tmp_path / "a.mma")
+    events = session(40)
+    with ArchiveWriter(path, trials_per_block=16) as writer:
+        writer.add_session("s", events)
+    with Archive(path) as archive:
+        assert archive.trial("s", -1) == events[:1]
+        # trial 17 is in the second block, ISI response included
+        assert archive.trial("s", 17) == events[1 + 17 * 8:1 + 18 * 8]
+        assert archive.trial("s", 40) == []
+
+
+def test_append_keeps_earlier_sessions(tmp_path):
+    path = str(tmp_path / "a.mma")
+    with ArchiveWriter(path) as writer:
+        writer.add_session("first", session(5))
+    with ArchiveWriter(path) as writer:
+        writer.add_session("second", session(7, 100.))
+    with Archive(path) as archive:
+        assert [s.name for s in archive.sessions] == ["first", "second"]
+        assert codes(archive, "first") == session(5)
+        assert codes(archive, "second") == session(7, 100.)
+
+
+def test_failed_append_leaves_the_archive(tmp_path):
+    path = str(tmp_path / "a.mma")
+    with ArchiveWriter(path) as writer:
+        writer.add_session("first", session(5))
+    before = open(path, "rb").read()
+    with pytest.raises(RuntimeError):
+        with ArchiveWriter(path) as writer:
+            writer.add_session("second", session(7))
+            raise RuntimeError
+    assert open(path, "rb").read() == before
+    assert not (tmp_path / "a.mma.tmp").exists()
+    # a writer that never closes, as after a crash
+    writer = ArchiveWriter(path)
+    writer.add_session("second", session(7))
+    writer.f.flush()
+    assert open(path, "rb").read() == before
+    writer.discard()
+
+
+def test_convert(tmp_path):
+    data = tmp_path / "subject-a.csv"
+    data.write_text("".join(f"{t}, {c}\n" for t, c in session(3)))
+    sessions = convert([str(data)], str(tmp_path / "a.mma"))
+    assert sessions[0].name == "subject-a"
+    assert sessions[0].trials == 3
@@ -0,0 +1,107 @@
+import asyncio
+from amas.agent import Agent, NotWorkingError
+from comprex.agent import RECORDER
+from mulmodal.bus import Bus, BusAgent, read_to_bus, response_ranges
+
+
+class Outbox(object):
+    def __init__(self):
+        self.sent: list[tuple[str, object]] = []
+
+    def __call__(self, to: str, message: object) -> None:
+        self.sent.append((to, message))
+
+
+def bus() -> Bus:
+    return Bus() \
+        .subscribe(RECORDER) \
+        .subscribe("Controller", response_ranges(["6", "7"]), code_only=True) \
+        .subscribe("Camera", [(4, 8), (14, 16)])
+
+
+def test_routes_by_code_range():
+    b, send = bus(), Outbox()
+    response, light, noise, end = (1., "6"), (2., "5"), (3., "14"), (4., "1")
+    for event in (response, light, noise, end):
+        b.publish("Reader", event, send)
+    assert send.sent == [
+        (RECORDER, response), ("Controller", "6"), ("Camera", response),
+        (RECORDER, light), ("Camera", light),
+        (RECORDER, noise), ("Camera", noise),
+        (RECORDER, end),
+    ]
+    # every subscriber gets the same event object
+    assert send.sent[0][1] is send.sent[2][1]
+
+
+def test_sender_does_not_get_its_own_events():
+    send = Outbox()
+    bus().publish("Camera", (1., "5"), send)
+    assert send.sent == [(RECORDER, (1., "5"))]
+
+
+def test_codes_that_are_not_numbers_go_to_every_code_subscribers_only():
+    send = Outbox()
+    bus().publish("Reader", (1., "start"), send)
+    assert send.sent == [(RECORDER, (1., "start"))]
+
+
+def test_routes_follow_subscriptions():
+    b = bus()
+    assert b.route("5") == ((RECORDER, False), ("Camera", False))
+    b.unsubscribe("Camera")
+    assert b.route("5") == ((RECORDER, False),)
+    b.subscribe("Camera", [(5, 5)], code_only=True)
+    assert b.route("5") == ((RECORDER, False), ("Camera", True))
+
+
+def test_bus_agent_publishes_recorder_events(monkeypatch):
+    send = Outbox()
+    monkeypatch.setattr(Agent, "send_to", lambda self, to, message: send(to, message),
+                        raising=False)
+    agent = BusAgent("Reader", bus())
+    agent.send_to(RECORDER, (1., "7"))
+    agent.send_to("Controller", "stop")
+    assert send.sent == [(RECORDER, (1., "7")), ("Controller", "7"), ("Camera", (1., "7")),
+                         ("Controller", "stop")]
+    # without a bus it sends as a plain agent
+    BusAgent("Reader").send_to(RECORDER, (2., "7"))
+    assert send.sent[-1] == (RECORDER, (2., "7"))
+
+
+class Board(object):
+    def __init__(self, lines: list[bytes]):
+        self.lines = lines
+        self.cancelled = False
+
+    def read_until_eol(self):
+        return self.lines.pop(0) if self.lines else None
+
+    def cancel_read(self) -> None:
+        self.cancelled = True
+
+
+class ReaderAgent(object):
+    def __init__(self):
+        self.sent: list[tuple[str, tuple]] = []
+
+    def working(self) -> bool:
+        return True
+
+    def send_to(self, to: str, message: tuple) -> None:
+        self.sent.append((to, message))
+
+    async def call_async(self, f, *args):
+        result = f(*args)
+        if result is None and not args:
+            raise NotWorkingError
+        return result
+
+
+def test_read_to_bus():
+    agent, board = ReaderAgent(), Board([b"6\r\n", b"7\r\n", b"6\r\n"])
+    asyncio.run(read_to_bus(agent, board))
+    codes = [event[1] for _, event in agent.sent]
+    assert codes == ["6", "7", "6"]
+    assert codes[0] is codes[2]
+    assert board.cancelled
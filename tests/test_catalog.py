@@ -0,0 +1,47 @@
+from comprex.agent import ABEND, NEND, START
+from mulmodal.catalog import Catalog, summarize
+
+
+def session(end: int, reward: int = 2) -> list[tuple[float, str]]:
+    # a free trial, a trial decided on its second attempt, then the end
+    codes = [str(START), "100", str(reward), f"-{reward}",
+             "200", "-9", "200", "-10", "201", str(reward), f"-{reward}", str(end)]
+    return [(float(t), code) for t, code in enumerate(codes)]
+
+
+def test_reward_pin_sharing_the_abend_code_is_not_an_abort():
+    summary = summarize(session(NEND), reward_pins=(2, 3))
+    assert not summary.aborted
+    assert summary.trials == 2
+    assert summary.free_trials == 1
+    assert summary.correct == 1
+    assert summary.responses == 2
+    assert summary.duration == 11.
+
+
+def test_abend_ends_an_aborted_session():
+    assert summarize(session(ABEND), reward_pins=(2, 3)).aborted
+    # a reward switched off after the abort
+    events = session(ABEND) + [(12., "-2")]
+    assert summarize(events, reward_pins=(2, 3)).aborted
+
+
+def test_retries_are_not_trials():
+    events = [(0., "200"), (1., "200"), (2., "200"), (3., "6")]
+    summary = summarize(events)
+    assert summary.trials == 1
+    assert summary.correct == 0
+
+
+def test_catalog_add_and_find(tmp_path):
+    data = tmp_path / "subject-a-cond.csv"
+    data.write_text("".join(f"{t}, {code}\n" for t, code in session(NEND)))
+    experimental = {"reward-pin": [2, 3], "response-pin": [-9, -10]}
+    with Catalog(str(tmp_path / "catalog.sqlite")) as catalog:
+        catalog.add(str(data), "mulmodal.main_task", {"subject": "a"}, experimental)
+        catalog.add(str(tmp_path / "subject-a-cond.csv"), "main_task", {"subject": "a"},
+                    experimental, aborted=True)
+        rows = catalog.find("main_task", "a", {"reward-pin": [2., 3.]})
+    assert len(rows) == 1
+    assert rows[0]["trials"] == 2
+    assert rows[0]["aborted"] == 1
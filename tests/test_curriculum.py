@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from amas.agent import NotWorkingError
+from comprex.agent import ABEND, NEND, OBSERVER, RECORDER, START
+from comprex.util import timestamp
+from mulmodal.curriculum import Accuracy, Curriculum, Rewards, Step, StepAgent, load_steps, \
+    make_criterion
+from mulmodal.curves import TrialOutcome
+from mulmodal.params import ConfigError
+
+
+class FakeAgent(object):
+    def __init__(self):
+        self.sent: list[tuple[str, object]] = []
+        self.finished = False
+
+    def working(self) -> bool:
+        return not self.finished
+
+    def finish(self) -> None:
+        self.finished = True
+
+    def send_to(self, to: str, message: object) -> None:
+        self.sent.append((to, message))
+
+    async def try_recv(self, timeout: float) -> None:
+        return None
+
+    async def sleep(self, duration: float) -> None:
+        return None
+
+
+def rewarding_task(rewards: int, runs: list[int]) -> SimpleNamespace:
+    # a training step that delivers `rewards` rewards on pin 2 per run
+    async def control(agent, ino, expvars) -> None:
+        runs.append(1)
+        try:
+            agent.send_to(RECORDER, timestamp(START))
+            for _ in range(rewards):
+                agent.send_to(RECORDER, (0., 2))
+                await agent.sleep(0.)
+                agent.send_to(RECORDER, (0., -2))
+                await agent.sleep(0.)
+            agent.send_to(OBSERVER, NEND)
+            agent.send_to(RECORDER, timestamp(NEND))
+            agent.finish()
+        except NotWorkingError:
+            agent.send_to(OBSERVER, ABEND)
+            agent.send_to(RECORDER, timestamp(ABEND))
+            agent.finish()
+
+    return SimpleNamespace(control=control)
+
+
+def step(task: SimpleNamespace, criterion: dict, on_exhaust: str = "repeat",
+         max_repeats: int = 10) -> Step:
+    return Step(task, "step", SimpleNamespace(experimental={}), criterion, (2, 3), (-9, -10),
+                on_exhaust, max_repeats)
+
+
+def test_criterion_carries_over_repeats():
+    runs: list[int] = []
+    curriculum = Curriculum([step(rewarding_task(3, runs), {"kind": "rewards", "count": 7}),
+                             step(rewarding_task(1, []), None, "stop")])
+    agent = FakeAgent()
+    asyncio.run(curriculum.control(agent, None))
+    # 3 + 3 + 1 of the third run
+    assert len(runs) == 3
+    assert [passed for *_, passed in curriculum.log] == [False, False, True, False]
+    assert (OBSERVER, NEND) in agent.sent
+
+
+def test_repeats_are_capped():
+    runs: list[int] = []
+    curriculum = Curriculum([step(rewarding_task(1, runs), {"kind": "rewards", "count": 100},
+                                  max_repeats=2)])
+    asyncio.run(curriculum.control(FakeAgent(), None))
+    assert len(runs) == 3
+
+
+def test_start_and_end_are_recorded_once():
+    agent = FakeAgent()
+    curriculum = Curriculum([step(rewarding_task(1, []), None, "next"),
+                             step(rewarding_task(1, []), None, "next")])
+    asyncio.run(curriculum.control(agent, None))
+    codes = [str(m[1]) for to, m in agent.sent if to == RECORDER]
+    # START, step 0, reward on and off, step 1, reward on and off, NEND
+    assert codes == ["0", "300", "2", "-2", "301", "2", "-2", "1"]
+    assert (OBSERVER, ABEND) not in agent.sent
+
+
+def test_accuracy_counts_errors_of_retries():
+    criterion = Accuracy(min=0.5, window=4)
+    criterion.trial(TrialOutcome(False, 3, True, False))
+    assert list(criterion.outcomes) == [0, 0, 1]
+    criterion.trial(TrialOutcome(True, 0, False, False))
+    assert not criterion.met()
+    criterion.trial(TrialOutcome(False, 1, True, False))
+    assert criterion.met()
+    first_try = make_criterion({"kind": "first-try", "window": 2})
+    first_try.trial(TrialOutcome(False, 2, True, False))
+    first_try.trial(TrialOutcome(False, 1, True, False))
+    assert list(first_try.outcomes) == [0, 1]
+
+
+def test_step_agent_ends_after_the_reward_that_passes():
+    agent = FakeAgent()
+    proxy = StepAgent(agent, 0, Rewards(1), (2, 3))
+    proxy.send_to(RECORDER, (0., 2))
+    assert proxy.passed and not proxy.done
+    proxy.send_to(RECORDER, (0., -2))
+    assert proxy.done and proxy.working()
+
+
+def test_load_steps_checks_criteria():
+    with pytest.raises(ConfigError, match="unknown criterion"):
+        load_steps([{"task": "main_task", "config": "x.yaml", "criterion": {"kind": "acc"}}])
+    with pytest.raises(ConfigError, match="marks attempts"):
+        load_steps([{"task": "3rd_step_of_training", "config": "x.yaml",
+                     "criterion": {"kind": "accuracy"}}])
+    with pytest.raises(ConfigError, match="max-repeats"):
+        load_steps([{"task": "main_task", "config": "x.yaml", "max-repeats": -1}])
+    # passes the check with the package prefix, then looks for its config
+    with pytest.raises(FileNotFoundError):
+        load_steps([{"task": "mulmodal.main_task", "config": "missing.yaml",
+                     "criterion": {"kind": "accuracy"}}])
@@ -0,0 +1,71 @@
+from math import isnan
+import pytest
+from mulmodal.curves import LearningCurves, TrialOutcome, trial_numbers, trial_outcomes
+
+
+# a free trial, a trial correct on the second attempt, one correct on the
+# first and one rewarded after its last retry without a decision
+CODES = ["0", "100", "6", "-6",
+         "200", "-9", "200", "201", "7", "-7",
+         "200", "201", "6", "-6", "-9",
+         "200", "200", "200", "7", "-7", "1"]
+
+
+def events(codes: list[str]) -> list[tuple[float, str]]:
+    return [(float(t), code) for t, code in enumerate(codes)]
+
+
+def test_outcomes():
+    assert trial_outcomes(events(CODES)) == [
+        TrialOutcome(True, 0, False, False),
+        TrialOutcome(False, 2, True, False),
+        TrialOutcome(False, 1, True, False),
+        TrialOutcome(False, 3, False, True),
+    ]
+
+
+def test_trial_numbers():
+    # the ISI belongs to the trial before it
+    assert list(trial_numbers(CODES)) == [-1, 0, 0, 0, 1, 1, 1, 1, 1, 1,
+                                          2, 2, 2, 2, 2, 3, 3, 3, 3, 3, 3]
+
+
+def test_fold(tmp_path):
+    curves = LearningCurves(str(tmp_path), alpha=0.5, block=4)
+    outcomes = trial_outcomes(events(CODES))
+    point = curves.fold("a", "mulmodal.main_task", "s1.csv", outcomes, 1.)
+    # attempts: 2 + 1 + 3, decided: all but the forced trial's last, 2 correct
+    assert (point.trials, point.free, point.attempts) == (4, 1, 6)
+    assert (point.decided, point.correct, point.first_try, point.forced) == (5, 2, 1, 1)
+    assert point.ewma == pytest.approx(0.4)
+    # decided attempts 0 1 1 0 0: one block of four and one left open
+    assert point.blocks == [0.5]
+    assert point.open_block == [1, 0]
+    second = curves.fold("a", "main_task", "s2.csv", outcomes, 2.)
+    # the carried attempt completes a block with the first three
+    assert second.blocks == [0.5]
+    assert second.open_block == [2, 0]
+    assert (second.total_decided, second.total_correct) == (10, 4)
+    assert second.ewma == pytest.approx(0.4)
+    assert curves.last("a", "main_task") == second
+    curve = curves.curve("a", "main_task")
+    assert list(curve["cumulative"]) == pytest.approx([0.4, 0.4])
+    assert list(curve["blocks"]) == [0.5, 0.5]
+
+
+def test_ewma_is_seeded_by_the_first_decided_session(tmp_path):
+    curves = LearningCurves(str(tmp_path), alpha=0.5)
+    free = trial_outcomes(events(["100", "6", "-6"]))
+    assert isnan(curves.fold("a", "main_task", "s1.csv", free).ewma)
+    decided = trial_outcomes(events(["200", "201", "6"]))
+    assert curves.fold("a", "main_task", "s2.csv", decided).ewma == 1.
+    assert curves.fold("a", "main_task", "s3.csv", free).ewma == 1.
+
+
+def test_empty_store(tmp_path):
+    curves = LearningCurves(str(tmp_path))
+    assert curves.last("a", "main_task") is None
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "main_task.jsonl").write_text("")
+    assert curves.last("a", "main_task") is None
+    assert curves.tasks("a") == ["main_task"]
@@ -0,0 +1,112 @@
+import asyncio
+from time import perf_counter
+import pytest
+from comprex.agent import RECORDER
+from numpy.random import default_rng
+from mulmodal.multiple import Component, MultipleSchedule, alternating_components
+from mulmodal.stimulus import Light, StimulusRegistry
+from mulmodal.util import use_clock
+
+
+class Board(object):
+    def __init__(self):
+        self.writes: list[tuple[int, int]] = []
+
+    def digital_write(self, pin: int, value: int) -> None:
+        self.writes.append((pin, value))
+
+
+class ScriptedAgent(object):
+    # a virtual clock that moves only when the agent waits, by at least a
+    # tick as in `mulmodal.virtual`; responses arrive at the given times
+    tick = 1e-6
+
+    def __init__(self, responses: list[tuple[float, int]] = []):
+        self.now = 0.
+        self.responses = list(responses)
+        self.recorded: list[tuple[float, int]] = []
+
+    def working(self) -> bool:
+        return True
+
+    def send_to(self, to: str, message: tuple[float, int]) -> None:
+        if to == RECORDER:
+            self.recorded.append(message)
+
+    async def try_recv(self, timeout: float):
+        timeout = max(timeout, self.tick)
+        if self.responses and self.responses[0][0] <= self.now + timeout:
+            self.now, response = self.responses.pop(0)
+            return "reader", response
+        self.now += timeout
+        return None
+
+    async def sleep(self, duration: float) -> None:
+        self.now += duration
+
+
+@pytest.fixture
+def agent():
+    agent = ScriptedAgent()
+    use_clock(lambda: agent.now)
+    yield agent
+    use_clock(perf_counter)
+
+
+def schedule(agent: ScriptedAgent, schedules: list[str], stimuli=None,
+             **kwargs) -> MultipleSchedule:
+    board = Board()
+    stimuli = stimuli if stimuli is not None else [[] for _ in schedules]
+    return MultipleSchedule(agent, board, StimulusRegistry(agent), schedules, stimuli,
+                            targets=[6, 7][:len(schedules)], reward_pins=[2, 3][:len(schedules)],
+                            mean_interval=5., range_interval=0., reward_duration=0.1,
+                            **kwargs)
+
+
+def reward_onsets(agent: ScriptedAgent, pin: int) -> list[float]:
+    return [round(t, 3) for t, code in agent.recorded if code == pin]
+
+
+def test_components_sum_to_the_rewards():
+    components = list(alternating_components(3, 4, 2, 50, default_rng(0)))
+    assert sum(c.length for c in components) == 50
+    assert [c.kind for c in components] == [i % 3 for i in range(len(components))]
+    assert all(2 <= c.length <= 6 for c in components[:-1])
+    assert list(alternating_components(2, 10, 0, 15)) == [Component(0, 11), Component(1, 4)]
+
+
+def test_unknown_schedule(agent):
+    with pytest.raises(ValueError, match="Unknown schedule RI"):
+        schedule(agent, ["FI", "RI"])
+
+
+def test_fixed_time_ignores_responses(agent):
+    agent.responses = [(1., 6), (4.95, 7)]
+    asyncio.run(schedule(agent, ["FT"]).component(0, 2))
+    assert reward_onsets(agent, 2) == [5., 10.1]
+
+
+def test_fixed_time_postpones_after_a_wrong_response(agent):
+    agent.responses = [(4.5, 7)]
+    asyncio.run(schedule(agent, ["FT"], postpone=2.).component(0, 1))
+    assert reward_onsets(agent, 2) == [6.5]
+
+
+def test_fixed_interval_waits_for_the_target(agent):
+    agent.responses = [(1., 6), (6., 7), (8., 6)]
+    asyncio.run(schedule(agent, ["FI"]).component(0, 1))
+    assert reward_onsets(agent, 2) == [8.]
+
+
+def test_stimuli_cycle_per_kind(agent):
+    board = Board()
+    lights = [[Light(board, 10), Light(board, 11)], []]
+    multiple = schedule(agent, ["FT", "FT"], lights, gap=1.)
+    asyncio.run(multiple.run(iter([Component(0, 1), Component(1, 1), Component(0, 1)])))
+    # the mixed component has no stimulus, only its own reward valve
+    codes = [code for _, code in agent.recorded]
+    assert codes == [10, 2, -2, -10, 3, -3, 11, 2, -2, -11]
+    assert multiple.rewards == 3
+    assert multiple.occurrences == [2, 0]
+    # the gap is waited between components only
+    assert reward_onsets(agent, 2) == [5., 17.2]
@@ -0,0 +1,91 @@
+from os.path import dirname, join
+import pytest
+from mulmodal.params import ConfigError, MainTaskParams, cached_task_params, \
+    compile_params, task_params
+from mulmodal.session import load_config
+
+
+CONFIG_DIR = join(dirname(dirname(__file__)), "mulmodal", "config")
+SAMPLES = [
+    ("sample.yaml", "pavlovian_sound"),
+    ("sample.yaml", "pavlovian_single_light"),
+    ("sample.yaml", "pavlovian_multi_light"),
+    ("1st-training-sample.yaml", "1st_step_of_training"),
+    ("2nd-training-sample.yaml", "2nd_step_of_training"),
+    ("3rd-training-sample.yaml", "3rd_step_of_training"),
+    ("3rd-training-sample.yaml", "witherr.3rd_step_of_training"),
+    ("4th-training-sample.yaml", "4th_step_of_training"),
+    ("4th-training-sample.yaml", "witherr.4th_step_of_training"),
+    ("main-task-training-sample.yaml", "_main_task_training"),
+    ("main-task-sample.yaml", "main_task"),
+]
+
+
+@pytest.mark.parametrize("config, task", SAMPLES)
+def test_sample_configs_compile(config, task):
+    task_params(task, load_config(join(CONFIG_DIR, config)).experimental)
+
+
+def test_defaults_and_derived_values():
+    params = task_params("mulmodal.main_task", {"number-of-trial": 100,
+                                                "upper-second-duration": 2.})
+    assert params.light_pin == (8, 9, 10, 11, 12)
+    assert params.response_pins == ("-9", "-10")
+    assert params.delta == pytest.approx(0.02)
+    # the task's own defaults
+    assert task_params("pavlovian_multi_light", {}).number_of_trial == 120
+
+
+def test_params_are_frozen():
+    params = task_params("main_task", {})
+    with pytest.raises(AttributeError):
+        params.number_of_trial = 1
+
+
+def test_typos_are_rejected_with_a_hint():
+    with pytest.raises(ConfigError, match="did you mean number-of-trial"):
+        task_params("main_task", {"number-of-trials": 10})
+
+
+def test_keys_of_other_tasks_are_rejected():
+    for key in ("postpone", "light-duration", "mean-component-length"):
+        with pytest.raises(ConfigError, match=key):
+            task_params("main_task", {key: 1.})
+
+
+def test_shared_keys_are_ignored_by_the_tasks_sharing_them():
+    assert task_params("pavlovian_sound", {"light-pin": [4]}).speaker == 6
+    with pytest.raises(ConfigError):
+        task_params("pavlovian_sound", {"postpone": 1.})
+
+
+def test_types_are_checked():
+    with pytest.raises(ConfigError, match="expected an integer"):
+        task_params("main_task", {"number-of-trial": 1.5})
+    with pytest.raises(ConfigError, match="expected a string"):
+        task_params("main_task", {"decision-rule": 1})
+    assert task_params("main_task", {"light-pin": 4}).light_pin == (4, )
+
+
+def test_unknown_rules_are_rejected():
+    with pytest.raises(ConfigError, match="did you mean majority"):
+        task_params("main_task", {"decision-rule": "majorty"})
+    with pytest.raises(ConfigError, match="response-rule"):
+        task_params("witherr.3rd_step_of_training", {"response-rule": "first"})
+    assert task_params("witherr.3rd_step_of_training", {}).response_rule is None
+
+
+def test_deprecated_alias():
+    params = compile_params(MainTaskParams, {"propotion-of-free-trial": 0.5})
+    assert params.proportion_of_free_trial == 0.5
+
+
+def test_cached_params(tmp_path, monkeypatch):
+    import mulmodal.params as params
+
+    monkeypatch.setattr(params, "CACHE_DIR", str(tmp_path))
+    first = cached_task_params("main_task", {"number-of-trial": 10})
+    assert len(list(tmp_path.iterdir())) == 1
+    assert cached_task_params("main_task", {"number-of-trial": 10}) == first
+    cached_task_params("main_task", {"number-of-trial": 20})
+    assert len(list(tmp_path.iterdir())) == 2
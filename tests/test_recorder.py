@@ -0,0 +1,56 @@
+import tracemalloc
+from mulmodal.bench.soak_recorder import _soak
+from mulmodal.recorder import RotatingWriter, iter_events, session_parts
+from mulmodal.virtual import run_virtually
+
+
+def test_chunks_are_written_when_full(tmp_path):
+    filename = str(tmp_path / "s.csv")
+    writer = RotatingWriter(filename, chunk_size=10)
+    for i in range(9):
+        writer.write(float(i), -9)
+    assert list(iter_events(filename)) == []
+    writer.write(9., -10)
+    assert len(list(iter_events(filename))) == 10
+    writer.write(10., 4)
+    writer.close()
+    assert list(iter_events(filename))[-1] == (10., "4")
+
+
+def test_rows_with_extra_columns(tmp_path):
+    filename = str(tmp_path / "s.csv")
+    writer = RotatingWriter(filename, chunk_size=2)
+    writer.write(0., -9)
+    writer.write(1., -9, 1000, 0.5)
+    writer.close()
+    with open(filename) as f:
+        assert f.read().splitlines()[1:] == ["0.0, -9", "1.0, -9, 1000, 0.5"]
+
+
+def test_rotation_keeps_every_event_in_order(tmp_path):
+    filename = str(tmp_path / "s.csv")
+    writer = RotatingWriter(filename, chunk_size=16, max_bytes=1024)
+    for i in range(1000):
+        writer.write(i * 0.001, -9 if i % 2 else -10)
+    writer.close()
+    assert len(session_parts(filename)) > 10
+    events = list(iter_events(filename))
+    assert len(events) == 1000
+    assert [t for t, _ in events] == sorted(t for t, _ in events)
+
+
+def test_soak_memory_stays_flat(tmp_path):
+    # 1 h on the virtual clock at 5 events/s with a file every 256 KiB;
+    # `python -m mulmodal.bench.soak_recorder` runs the full 12 h
+    samples: list[tuple[float, int]] = []
+    tracemalloc.start()
+    try:
+        run_virtually(_soak(str(tmp_path / "soak.csv"), 1., 5., samples, 2 ** 18,
+                            lambda: tracemalloc.get_traced_memory()[0]))
+    finally:
+        tracemalloc.stop()
+    assert len(session_parts(str(tmp_path / "soak.csv"))) > 1
+    # after the first 20 minutes of warm-up
+    settled = [m for t, m in samples if t >= 1200.]
+    assert len(settled) >= 4
+    assert max(settled) - settled[0] < 256 * 2 ** 10
@@ -0,0 +1,60 @@
+from collections import Counter
+from numpy.random import default_rng
+from mulmodal.schedule import cached_schedule, counterbalanced, generate_schedules, \
+    load_schedules, run_violations
+
+
+def longest_run(values: list) -> int:
+    longest = run = 1
+    for a, b in zip(values, values[1:]):
+        run = run + 1 if a == b else 1
+        longest = max(longest, run)
+    return longest
+
+
+def test_blocks_cross_the_factors_jointly():
+    schedule = counterbalanced(([4, 5, 6], (0, 1)), 24, rng=default_rng(0))
+    for start in range(0, 24, 6):
+        assert len(set(schedule[start:start + 6])) == 6
+
+
+def test_last_block_takes_distinct_cells():
+    schedule = counterbalanced(([4, 5, 6], (0, 1)), 20, rng=default_rng(0))
+    assert len(schedule) == 20
+    assert len(set(schedule[18:])) == 2
+    assert max(Counter(schedule).values()) == 4
+
+
+def test_run_length_limit():
+    schedules = generate_schedules([5, 2], 150, 20, 3, default_rng(1))
+    assert not run_violations(schedules, 3).any()
+    for row in schedules:
+        for factor in range(2):
+            assert longest_run(list(row[:, factor])) <= 3
+
+
+def test_single_level_factor_is_not_limited():
+    # e.g. main_task with a single light pin
+    schedule = counterbalanced(([8], (0, 1)), 20, 3, default_rng(0))
+    lights, orders = zip(*schedule)
+    assert set(lights) == {8}
+    assert longest_run(list(orders)) <= 3
+    schedules = generate_schedules([1, 1], 10, 2, 3, default_rng(0))
+    assert (schedules == 0).all()
+
+
+def test_cached_schedules_are_reproducible(tmp_path):
+    a = load_schedules(str(tmp_path / "a.npy"), [5, 2], 30, 10, 3, seed=7)
+    b = load_schedules(str(tmp_path / "b.npy"), [5, 2], 30, 10, 3, seed=7)
+    assert (a == b).all()
+    # loaded, not generated again
+    assert (load_schedules(str(tmp_path / "a.npy"), [5, 2], 30, 10, 3, seed=8) == a).all()
+
+
+def test_cached_schedule_picks_a_valid_row(tmp_path, monkeypatch):
+    import mulmodal.schedule as schedule
+
+    monkeypatch.setattr(schedule, "CACHE_DIR", str(tmp_path))
+    trials = cached_schedule(([4, 5], (0, 1)), 12, 5, 3, seed=1)
+    assert len(trials) == 12
+    assert Counter(trials) == Counter({t: 3 for t in set(trials)})
@@ -0,0 +1,68 @@
+import pytest
+from numpy import array, cumsum, sort
+from numpy.random import default_rng
+from mulmodal.scoring import RULES, HoldDuration, LatencyWeighted, Majority, RateDifference, \
+    assign_windows, make_rule, score_session
+
+
+def session(seed: int, nwindows: int = 200, duration: float = 0.5):
+    # windows 2 s apart, responses on two sides at random times in and
+    # between them, with some bursts that make holds
+    rng = default_rng(seed)
+    starts = cumsum(rng.uniform(1., 3., nwindows))
+    times = sort(rng.uniform(0., starts[-1] + 2., nwindows * 6))
+    bursts = starts[rng.random(nwindows) < 0.3]
+    times = sort(array([*times, *(bursts + 0.05), *(bursts + 0.1), *(bursts + 0.15)]))
+    responses = rng.choice([-9, -10], len(times))
+    correct = rng.choice([-9, -10], nwindows)
+    return times, responses, starts, correct
+
+
+def online(rule, times, responses, starts, correct):
+    # as main_task feeds the rule while each window is open
+    scores = []
+    for start, target in zip(starts, correct):
+        rule.reset()
+        for t, response in zip(times, responses):
+            if start <= t <= start + rule.duration:
+                rule.feed(t - start, response == target)
+        scores.append(rule.result())
+    return scores
+
+
+@pytest.mark.parametrize("name", list(RULES))
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_online_and_batch_agree(name, seed):
+    rule = make_rule(name, 0.5)
+    times, responses, starts, correct = session(seed)
+    batch = score_session(rule, times, responses, starts, correct)
+    assert list(batch) == online(rule, times, responses, starts, correct)
+
+
+@pytest.mark.parametrize("rule", [RateDifference(0.5, 4.), LatencyWeighted(0.5, 0.05),
+                                  HoldDuration(0.5, 0.06, 0.05)])
+def test_online_and_batch_agree_with_settings(rule):
+    times, responses, starts, correct = session(3)
+    batch = score_session(rule, times, responses, starts, correct)
+    assert list(batch) == online(rule, times, responses, starts, correct)
+
+
+def test_windows():
+    latency, correct, window = assign_windows([0.5, 1.2, 1.6, 3.1], [-9, -9, -10, -10],
+                                              [1., 3.], 0.5, [-9, -10])
+    assert list(window) == [0, 1]
+    assert list(correct) == [True, True]
+    assert latency == pytest.approx([0.2, 0.1])
+
+
+def test_majority_ties_are_errors():
+    rule = Majority()
+    rule.feed(0.1, True)
+    rule.feed(0.2, False)
+    assert not rule.result()
+
+
+def test_make_rule():
+    assert isinstance(make_rule(None), Majority)
+    rule = make_rule({"name": "latency-weighted", "tau": 0.1}, 1.)
+    assert (rule.tau, rule.duration) == (0.1, 1.)
@@ -0,0 +1,53 @@
+import asyncio
+from os import close, openpty, write
+from mulmodal.serialproc import EventRing, SerialProcess
+
+
+class Port(object):
+    # stands in for the board: the slave side of a pty
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def fileno(self) -> int:
+        return self.fd
+
+
+def test_ring_drops_when_full_and_rejects_overlong_lines():
+    ring = EventRing(2, max_line=16)
+    try:
+        assert ring.put(1., b"-9,4294967295")
+        assert not ring.put(2., b"x" * 17)
+        assert ring.put(3., b"4")
+        assert not ring.put(4., b"5")
+        assert (ring.dropped, ring.overlong) == (1, 1)
+        assert ring.drain() == [(1., "-9,4294967295"), (3., "4")]
+        assert ring.drain() == []
+    finally:
+        ring.close()
+
+
+def test_lines_come_through_the_spawned_reader():
+    master, slave = openpty()
+
+    async def main() -> list[str]:
+        serial = SerialProcess(Port(slave), capacity=64, max_line=8).start()
+        try:
+            # the child takes a while to start; lines wait in the pty
+            write(master, b"-9\r\n" + b"y" * 20 + b"\r\n4\r\n")
+            write(master, b"z" * 10)
+            write(master, b"zz\r\n-10\r\n")
+            lines: list[str] = []
+            for _ in range(100):
+                lines += [line for _, line in await serial.get(0.1)]
+                if len(lines) >= 3:
+                    break
+            assert serial.ring.overlong == 2
+            return lines
+        finally:
+            serial.stop()
+
+    try:
+        assert asyncio.run(main()) == ["-9", "4", "-10"]
+    finally:
+        close(master)
+        close(slave)
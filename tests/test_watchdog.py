@@ -0,0 +1,60 @@
+import asyncio
+from threading import current_thread
+from time import sleep
+from mulmodal.util import clock
+from mulmodal.watchdog import Progress, Watchdog, problems
+
+
+class Board(object):
+    def __init__(self):
+        self.writes: list[tuple[int, int, str]] = []
+
+    def digital_write(self, pin: int, value: int) -> None:
+        self.writes.append((pin, value, current_thread().name))
+
+
+def test_problems():
+    progress = Progress("Controller")
+    progress.beat(1.)
+    assert problems([progress], clock() + 0.5, 1., 0.25) == []
+    assert problems([progress], clock() + 2.5, 1., 0.25)
+    progress.beat(float("inf"))
+    assert problems([progress], clock() + 100., 1., 0.25) == []
+    progress.late(0.3)
+    assert problems([progress], clock(), 1., 0.25) == ["Controller lag 300.0 ms"]
+
+
+def run_until_fired(block: float) -> tuple[Board, list[float], str]:
+    board = Board()
+    aborts: list[float] = []
+    progress = Progress("Controller")
+
+    async def main() -> str:
+        dog = Watchdog(board, [progress], [4, 5], silence=0.05, interval=0.01,
+                       grace=0., fallback=0.1)
+        dog.start(asyncio.get_running_loop(), aborts.append)
+        if block:
+            # the loop is stuck, e.g. in a blocking read
+            sleep(block)
+        for _ in range(100):
+            if aborts:
+                break
+            await asyncio.sleep(0.01)
+        dog.stop()
+        return current_thread().name
+
+    return board, aborts, asyncio.run(main())
+
+
+def test_outputs_are_switched_off_on_the_loop():
+    board, aborts, loop_thread = run_until_fired(0.)
+    assert len(aborts) == 1
+    assert [(pin, value) for pin, value, _ in board.writes] == [(4, 0), (5, 0)]
+    assert {thread for _, _, thread in board.writes} == {loop_thread}
+
+
+def test_blocked_loop_is_switched_off_from_the_watchdog():
+    board, aborts, loop_thread = run_until_fired(0.5)
+    writes_from = [thread for _, _, thread in board.writes]
+    assert writes_from[0] != loop_thread
+    assert len(aborts) == 1